@@ -23,7 +23,15 @@ from functools import wraps
 from core.aiotube_client import get_aiotube_client
 from core.download_manager import DownloadManager, DownloadItem, DownloadType, DownloadStatus
 from core.stems_extractor import StemsExtractor, ExtractionItem, ExtractionStatus
-from core.config import get_setting, update_setting, get_ffmpeg_path, get_ffprobe_path, download_ffmpeg, ensure_ffmpeg_available, ensure_valid_downloads_directory
+from core.extraction_scheduler import get_extraction_scheduler, check_priority
+from core.download_scheduler import get_download_scheduler
+from core.download_batch import BatchManager, DownloadBatch
+from core.separation_pool import get_separation_pool, shutdown_separation_pool
+from core.job_journal import JobJournal, compact_journal, claim_recovery
+from core.partial_stems import stream_partial_wav
+from core.pcm_cache import get_cached_pcm
+from core.zip_stream import stream_zip
+from core.config import STEM_MODELS, get_setting, update_setting, get_ffmpeg_path, get_ffprobe_path, download_ffmpeg, ensure_ffmpeg_available, ensure_valid_downloads_directory
 from core.auth_db import init_db, authenticate_user, get_user_by_id, get_user_by_username, create_user, update_user, change_password, delete_user, get_all_users
 from core.auth_models import User
 
@@ -109,34 +117,58 @@ def api_login_required(f):
 
 # Note: CSRF protection is disabled for this application since it has session-based authentication
 
+def get_session_owner(session_id):
+    """Return the fairness key for a session: the user for logged-in sessions."""
+    if session_id.startswith('user_'):
+        return session_id.split('_', 2)[1]
+    return session_id
+
+def owner_room(owner):
+    """Socket.IO room of every connection of a user, for jobs resumed without a session."""
+    return f"owner_{owner}"
+
 # Create a session manager to handle per-user instances
 class SessionManager:
     def __init__(self):
         self.download_managers = {}
         self.stems_extractors = {}
+        self.batch_managers = {}
         
-    def get_download_manager(self, session_id):
+    def get_download_manager(self, session_id, owner=None):
         """Get or create a download manager for a specific session"""
         if session_id not in self.download_managers:
             print(f"Creating new download manager for session {session_id}")
-            dm = DownloadManager()
+            # Jobs live in process-wide registries, indexed by user
+            dm = DownloadManager(owner=owner or get_session_owner(session_id))
             dm.on_download_progress = lambda download_id, progress, speed, eta: on_download_progress(session_id, download_id, progress, speed, eta)
             dm.on_download_complete = lambda download_id, title, file_path: on_download_complete(session_id, download_id, title, file_path)
             dm.on_download_error = lambda download_id, error_message: on_download_error(session_id, download_id, error_message)
             self.download_managers[session_id] = dm
         return self.download_managers[session_id]
     
-    def get_stems_extractor(self, session_id):
+    def get_stems_extractor(self, session_id, owner=None):
         """Get or create a stems extractor for a specific session"""
         if session_id not in self.stems_extractors:
             print(f"Creating new stems extractor for session {session_id}")
-            se = StemsExtractor()
-            se.on_extraction_progress = lambda extraction_id, progress, status_message: on_extraction_progress(session_id, extraction_id, progress, status_message)
+            # All extractors share the process-wide scheduler; the owner key
+            # gives each user a fair share of the extraction slots
+            se = StemsExtractor(owner=owner or get_session_owner(session_id))
+            se.on_extraction_progress = lambda extraction_id, progress, status_message, details: on_extraction_progress(session_id, extraction_id, progress, status_message, details)
             se.on_extraction_complete = lambda extraction_id: on_extraction_complete(session_id, extraction_id)
             se.on_extraction_error = lambda extraction_id, error_message: on_extraction_error(session_id, extraction_id, error_message)
+            se.on_extraction_partial = lambda extraction_id, available_seconds, stems: on_extraction_partial(session_id, extraction_id, available_seconds, stems)
             self.stems_extractors[session_id] = se
         return self.stems_extractors[session_id]
     
+    def get_batch_manager(self, session_id, owner=None):
+        """Get or create the download batch manager of a session"""
+        if session_id not in self.batch_managers:
+            print(f"Creating new batch manager for session {session_id}")
+            bm = BatchManager(self.get_download_manager(session_id, owner), self.get_stems_extractor(session_id, owner))
+            bm.on_batch_progress = lambda batch_id, progress: on_batch_progress(session_id, batch_id, progress)
+            self.batch_managers[session_id] = bm
+        return self.batch_managers[session_id]
+    
     def cleanup_session(self, session_id):
         """Clean up resources for a session when it ends"""
         if session_id in self.download_managers:
@@ -148,6 +180,10 @@ class SessionManager:
             print(f"Cleaning up stems extractor for session {session_id}")
             # No specific cleanup needed right now, but could be added here
             del self.stems_extractors[session_id]
+        
+        if session_id in self.batch_managers:
+            print(f"Cleaning up batch manager for session {session_id}")
+            del self.batch_managers[session_id]
 
 # Create the session manager
 session_manager = SessionManager()
@@ -173,6 +209,49 @@ def get_session_id():
     
     return session['session_id']
 
+def default_extraction_priority():
+    """Priority class of extractions queued without an explicit one."""
+    return 'admin' if current_user.is_admin else 'interactive'
+
+def in_downloads_directory(path):
+    """Whether a path points inside the downloads directory, symlinks resolved."""
+    downloads_dir = os.path.realpath(ensure_valid_downloads_directory())
+    try:
+        return os.path.commonpath([downloads_dir, os.path.realpath(path)]) == downloads_dir
+    except ValueError:
+        # Different drives on Windows
+        return False
+
+def recover_unfinished_jobs():
+    """Queue again the downloads and extractions the last run left unfinished.
+
+    The sessions they were started from are gone, so they run under managers
+    reporting to their owner's room, which every connection of the user joins.
+    """
+    if not get_setting('job_journal', True):
+        return
+    
+    downloads = JobJournal('downloads').unfinished()
+    extractions = JobJournal('extractions').unfinished()
+    compact_journal()
+    
+    for job in downloads:
+        try:
+            room = owner_room(job['owner'])
+            session_manager.get_download_manager(room, job['owner']).resume_download(job['payload'])
+        except Exception as e:
+            print(f"Error resuming download {job['job_id']}: {e}")
+    
+    for job in extractions:
+        try:
+            room = owner_room(job['owner'])
+            session_manager.get_stems_extractor(room, job['owner']).resume_extraction(job['payload'])
+        except Exception as e:
+            print(f"Error resuming extraction {job['job_id']}: {e}")
+    
+    if downloads or extractions:
+        print(f"Resumed {len(downloads)} download(s) and {len(extractions)} extraction(s) from the job journal")
+
 # Setup callbacks for real-time updates
 def on_download_progress(session_id, download_id, progress, speed, eta):
     """Callback for download progress updates."""
@@ -210,6 +289,7 @@ def on_download_complete(session_id, download_id, title, file_path):
         
         # Émettre l'événement avec les données dans la room spécifique à la session
         socketio.emit('download_complete', data, room=session_id)
+        notify_batch_download(session_id, download_id)
     except Exception as e:
         print(f"Error in on_download_complete: {e}")
 
@@ -226,17 +306,27 @@ def on_download_error(session_id, download_id, error_message):
         
         # Émettre l'événement avec les données dans la room spécifique à la session
         socketio.emit('download_error', data, room=session_id)
+        notify_batch_download(session_id, download_id)
     except Exception as e:
         print(f"Error in on_download_error: {e}")
 
-def on_extraction_progress(session_id, extraction_id, progress, status_message):
-    """Callback for extraction progress updates."""
+def on_extraction_progress(session_id, extraction_id, progress, status_message, details=None):
+    """Callback for extraction progress updates.
+    
+    Already rate-limited by the extractor (progress_emit_hz setting).
+    """
     try:
         # Préparer les données à envoyer
+        details = details or {}
         data = {
             'extraction_id': extraction_id,
             'progress': progress,
-            'status_message': status_message
+            'status_message': status_message,
+            'phase': details.get('phase'),
+            'segment': details.get('segment'),
+            'segments': details.get('segments'),
+            'predicted_seconds': details.get('predicted_seconds'),
+            'remaining_seconds': details.get('remaining_seconds')
         }
         
         # Émettre l'événement avec les données dans la room spécifique à la session
@@ -244,6 +334,21 @@ def on_extraction_progress(session_id, extraction_id, progress, status_message):
     except Exception as e:
         print(f"Error in on_extraction_progress: {e}")
 
+def on_extraction_partial(session_id, extraction_id, available_seconds, stems):
+    """Callback for stems becoming playable before the extraction completes."""
+    try:
+        # Préparer les données à envoyer
+        data = {
+            'extraction_id': extraction_id,
+            'available_until': round(available_seconds, 2),
+            'stems': stems
+        }
+        
+        # Émettre l'événement avec les données dans la room spécifique à la session
+        socketio.emit('extraction_partial', data, room=session_id)
+    except Exception as e:
+        print(f"Error in on_extraction_partial: {e}")
+
 def on_extraction_complete(session_id, extraction_id):
     """Callback for extraction completion."""
     try:
@@ -253,12 +358,12 @@ def on_extraction_complete(session_id, extraction_id):
             # Préparer les données à envoyer
             data = {
                 'extraction_id': extraction_id,
-                'output_paths': item.output_paths,
-                'zip_path': item.zip_path
+                'output_paths': item.output_paths
             }
             
             # Émettre l'événement avec les données dans la room spécifique à la session
             socketio.emit('extraction_complete', data, room=session_id)
+        notify_batch_extraction(session_id, extraction_id)
     except Exception as e:
         print(f"Error in on_extraction_complete: {e}")
 
@@ -273,9 +378,29 @@ def on_extraction_error(session_id, extraction_id, error_message):
         
         # Émettre l'événement avec les données dans la room spécifique à la session
         socketio.emit('extraction_error', data, room=session_id)
+        notify_batch_extraction(session_id, extraction_id)
     except Exception as e:
         print(f"Error in on_extraction_error: {e}")
 
+def on_batch_progress(session_id, batch_id, progress):
+    """Callback for download batch progress (a download or extraction of it moved on)."""
+    try:
+        socketio.emit('batch_progress', progress, room=session_id)
+    except Exception as e:
+        print(f"Error in on_batch_progress: {e}")
+
+def notify_batch_download(session_id, download_id):
+    """Tell the session's batches that one of their downloads is over."""
+    batch_manager = session_manager.batch_managers.get(session_id)
+    if batch_manager:
+        batch_manager.download_finished(download_id)
+
+def notify_batch_extraction(session_id, extraction_id):
+    """Tell the session's batches that one of their extractions is over."""
+    batch_manager = session_manager.batch_managers.get(session_id)
+    if batch_manager:
+        batch_manager.extraction_finished(extraction_id)
+
 # Routes
 @app.route('/')
 @login_required
@@ -666,6 +791,115 @@ def add_download():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/downloads/batch', methods=['POST'])
+@api_login_required
+def add_download_batch():
+    """Queue a playlist or a list of videos as one batch.
+    
+    JSON body: playlist_url, or video_ids (IDs, or objects with video_id,
+    title and thumbnail_url); download_type and quality as for a single
+    download; optionally extract (model_name, selected_stems, two_stem_mode,
+    primary_stem, output_format, priority) to separate each finished
+    download, and extraction_window, how many of the batch's extractions
+    may be queued or running at once.
+    """
+    try:
+        data = request.json
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        if not data.get('playlist_url') and not data.get('video_ids'):
+            return jsonify({'error': 'playlist_url or video_ids is required'}), 400
+        
+        session_id = get_session_id()
+        batch_manager = session_manager.get_batch_manager(session_id)
+        
+        videos = [{'video_id': video} if isinstance(video, str) else video for video in data.get('video_ids') or []]
+        if any(not video.get('video_id') for video in videos):
+            return jsonify({'error': 'Every video needs a video_id'}), 400
+        
+        extraction = None
+        if data.get('extract'):
+            extract = data['extract']
+            if 'model_name' not in extract or 'selected_stems' not in extract:
+                return jsonify({'error': 'extract needs model_name and selected_stems'}), 400
+            # Batch extractions yield to the ones users wait for
+            try:
+                priority = check_priority(extract.get('priority') or 'background')
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if priority == 'admin' and not current_user.is_admin:
+                return jsonify({'error': 'Admin priority requires an administrator account'}), 403
+            extraction = {
+                'model_name': extract['model_name'],
+                'selected_stems': extract['selected_stems'],
+                'two_stem_mode': extract.get('two_stem_mode', False),
+                'primary_stem': extract.get('primary_stem', 'vocals'),
+                'output_format': extract.get('output_format', ''),
+                'priority': priority
+            }
+        
+        download_type = DownloadType.VIDEO if str(data.get('download_type', 'audio')).lower() == 'video' else DownloadType.AUDIO
+        batch = DownloadBatch(
+            download_type=download_type,
+            quality=data.get('quality', 'best'),
+            playlist_url=data.get('playlist_url', ''),
+            videos=videos,
+            extraction=extraction,
+            extraction_window=int(data.get('extraction_window') or 0),
+            title=data.get('title', '')
+        )
+        batch_id = batch_manager.add_batch(batch)
+        
+        return jsonify({'batch_id': batch_id})
+    except Exception as e:
+        print(f"Error adding download batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/downloads/batch', methods=['GET'])
+@api_login_required
+def get_download_batches():
+    """Get the progress of every download batch of the current session."""
+    try:
+        session_id = get_session_id()
+        batch_manager = session_manager.get_batch_manager(session_id)
+        
+        return jsonify([batch_manager.get_progress(batch) for batch in batch_manager.get_all_batches()])
+    except Exception as e:
+        print(f"Error getting download batches: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/downloads/batch/<batch_id>', methods=['GET'])
+@api_login_required
+def get_download_batch(batch_id):
+    """Get the progress of a download batch."""
+    try:
+        session_id = get_session_id()
+        batch_manager = session_manager.get_batch_manager(session_id)
+        
+        batch = batch_manager.get_batch(batch_id)
+        if batch:
+            return jsonify(batch_manager.get_progress(batch))
+        else:
+            return jsonify({'error': 'Batch not found'}), 404
+    except Exception as e:
+        print(f"Error getting download batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/downloads/batch/<batch_id>', methods=['DELETE'])
+@api_login_required
+def cancel_download_batch(batch_id):
+    """Cancel the downloads and extractions of a batch that are not over."""
+    try:
+        session_id = get_session_id()
+        batch_manager = session_manager.get_batch_manager(session_id)
+        
+        success = batch_manager.cancel_batch(batch_id)
+        return jsonify({'success': success})
+    except Exception as e:
+        print(f"Error cancelling download batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/downloads/<download_id>', methods=['DELETE'])
 @api_login_required
 def cancel_download(download_id):
@@ -691,12 +925,14 @@ def get_all_extractions():
         
         # Récupérer les extractions sous forme de dictionnaire
         extractions_dict = stems_extractor.get_all_extractions()
+        estimates = stems_extractor.get_estimates()
         
         # Convertir en liste plate pour le frontend
         extractions_list = []
         for status_type in ['active', 'queued', 'completed', 'failed']:
             if status_type in extractions_dict:
                 for item in extractions_dict[status_type]:
+                    estimate = estimates.get(item.extraction_id, {})
                     # Convert to dictionary and add status type
                     item_dict = {
                         'extraction_id': item.extraction_id,
@@ -706,11 +942,21 @@ def get_all_extractions():
                         'selected_stems': item.selected_stems,
                         'two_stem_mode': item.two_stem_mode,
                         'primary_stem': item.primary_stem,
+                        'output_format': item.output_format,
+                        'priority': item.priority,
                         'status': item.status.value,
                         'progress': item.progress,
+                        'phase': item.phase,
+                        'segment': item.segment,
+                        'segments': item.segments,
+                        'audio_seconds': item.audio_seconds,
+                        'predicted_seconds': item.predicted_seconds,
+                        'estimated_start_seconds': estimate.get('estimated_start_seconds'),
+                        'estimated_remaining_seconds': estimate.get('estimated_remaining_seconds'),
                         'error_message': item.error_message,
                         'output_paths': item.output_paths,
-                        'zip_path': item.zip_path
+                        'available_seconds': item.available_seconds,
+                        'partial_stems': item.partial_stems
                     }
                     extractions_list.append(item_dict)
         
@@ -719,6 +965,46 @@ def get_all_extractions():
         print(f"Error getting extractions: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/extractions/estimate', methods=['GET'])
+@api_login_required
+def estimate_extraction():
+    """Predict runtime and queue wait of an extraction before starting it.
+    
+    Query parameters: audio_path (inside the downloads directory), and
+    optionally model_name (every model otherwise) and priority, so the user
+    can weigh a slower model against the wait.
+    """
+    try:
+        audio_path = request.args.get('audio_path')
+        if not audio_path:
+            return jsonify({'error': 'audio_path is required'}), 400
+        # Only downloaded files: the duration of any other file is none of the user's business
+        if not in_downloads_directory(audio_path):
+            return jsonify({'error': 'audio_path must be inside the downloads directory'}), 400
+        
+        model_name = request.args.get('model_name')
+        if model_name and model_name not in STEM_MODELS:
+            return jsonify({'error': f'Unknown model: {model_name}'}), 400
+        try:
+            priority = check_priority(request.args.get('priority') or default_extraction_priority())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        session_id = get_session_id()
+        stems_extractor = session_manager.get_stems_extractor(session_id)
+        
+        model_names = [model_name] if model_name else list(STEM_MODELS)
+        estimates = {}
+        audio_seconds = 0.0
+        for model_name in model_names:
+            estimates[model_name] = stems_extractor.estimate_new(audio_path, model_name, audio_seconds, priority)
+            audio_seconds = estimates[model_name]['audio_seconds']
+        
+        return jsonify(estimates)
+    except Exception as e:
+        print(f"Error estimating extraction: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/extractions/<extraction_id>', methods=['GET'])
 @api_login_required
 def get_extraction_status(extraction_id):
@@ -729,6 +1015,7 @@ def get_extraction_status(extraction_id):
         
         item = stems_extractor.get_extraction_status(extraction_id)
         if item:
+            estimate = stems_extractor.get_estimates().get(extraction_id, {})
             item_dict = {
                 'extraction_id': item.extraction_id,
                 'audio_path': item.audio_path,
@@ -737,11 +1024,20 @@ def get_extraction_status(extraction_id):
                 'selected_stems': item.selected_stems,
                 'two_stem_mode': item.two_stem_mode,
                 'primary_stem': item.primary_stem,
+                'output_format': item.output_format,
                 'status': item.status.value,
                 'progress': item.progress,
+                'phase': item.phase,
+                'segment': item.segment,
+                'segments': item.segments,
+                'audio_seconds': item.audio_seconds,
+                'predicted_seconds': item.predicted_seconds,
+                'estimated_start_seconds': estimate.get('estimated_start_seconds'),
+                'estimated_remaining_seconds': estimate.get('estimated_remaining_seconds'),
                 'error_message': item.error_message,
                 'output_paths': item.output_paths,
-                'zip_path': item.zip_path
+                'available_seconds': item.available_seconds,
+                'partial_stems': item.partial_stems
             }
             return jsonify(item_dict)
         else:
@@ -763,15 +1059,28 @@ def add_extraction():
         session_id = get_session_id()
         stems_extractor = session_manager.get_stems_extractor(session_id)
         
+        # Admin priority is for administrators, whose jobs get it by default
+        try:
+            priority = check_priority(data.get('priority') or default_extraction_priority())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if priority == 'admin' and not current_user.is_admin:
+            return jsonify({'error': 'Admin priority requires an administrator account'}), 403
+        
         # Create extraction item
-        item = ExtractionItem(
-            audio_path=data['audio_path'],
-            model_name=data['model_name'],
-            output_dir=data.get('output_dir', os.path.join(os.path.dirname(data['audio_path']), 'stems')),
-            selected_stems=data['selected_stems'],
-            two_stem_mode=data.get('two_stem_mode', False),
-            primary_stem=data.get('primary_stem', 'vocals')
-        )
+        try:
+            item = ExtractionItem(
+                audio_path=data['audio_path'],
+                model_name=data['model_name'],
+                output_dir=data.get('output_dir', os.path.join(os.path.dirname(data['audio_path']), 'stems')),
+                selected_stems=data['selected_stems'],
+                two_stem_mode=data.get('two_stem_mode', False),
+                primary_stem=data.get('primary_stem', 'vocals'),
+                output_format=data.get('output_format', ''),
+                priority=priority
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Add to queue
         extraction_id = stems_extractor.add_extraction(item)
@@ -790,6 +1099,9 @@ def cancel_extraction(extraction_id):
         stems_extractor = session_manager.get_stems_extractor(session_id)
         
         success = stems_extractor.cancel_extraction(extraction_id)
+        if success:
+            # Cancelling reports no error, so free its place in a batch's window here
+            notify_batch_extraction(session_id, extraction_id)
         return jsonify({'success': success})
     except Exception as e:
         print(f"Error cancelling extraction: {e}")
@@ -807,10 +1119,13 @@ def get_config():
     config = {
         'downloads_directory': ensure_valid_downloads_directory(),
         'max_concurrent_downloads': get_setting('max_concurrent_downloads', 3),
+        'download_slots': get_download_scheduler().slots,
+        'download_bandwidth_mbps': get_download_scheduler().bandwidth_mbps,
         'preferred_video_quality': get_setting('preferred_video_quality', 'best'),
         'preferred_audio_quality': get_setting('preferred_audio_quality', 'best'),
         'use_gpu_for_extraction': get_setting('use_gpu_for_extraction', True),
         'default_stem_model': get_setting('default_stem_model', 'htdemucs'),
+        'extraction_slots': get_extraction_scheduler().slots,
         'ffmpeg_path': get_ffmpeg_path(),
         'ffprobe_path': get_ffprobe_path(),
         'using_gpu': stems_extractor.using_gpu
@@ -830,6 +1145,14 @@ def update_config():
     for key, value in data.items():
         update_setting(key, value)
     
+    # Apply the new slot budget to the running scheduler
+    if 'extraction_slots' in data:
+        get_extraction_scheduler().set_slots(data['extraction_slots'])
+    if 'download_slots' in data:
+        get_download_scheduler().set_slots(data['download_slots'])
+    if 'download_bandwidth_mbps' in data:
+        get_download_scheduler().set_bandwidth(data['download_bandwidth_mbps'])
+    
     return jsonify({'success': True})
 
 @app.route('/api/config/ffmpeg/check', methods=['GET'])
@@ -986,6 +1309,11 @@ def extracted_stems(extraction_id, stem_file):
         
         # Vérifier si le fichier existe
         full_path = os.path.join(stem_dir, stem_file)
+        stem_name = os.path.splitext(stem_file)[0]
+        if not os.path.exists(full_path) and stem_name in item.output_paths:
+            # Le mixer demande <stem>.mp3 ; servir le stem dans le format de l'extraction
+            full_path = item.output_paths[stem_name]
+            stem_dir, stem_file = os.path.split(full_path)
         if not os.path.exists(full_path):
             print(f"Fichier stem non trouvé: {full_path}")
             return f"Stem file {stem_file} not found in extraction {decoded_extraction_id}", 404
@@ -998,6 +1326,68 @@ def extracted_stems(extraction_id, stem_file):
         traceback.print_exc()
         return str(e), 500
 
+@app.route('/api/extractions/<extraction_id>/partial/<stem_name>', methods=['GET'])
+@api_login_required
+def partial_stem(extraction_id, stem_name):
+    """Serve the part of a stem separated so far, as a WAV file.
+    
+    Once the extraction has finished the partial audio is gone and the final
+    stem is served instead.
+    """
+    try:
+        session_id = get_session_id()
+        stems_extractor = session_manager.get_stems_extractor(session_id)
+        
+        item = stems_extractor.get_extraction_status(extraction_id)
+        if not item:
+            return "Extraction not found", 404
+        
+        partial = stream_partial_wav(item.partial_dir, stem_name)
+        if partial is not None:
+            size, data = partial
+            return Response(data, mimetype='audio/wav',
+                            headers={'Cache-Control': 'no-store', 'Content-Length': str(size)})
+        
+        stem_path = item.output_paths.get(stem_name)
+        if stem_path and os.path.exists(stem_path):
+            return send_from_directory(os.path.dirname(stem_path), os.path.basename(stem_path))
+        
+        return f"No audio available yet for stem {stem_name}", 404
+    except Exception as e:
+        print(f"Error serving partial stem: {e}")
+        return str(e), 500
+
+@app.route('/api/extractions/<extraction_id>/zip', methods=['GET'])
+@api_login_required
+def extraction_zip(extraction_id):
+    """Stream the stems of an extraction as a ZIP archive.
+    
+    The archive is built while it is sent, with stored (uncompressed)
+    entries: audio does not compress and nothing is written to disk.
+    """
+    try:
+        session_id = get_session_id()
+        stems_extractor = session_manager.get_stems_extractor(session_id)
+        
+        item = stems_extractor.get_extraction_status(extraction_id)
+        if not item or item.status != ExtractionStatus.COMPLETED:
+            return "Extraction not found or not completed", 404
+        
+        files = {os.path.basename(path): path for path in item.output_paths.values() if os.path.exists(path)}
+        if not files:
+            return "No stems available for this extraction", 404
+        
+        import urllib.parse
+        archive_name = f"{os.path.splitext(os.path.basename(item.audio_path))[0]}_stems.zip"
+        return Response(
+            stream_zip(files),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f"attachment; filename*=UTF-8''{urllib.parse.quote(archive_name)}"}
+        )
+    except Exception as e:
+        print(f"Error streaming extraction archive: {e}")
+        return str(e), 500
+
 @app.route('/api/waveform/<path:file_path>', methods=['GET'])
 @api_login_required
 def get_waveform(file_path):
@@ -1024,6 +1414,27 @@ def get_waveform(file_path):
         # plutôt que de renvoyer toutes les données
         sample_count = int(request.args.get('samples', 200))
         
+        # Audio déjà décodé pour l'extraction : pas besoin de le décoder à nouveau
+        cached = get_cached_pcm(full_path) if get_setting('lossless_audio_pipeline', False) else None
+        if cached is not None:
+            pcm, pcm_rate = cached
+            mono = pcm[:, :60 * pcm_rate].mean(axis=0)
+            if len(mono) > sample_count:
+                audio_data = mono[np.linspace(0, len(mono) - 1, sample_count, dtype=int)]
+            else:
+                audio_data = np.concatenate([mono, np.zeros(sample_count - len(mono))])
+            
+            max_val = np.abs(audio_data).max()
+            if max_val > 0:
+                audio_data = audio_data / max_val
+            
+            return {
+                "success": True,
+                "waveform": audio_data.tolist(),
+                "duration": pcm.shape[1] / pcm_rate,
+                "sample_rate": 8000
+            }
+        
         try:
             # Utiliser librosa pour analyser l'audio (meilleure qualité)
             import librosa
@@ -1078,10 +1489,11 @@ def get_waveform(file_path):
                 probe_result = subprocess.run(probe_cmd, capture_output=True, text=True)
                 metadata = json.loads(probe_result.stdout) if probe_result.stdout else {"format": {"duration": "0"}}
                 
-                # Extraire les données audio et les convertir en forme d'onde
+                # Extraire les données audio et les convertir en forme d'onde ;
+                # décodées en PCM 16 bits quel que soit le codec (MP3, Opus, AAC)
                 cmd = [
-                    ffmpeg_path, "-i", full_path, "-ac", "1", "-filter:a",
-                    f"aresample=8000,asetnsamples={sample_count}", "-f", "data", "-"
+                    ffmpeg_path, "-i", full_path, "-vn", "-ac", "1", "-filter:a",
+                    f"aresample=8000,asetnsamples={sample_count}", "-acodec", "pcm_s16le", "-f", "s16le", "-"
                 ]
                 
                 result = subprocess.run(cmd, capture_output=True, timeout=10)
@@ -1391,8 +1803,10 @@ def handle_connect():
         })
         return False  # Reject the connection
     
-    # Join a room specific to this session
+    # Join a room specific to this session, and the user's room where
+    # jobs resumed after a restart report
     join_room(session_id)
+    join_room(owner_room(get_session_owner(session_id)))
     print(f"Client connected and joined room: {session_id}")
     
     # Send initial data
@@ -1406,11 +1820,40 @@ def handle_disconnect():
     
     # Leave the room specific to this session
     leave_room(session_id)
+    leave_room(owner_room(get_session_owner(session_id)))
     print(f"Client disconnected from room: {session_id}")
     
     # Clean up resources if needed
     # session_manager.cleanup_session(session_id)
 
+def start_background_services():
+    """Start the separation workers and resume interrupted jobs, once per serving process.
+    
+    Called when the development server starts; a WSGI server calls it from
+    its worker start hook (e.g. gunicorn's ``post_worker_init``). The
+    workers are started first so the default model is already loading when
+    the first job arrives. Of several serving processes, only the first to
+    start resumes the interrupted jobs (see job_journal.claim_recovery).
+    """
+    global _background_services_started
+    if _background_services_started:
+        return
+    _background_services_started = True
+    get_separation_pool()
+    # Pick up the jobs a restart or crash interrupted
+    if claim_recovery():
+        recover_unfinished_jobs()
+
+_background_services_started = False
+
+def stop_background_services():
+    """Stop the separation workers, which would otherwise outlive the application.
+    
+    Also registered with atexit when the pool starts; this covers the
+    signals that skip it.
+    """
+    shutdown_separation_pool()
+
 # Check if the application is already running
 if __name__ == '__main__':
     import socket
@@ -1441,5 +1884,17 @@ if __name__ == '__main__':
             print("Then use 'taskkill /F /PID <process_id>' to terminate it.")
             exit(1)
     
+    # With the reloader, the serving process is its child; the parent only
+    # watches the files and must not start workers or resume jobs
+    use_reloader = os.environ.get('STEMTUBE_RELOAD', '1') != '0'
+    if is_reloader or not use_reloader:
+        start_background_services()
+        # SIGTERM would end the process without running atexit handlers
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
     # Run the application
-    socketio.run(app, host='0.0.0.0', port=port, debug=True)
+    try:
+        socketio.run(app, host='0.0.0.0', port=port, debug=True, use_reloader=use_reloader)
+    finally:
+        stop_background_services()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Extraction throughput benchmark for StemTubes.
+
+Compares total tracks/hour of the old one-subprocess-per-job path
+(``python -m demucs.separate`` per track, one at a time) against the warm
+separation worker pool.
+
+Example:
+    python benchmarks/extraction_throughput.py song.mp3 --tracks 8 --workers 4
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.separation_pool import SeparationPool
+
+
+def bench_subprocess(tracks, model, device, out_root):
+    """Run each track through its own demucs.separate process, one at a time."""
+    start = time.time()
+    for i, track in enumerate(tracks):
+        cmd = [
+            sys.executable, "-m", "demucs.separate",
+            "--mp3", "--mp3-bitrate", "320",
+            "-n", model, "-d", device,
+            "-o", os.path.join(out_root, f"subprocess_{i}"),
+            track,
+        ]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.time() - start
+
+
+def bench_pool(tracks, model, device, workers, threads, out_root):
+    """Run all tracks through a warm pool. Returns (startup seconds, run seconds)."""
+    start = time.time()
+    pool = SeparationPool(workers, threads, model_name=model, device=device)
+    for worker in pool.workers:
+        worker.ready.wait()
+    startup = time.time() - start
+
+    def run(i_track):
+        i, track = i_track
+        return pool.run(track, os.path.join(out_root, f"pool_{i}"), model, [])
+
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, enumerate(tracks)))
+    finally:
+        pool.shutdown()
+    return startup, time.time() - start
+
+
+def tracks_per_hour(count, seconds):
+    return count * 3600.0 / seconds if seconds > 0 else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare extraction throughput")
+    parser.add_argument("audio", nargs="+", help="Audio file(s) to separate")
+    parser.add_argument("--tracks", type=int, default=4, help="Number of jobs to run (files are reused)")
+    parser.add_argument("--model", default="htdemucs")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 4))
+    parser.add_argument("--threads", type=int, default=0, help="Threads per worker (0 = split cores)")
+    parser.add_argument("--skip-subprocess", action="store_true", help="Only benchmark the pool")
+    args = parser.parse_args()
+
+    tracks = [os.path.abspath(args.audio[i % len(args.audio)]) for i in range(args.tracks)]
+    out_root = tempfile.mkdtemp(prefix="stemtubes_bench_")
+    try:
+        print(f"{args.tracks} tracks, model {args.model} on {args.device}, {os.cpu_count()} cores")
+
+        if not args.skip_subprocess:
+            seconds = bench_subprocess(tracks, args.model, args.device, out_root)
+            print(f"subprocess per job : {seconds:8.1f} s  {tracks_per_hour(args.tracks, seconds):7.1f} tracks/hour")
+
+        startup, seconds = bench_pool(tracks, args.model, args.device, args.workers, args.threads, out_root)
+        print(f"pool x{args.workers:<2}          : {seconds:8.1f} s  {tracks_per_hour(args.tracks, seconds):7.1f} tracks/hour"
+              f"  (+{startup:.1f} s one-off warm-up)")
+    finally:
+        shutil.rmtree(out_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Segment-parallel separation benchmark for StemTubes.
+
+Separates one (long) track with a single in-process apply_model call and
+again with its segments spread over the worker pool, then reports both
+latencies and how far the two outputs are apart.
+
+Example:
+    python benchmarks/segment_parallel.py concert.mp3 --workers 4
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+from demucs.apply import apply_model
+
+from core.separation import load_model, load_audio, normalize, model_metadata, SEGMENT_OVERLAP
+from core.separation_pool import SeparationPool
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare single-process and segment-parallel separation")
+    parser.add_argument("audio", help="Audio file to separate")
+    parser.add_argument("--model", default="htdemucs")
+    parser.add_argument("--workers", type=int, default=max(2, (os.cpu_count() or 2) // 4))
+    parser.add_argument("--threads", type=int, default=0, help="Threads per worker (0 = split cores)")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Maximum accepted relative error")
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    model = load_model(args.model, device)
+    audio, sr = load_audio(args.audio, model)
+    mix, _, _ = normalize(audio)
+    print(f"{mix.shape[-1] / sr:.0f} s of audio, model {args.model}, {os.cpu_count()} cores")
+
+    start = time.time()
+    reference = apply_model(model, mix[None], shifts=0, split=True, overlap=SEGMENT_OVERLAP, device=device)[0]
+    single = time.time() - start
+    print(f"single process     : {single:8.1f} s")
+
+    scratch_dir = tempfile.mkdtemp(prefix="stemtubes_bench_")
+    mix_path = os.path.join(scratch_dir, "mix.npy")
+    np.save(mix_path, mix.numpy())
+    metadata = dict(model_metadata(model), channels=mix.shape[0], length=mix.shape[-1])
+
+    pool = SeparationPool(args.workers, args.threads, model_name=args.model)
+    try:
+        for worker in pool.workers:
+            worker.ready.wait()
+        start = time.time()
+        parallel_out = pool.separate_segmented(args.model, metadata, mix_path)
+        parallel = time.time() - start
+    finally:
+        pool.shutdown()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    print(f"segments x{args.workers:<2}       : {parallel:8.1f} s  ({single / parallel:.2f}x)")
+
+    max_abs = (parallel_out - reference).abs().max().item()
+    relative = ((parallel_out - reference).norm() / reference.norm()).item()
+    print(f"max abs difference : {max_abs:.2e}")
+    print(f"relative error     : {relative:.2e}")
+    if relative > args.tolerance:
+        print("FAIL: outputs differ by more than the tolerance")
+        sys.exit(1)
+    print("OK: outputs match within tolerance")
+
+
+if __name__ == "__main__":
+    main()
@@ -50,10 +50,31 @@ YOUTUBE_API_KEY = os.environ.get("YOUTUBE_API_KEY", "")
 DEFAULT_SETTINGS = {
     "theme": "dark",  # dark or light
     "downloads_directory": DOWNLOADS_DIR,
-    "max_concurrent_downloads": 3,
+    "max_concurrent_downloads": 3,  # Concurrent downloads per user
+    "download_slots": 4,  # Concurrent downloads for the whole host
+    "download_bandwidth_mbps": 0,  # Combined download rate limit in Mbit/s, 0 for none
+    "ytdl_pool_size": 2,  # Idle yt-dlp instances kept per option profile
+    "ytdl_info_ttl_seconds": 300,  # How long resolved video info is reused (0 = never)
+    "batch_max_videos": 200,  # Most videos queued from one playlist or list (0 = no limit)
+    "batch_extraction_window": 2,  # Extractions of a batch queued or running at once
     "preferred_video_quality": "720p",
     "preferred_audio_quality": "best",
     "use_gpu_for_extraction": True,
+    "extraction_slots": 1,  # Concurrent extractions for the whole host
+    "extraction_aging_rate": 1.0,  # Seconds of predicted cost a queued extraction loses per second waited
+    "extraction_class_age_seconds": 3600,  # Seconds of cost each priority class below admin adds
+    "job_journal": True,  # Journal job states to processed.db and resume unfinished jobs on startup
+    "extraction_workers": 0,  # Resident separation processes (0 = run in-process)
+    "extraction_threads_per_worker": 0,  # Torch threads per worker (0 = split cores evenly)
+    "segment_parallel_min_seconds": 600,  # Split longer tracks across all workers (0 = never)
+    "progressive_stems": True,  # Publish stems in time order while extraction runs
+    "extraction_cache_max_gb": 0,  # Disk budget for cached extractions, LRU eviction (0 = unlimited)
+    "audio_download_format": "mp3",  # mp3 (re-encoded at 192k) or native (YouTube's Opus/AAC stream, remuxed)
+    "lossless_audio_pipeline": False,  # Keep YouTube's native audio and decode it once to a PCM cache
+    "pcm_cache_max_gb": 5,  # Disk budget for decoded PCM, LRU eviction (0 = unlimited)
+    "stem_output_format": "mp3",  # Default stem format: mp3, opus, flac or wav
+    "stem_encoding_workers": 0,  # Stems encoded at once, one FFmpeg each (0 = one per core)
+    "progress_emit_hz": 4,  # Max extraction progress updates per second per job (0 = unthrottled)
     "default_stem_model": "htdemucs",
     "ffmpeg_path": "",
     "auto_check_updates": True
@@ -310,3 +331,38 @@ STEM_MODELS = {
         "description": "Fine-tuned 4-stem separation with better quality"
     }
 }
+
+# Stems mixed from a model's own stems, with the stems each one leaves out
+DERIVED_STEMS = {
+    "instrumental": ["vocals"],  # Everything but the vocals, for karaoke
+}
+
+
+def get_stem_recipe(model_name, selected_stems, two_stem_mode=False, primary_stem="vocals"):
+    """Work out which stems a request produces and how.
+    
+    Args:
+        model_name: Demucs model name.
+        selected_stems: Stems requested; all model stems if none is valid.
+        two_stem_mode: Produce only the primary stem and the sum of the others.
+        primary_stem: Primary stem for two-stem mode.
+    
+    Returns:
+        Dictionary of output stem name to the model stems summed into it.
+    """
+    available = STEM_MODELS.get(model_name, {}).get("stems", [])
+    
+    if two_stem_mode and primary_stem in available:
+        return {
+            primary_stem: [primary_stem],
+            "other": [s for s in available if s != primary_stem]
+        }
+    
+    selected = [s for s in selected_stems if s in available or s in DERIVED_STEMS] or available
+    recipe = {}
+    for stem in selected:
+        if stem in DERIVED_STEMS:
+            recipe[stem] = [s for s in available if s not in DERIVED_STEMS[stem]]
+        else:
+            recipe[stem] = [stem]
+    return recipe
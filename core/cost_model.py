@@ -0,0 +1,166 @@
+"""
+Extraction cost model for StemTubes application.
+Records how long every finished extraction took and predicts from that
+history how long a new one will take: time is fitted as a linear function
+of the audio duration, per model, device and thread count.
+"""
+import json
+import time
+import threading
+from typing import Dict, List, Optional, Any, Tuple
+
+from .processed_db import save_extraction_history, get_extraction_history
+from .progress import PHASE_ENCODING, PHASE_FINALIZING
+
+
+# Seconds of CPU separation per second of audio, used until a model has history
+DEFAULT_SECONDS_PER_AUDIO_SECOND = {
+    "htdemucs": 0.4,
+    "htdemucs_6s": 0.5,
+    "htdemucs_ft": 1.6,  # Bag of four fine-tuned models
+}
+FALLBACK_SECONDS_PER_AUDIO_SECOND = 1.0
+GPU_SPEEDUP = 10.0
+DEFAULT_SLOT_SHARE = 0.9  # Share of the time spent separating rather than encoding
+
+HISTORY_SIZE = 50  # Most recent runs the fit uses
+MIN_SAMPLES = 3  # Runs needed before history replaces the defaults
+
+# Phases that run after the extraction slot is released
+_AFTER_SLOT_PHASES = (PHASE_ENCODING, PHASE_FINALIZING)
+
+
+def _fit_line(points: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """Least-squares fit of y = intercept + slope * x.
+
+    Falls back to a line through the origin (median ratio) when the
+    durations are too alike to fit, or the fit gives a negative intercept.
+    """
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x > 0:
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+        intercept = mean_y - slope * mean_x
+        if slope > 0 and intercept >= 0:
+            return intercept, slope
+
+    ratios = sorted(y / x for x, y in points if x > 0)
+    return 0.0, ratios[len(ratios) // 2] if ratios else 0.0
+
+
+class CostModel:
+    """Fits and caches extraction cost lines from the extraction history."""
+
+    def __init__(self):
+        self._fits: Dict[Tuple[str, str, int], Optional[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, audio_seconds: float, device: str, threads: int,
+               wall_seconds: float, phases: Dict[str, float]):
+        """Record a finished extraction.
+
+        Args:
+            model_name: Demucs model name.
+            audio_seconds: Duration of the separated audio.
+            device: Torch device type ("cpu" or "cuda").
+            threads: Torch threads the separation ran with.
+            wall_seconds: Time from start to completion.
+            phases: Seconds spent in each phase (see core.progress).
+        """
+        slot_seconds = sum(seconds for phase, seconds in phases.items() if phase not in _AFTER_SLOT_PHASES)
+        save_extraction_history({
+            "model_name": model_name,
+            "audio_seconds": audio_seconds,
+            "device": device,
+            "threads": threads,
+            "wall_seconds": wall_seconds,
+            "slot_seconds": slot_seconds,
+            "phases": json.dumps(phases),
+            "finished_at": time.time(),
+        })
+
+        with self._lock:
+            for key in [key for key in self._fits if key[:2] == (model_name, device)]:
+                del self._fits[key]
+
+    def predict(self, model_name: str, audio_seconds: float, device: str, threads: int) -> Dict[str, Any]:
+        """Predict how long an extraction will take.
+
+        Args:
+            model_name: Demucs model name.
+            audio_seconds: Duration of the audio to separate.
+            device: Torch device type.
+            threads: Torch threads the separation will run with.
+
+        Returns:
+            Dictionary with ``wall_seconds`` (until completion),
+            ``slot_seconds`` (until the extraction slot is free again) and
+            ``samples`` (runs the prediction is based on, 0 for defaults).
+        """
+        fit = self._fit(model_name, device, threads)
+        if fit is None:
+            rate = DEFAULT_SECONDS_PER_AUDIO_SECOND.get(model_name, FALLBACK_SECONDS_PER_AUDIO_SECOND)
+            if device != "cpu":
+                rate /= GPU_SPEEDUP
+            wall = rate * audio_seconds
+            return {"wall_seconds": wall, "slot_seconds": wall * DEFAULT_SLOT_SHARE, "samples": 0}
+
+        return {
+            "wall_seconds": fit["wall"][0] + fit["wall"][1] * audio_seconds,
+            "slot_seconds": fit["slot"][0] + fit["slot"][1] * audio_seconds,
+            "samples": fit["samples"],
+        }
+
+    def _fit(self, model_name: str, device: str, threads: int) -> Optional[Dict[str, Any]]:
+        """Fit lines for a model and device, preferring runs with the same thread count."""
+        key = (model_name, device, threads)
+        with self._lock:
+            if key in self._fits:
+                return self._fits[key]
+
+        history = get_extraction_history(model_name, device, HISTORY_SIZE)
+        same_threads = [run for run in history if run["threads"] == threads]
+        runs = same_threads if len(same_threads) >= MIN_SAMPLES else history
+
+        fit = None
+        if len(runs) >= MIN_SAMPLES:
+            fit = {
+                "wall": _fit_line([(run["audio_seconds"], run["wall_seconds"]) for run in runs]),
+                "slot": _fit_line([(run["audio_seconds"], run["slot_seconds"]) for run in runs]),
+                "samples": len(runs),
+            }
+
+        with self._lock:
+            self._fits[key] = fit
+        return fit
+
+
+def remaining_seconds(predicted_seconds: float, elapsed_seconds: float, progress: float) -> float:
+    """Estimate the time left for a running extraction.
+
+    The prediction is used until the job is far enough along for its own
+    pace to be a better guide.
+
+    Args:
+        predicted_seconds: Predicted total time.
+        elapsed_seconds: Time since the job started.
+        progress: Progress on the 0-100 scale.
+    """
+    if progress >= 20.0:
+        return elapsed_seconds * (100.0 - progress) / progress
+    return max(predicted_seconds - elapsed_seconds, 0.0)
+
+
+# Create a singleton instance
+_cost_model = None
+_cost_model_lock = threading.Lock()
+
+def get_cost_model() -> CostModel:
+    """Get the cost model singleton instance."""
+    global _cost_model
+    with _cost_model_lock:
+        if _cost_model is None:
+            _cost_model = CostModel()
+    return _cost_model
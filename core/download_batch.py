@@ -0,0 +1,395 @@
+"""
+Download batches for StemTubes application.
+Queues a whole playlist or list of videos as one parent job with aggregate
+progress, and can hand each finished download to stem extraction, keeping
+at most a few of the batch's extractions queued or running at a time.
+"""
+import os
+import time
+import uuid
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .config import get_setting
+from .download_manager import DownloadManager, DownloadItem, DownloadType, DownloadStatus
+from .stems_extractor import StemsExtractor, ExtractionItem
+from .job_registry import QUEUED, ACTIVE, COMPLETED, FAILED
+from .ytdl_pool import get_ytdl_pool
+
+
+# Options of a flat playlist listing: entries are not resolved one by one
+_EXPAND_OPTIONS = {
+    'extract_flat': 'in_playlist',
+    'ignoreerrors': True,
+    'quiet': True,
+}
+
+
+@dataclass
+class DownloadBatch:
+    """Parent job of the downloads (and extractions) of a playlist or video list."""
+    download_type: DownloadType
+    quality: str
+    playlist_url: str = ""
+    # Videos asked for directly: dictionaries with video_id and, when the
+    # client knows them, title and thumbnail_url
+    videos: List[Dict[str, str]] = None
+    # ExtractionItem fields (model_name, selected_stems...) to extract each
+    # finished download with, or None to only download
+    extraction: Optional[Dict[str, Any]] = None
+    extraction_window: int = 0
+    title: str = ""
+    batch_id: str = ""
+    status: str = QUEUED
+    error_message: str = ""
+    cancelled: bool = False
+    download_ids: List[str] = field(default_factory=list)
+    # Download ID to ID of the extraction of its file
+    extraction_ids: Dict[str, str] = field(default_factory=dict)
+    # Finished downloads waiting for a place in the extraction window
+    pending_extractions: Deque[str] = field(default_factory=deque)
+    # Extractions taken from pending_extractions and being submitted
+    starting: int = 0
+    created_at: float = 0.0
+
+    def __post_init__(self):
+        """Generate a unique batch ID if not provided."""
+        if not self.batch_id:
+            self.batch_id = f"batch_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        if self.videos is None:
+            self.videos = []
+        if not self.extraction_window:
+            self.extraction_window = get_setting("batch_extraction_window", 2)
+        self.extraction_window = max(1, int(self.extraction_window))
+        if not self.created_at:
+            self.created_at = time.time()
+
+
+def expand_playlist(url: str) -> Tuple[str, List[Dict[str, str]]]:
+    """List the videos of a playlist (or a single video) URL.
+
+    One ``extract_info(process=False)`` call on a flat listing: the videos
+    are only resolved when they are downloaded.
+
+    Args:
+        url: Playlist or video URL.
+
+    Returns:
+        Title of the playlist and its videos, as dictionaries with
+        video_id, title and thumbnail_url.
+
+    Raises:
+        ValueError: If nothing could be extracted from the URL.
+    """
+    with get_ytdl_pool().session(_EXPAND_OPTIONS) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        if not info:
+            raise ValueError(f"Could not read playlist: {url}")
+
+        entries = info.get('entries')
+        if entries is None:
+            # A single video
+            return info.get('title') or "", [_video_entry(info)]
+        # Entries may be a lazy list fetching further pages as it is read
+        return info.get('title') or "", [_video_entry(entry) for entry in entries if entry and entry.get('id')]
+
+
+def _video_entry(entry: Dict[str, Any]) -> Dict[str, str]:
+    """Video ID, title and thumbnail of a yt-dlp (flat) entry."""
+    video_id = entry['id']
+    thumbnail = entry.get('thumbnail')
+    if not thumbnail and entry.get('thumbnails'):
+        thumbnail = entry['thumbnails'][-1].get('url')
+    return {
+        'video_id': video_id,
+        'title': entry.get('title') or video_id,
+        'thumbnail_url': thumbnail or f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+    }
+
+
+class BatchManager:
+    """Runs the download batches of a session.
+
+    The session's callbacks tell it when one of its downloads or
+    extractions is over (``download_finished``, ``extraction_finished``).
+    """
+
+    def __init__(self, download_manager: DownloadManager, stems_extractor: Optional[StemsExtractor] = None):
+        """Initialize the batch manager.
+
+        Args:
+            download_manager: Download manager the batch downloads are added to.
+            stems_extractor: Stems extractor the finished downloads are
+                handed to, for batches asking for extraction.
+        """
+        self.downloads = download_manager
+        self.extractor = stems_extractor
+
+        self._lock = threading.RLock()
+        self._batches: Dict[str, DownloadBatch] = {}
+        # Download and extraction IDs to the ID of their batch
+        self._by_download: Dict[str, str] = {}
+        self._by_extraction: Dict[str, str] = {}
+
+        # Callbacks
+        self.on_batch_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None
+
+    def add_batch(self, batch: DownloadBatch) -> str:
+        """Queue a batch; its list is expanded and its videos queued in the background.
+
+        Args:
+            batch: Batch to add.
+
+        Returns:
+            Batch ID.
+        """
+        if batch.extraction is not None and self.extractor is None:
+            raise ValueError("This batch manager has no stems extractor")
+        with self._lock:
+            self._batches[batch.batch_id] = batch
+
+        threading.Thread(target=self._expand_thread, args=(batch,), daemon=True).start()
+        return batch.batch_id
+
+    def get_batch(self, batch_id: str) -> Optional[DownloadBatch]:
+        """Get a batch by ID, or None."""
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def get_all_batches(self) -> List[DownloadBatch]:
+        """Get every batch of the session, oldest first."""
+        with self._lock:
+            return sorted(self._batches.values(), key=lambda batch: batch.created_at)
+
+    def cancel_batch(self, batch_id: str) -> bool:
+        """Cancel the downloads and extractions of a batch that are not over yet.
+
+        Args:
+            batch_id: ID of the batch to cancel.
+
+        Returns:
+            True if the batch was cancelled, False if it is unknown or over.
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None or batch.status in (COMPLETED, FAILED):
+                return False
+            batch.cancelled = True
+            batch.pending_extractions.clear()
+            download_ids = list(batch.download_ids)
+            extraction_ids = list(batch.extraction_ids.values())
+
+        # Each cancellation calls back into download_finished, which finds
+        # the batch cancelled and leaves it alone
+        for download_id in download_ids:
+            if self.downloads.jobs.state(download_id) in (QUEUED, ACTIVE):
+                self.downloads.cancel_download(download_id)
+        for extraction_id in extraction_ids:
+            if self.extractor.jobs.state(extraction_id) in (QUEUED, ACTIVE):
+                self.extractor.cancel_extraction(extraction_id)
+
+        with self._lock:
+            batch.status = FAILED
+            batch.error_message = "Batch cancelled by user"
+        self._notify(batch)
+        return True
+
+    def download_finished(self, download_id: str):
+        """Account for a batch download that completed, failed or was cancelled."""
+        with self._lock:
+            batch = self._batches.get(self._by_download.get(download_id))
+            if batch is None or batch.cancelled:
+                return
+            item = self.downloads.get_download_status(download_id)
+            if (batch.extraction is not None and item is not None
+                    and item.status == DownloadStatus.COMPLETED and download_id not in batch.extraction_ids):
+                batch.pending_extractions.append(download_id)
+        self._pump(batch)
+        self._notify(batch)
+
+    def extraction_finished(self, extraction_id: str):
+        """Account for a batch extraction that completed, failed or was cancelled."""
+        with self._lock:
+            batch = self._batches.get(self._by_extraction.get(extraction_id))
+            if batch is None or batch.cancelled:
+                return
+        self._pump(batch)
+        self._notify(batch)
+
+    def get_progress(self, batch: DownloadBatch) -> Dict[str, Any]:
+        """Aggregate progress of a batch.
+
+        Failed jobs count as done. With extraction, a video's download and
+        its extraction weigh the same.
+
+        Returns:
+            Dictionary with the batch status, per-state counts of its
+            downloads and extractions, and overall progress in percent.
+        """
+        with self._lock:
+            download_ids = list(batch.download_ids)
+            extraction_ids = dict(batch.extraction_ids)
+
+        downloads = {state: 0 for state in (QUEUED, ACTIVE, COMPLETED, FAILED)}
+        extractions = {state: 0 for state in (QUEUED, ACTIVE, COMPLETED, FAILED)}
+        progress = 0.0
+        for download_id in download_ids:
+            state = self.downloads.jobs.state(download_id) or FAILED
+            downloads[state] += 1
+            download_progress = 100.0 if state in (COMPLETED, FAILED) else self.downloads.jobs.get(download_id).progress
+            if batch.extraction is None:
+                progress += download_progress
+                continue
+
+            extraction_id = extraction_ids.get(download_id)
+            if extraction_id:
+                state = self.extractor.jobs.state(extraction_id) or FAILED
+                extractions[state] += 1
+                extraction_progress = 100.0 if state in (COMPLETED, FAILED) else self.extractor.jobs.get(extraction_id).progress
+            else:
+                # A failed download has nothing to extract
+                extraction_progress = 100.0 if state == FAILED else 0.0
+            progress += (download_progress + extraction_progress) / 2
+
+        return {
+            'batch_id': batch.batch_id,
+            'title': batch.title,
+            'status': batch.status,
+            'error_message': batch.error_message,
+            'total': len(download_ids),
+            'downloads': downloads,
+            'extractions': extractions if batch.extraction is not None else None,
+            'progress': round(progress / len(download_ids), 1) if download_ids else 0.0,
+            'download_ids': download_ids,
+            'extraction_ids': extraction_ids,
+        }
+
+    def _expand_thread(self, batch: DownloadBatch):
+        """List the batch's videos and queue their downloads."""
+        try:
+            if batch.playlist_url:
+                title, videos = expand_playlist(batch.playlist_url)
+                batch.title = batch.title or title
+            else:
+                # Videos given by ID alone are queued right away; each download
+                # resolves its title from the info it fetches anyway
+                videos = batch.videos
+
+            max_videos = get_setting("batch_max_videos", 200)
+            if max_videos and len(videos) > max_videos:
+                print(f"Batch {batch.batch_id} truncated to {max_videos} of {len(videos)} videos")
+                videos = videos[:max_videos]
+            if not videos:
+                raise ValueError("The batch has no videos")
+        except Exception as e:
+            print(f"Error expanding batch {batch.batch_id}: {e}")
+            with self._lock:
+                batch.status = FAILED
+                batch.error_message = str(e)
+            self._notify(batch)
+            return
+
+        for video in videos:
+            item = DownloadItem(
+                video_id=video['video_id'],
+                title=video.get('title', ''),
+                thumbnail_url=video.get('thumbnail_url', ''),
+                download_type=batch.download_type,
+                quality=batch.quality
+            )
+            with self._lock:
+                if batch.cancelled:
+                    break
+                batch.download_ids.append(item.download_id)
+                self._by_download[item.download_id] = batch.batch_id
+            self.downloads.add_download(item)
+
+        with self._lock:
+            if not batch.cancelled:
+                batch.status = ACTIVE
+        self._pump(batch)
+        print(f"Batch {batch.batch_id} queued {len(batch.download_ids)} download(s)")
+        self._notify(batch)
+
+    def _pump(self, batch: DownloadBatch):
+        """Start waiting extractions while the window has room, and close the batch once all is done.
+
+        Places in the window are reserved under the lock, but the extractions
+        are submitted after it is released: ``add_extraction`` hashes and
+        probes the file, which must not hold back the other callbacks.
+        """
+        with self._lock:
+            if batch.cancelled:
+                return
+            room = batch.extraction_window - self._in_flight(batch)
+            starting = []
+            while batch.pending_extractions and len(starting) < room:
+                starting.append(batch.pending_extractions.popleft())
+            batch.starting += len(starting)
+
+        started = {}
+        for download_id in starting:
+            item = self.downloads.get_download_status(download_id)
+            if item is None or not item.file_path:
+                continue
+            try:
+                extraction = ExtractionItem(
+                    audio_path=item.file_path,
+                    output_dir=os.path.join(os.path.dirname(item.file_path), 'stems'),
+                    **batch.extraction
+                )
+                self.extractor.add_extraction(extraction)
+            except Exception as e:
+                print(f"Error queueing extraction of {download_id} for batch {batch.batch_id}: {e}")
+                continue
+            started[download_id] = extraction.extraction_id
+
+        with self._lock:
+            batch.starting -= len(starting)
+            batch.extraction_ids.update(started)
+            for extraction_id in started.values():
+                self._by_extraction[extraction_id] = batch.batch_id
+            cancelled = batch.cancelled
+            self._close_if_done(batch)
+
+        if cancelled:
+            # The batch was cancelled while these were being submitted
+            for extraction_id in started.values():
+                self.extractor.cancel_extraction(extraction_id)
+        elif len(started) < len(starting):
+            # Extractions that failed to queue left room for others
+            self._pump(batch)
+
+    def _in_flight(self, batch: DownloadBatch) -> int:
+        """Extractions of a batch queued, running or being submitted. Caller holds the lock."""
+        return batch.starting + sum(1 for extraction_id in batch.extraction_ids.values()
+                                    if self.extractor.jobs.state(extraction_id) in (QUEUED, ACTIVE))
+
+    def _close_if_done(self, batch: DownloadBatch):
+        """Mark a batch completed or failed once all of its jobs are over. Caller holds the lock."""
+        if batch.status != ACTIVE:
+            return
+        if any(self.downloads.jobs.state(download_id) in (QUEUED, ACTIVE) for download_id in batch.download_ids):
+            return
+        if batch.pending_extractions or self._in_flight(batch):
+            return
+
+        # Everything is over: the batch failed only if nothing came out of it
+        if batch.extraction is None:
+            succeeded = any(self.downloads.jobs.state(download_id) == COMPLETED for download_id in batch.download_ids)
+        else:
+            succeeded = any(self.extractor.jobs.state(extraction_id) == COMPLETED
+                            for extraction_id in batch.extraction_ids.values())
+        batch.status = COMPLETED if succeeded else FAILED
+        if not succeeded:
+            batch.error_message = "No video of the batch could be processed"
+
+    def _notify(self, batch: DownloadBatch):
+        """Report a batch's progress."""
+        if self.on_batch_progress:
+            try:
+                self.on_batch_progress(batch.batch_id, self.get_progress(batch))
+            except Exception as e:
+                print(f"Error reporting batch progress: {e}")
@@ -3,9 +3,9 @@ Download manager for StemTubes application.
 Handles downloading YouTube videos and audio using yt-dlp.
 """
 import os
+import glob
 import time
-import threading
-import queue
+import uuid
 import re
 from typing import Dict, List, Optional, Callable, Any
 from dataclasses import dataclass
@@ -18,10 +18,32 @@ from .processed_db import (
     save_download_path,
     remove_download,
 )
+from .file_hashes import file_hash
+from .job_registry import JobRegistry, get_job_registry, QUEUED, ACTIVE, COMPLETED, FAILED
+from .single_flight import SingleFlight
+from .download_scheduler import DownloadScheduler, get_download_scheduler
+from .ytdl_pool import get_ytdl_pool
 
 from .config import get_setting, update_setting, get_ffmpeg_path, DOWNLOADS_DIR, ensure_valid_downloads_directory
 
 
+# Containers YouTube's audio streams end up in when they are not re-encoded
+NATIVE_AUDIO_EXTENSIONS = ['.m4a', '.webm', '.opus', '.ogg', '.mp3']
+
+# Downloads running in the process, keyed by video and format: the same
+# video asked for by several users is fetched and converted once
+_in_flight = SingleFlight()
+
+
+def uses_native_audio() -> bool:
+    """Whether audio downloads keep YouTube's stream instead of becoming MP3.
+    
+    The lossless pipeline (see pcm_cache) needs the native stream too.
+    """
+    return (get_setting("audio_download_format", "mp3") == "native"
+            or get_setting("lossless_audio_pipeline", False))
+
+
 class DownloadType(Enum):
     """Enum for download types."""
     AUDIO = "audio"
@@ -53,23 +75,60 @@ class DownloadItem:
     file_path: str = ""
     error_message: str = ""
     download_id: str = ""
+    file_hash: str = ""
+    downloaded_bytes: int = 0
     
     def __post_init__(self):
         """Generate a unique download ID if not provided."""
         if not self.download_id:
-            self.download_id = f"{self.video_id}_{int(time.time())}"
+            # Unique across users: the job registry is shared by the process
+            self.download_id = f"{self.video_id}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    
+    def journal_payload(self) -> Dict[str, Any]:
+        """What the job journal keeps to queue the download again after a restart."""
+        return {
+            "video_id": self.video_id,
+            "title": self.title,
+            "thumbnail_url": self.thumbnail_url,
+            "download_type": self.download_type.value,
+            "quality": self.quality,
+            "download_id": self.download_id,
+        }
+    
+    @classmethod
+    def from_journal(cls, payload: Dict[str, Any]) -> "DownloadItem":
+        """Rebuild a download from its journal payload."""
+        return cls(
+            video_id=payload["video_id"],
+            title=payload["title"],
+            thumbnail_url=payload["thumbnail_url"],
+            download_type=DownloadType(payload["download_type"]),
+            quality=payload["quality"],
+            download_id=payload["download_id"],
+        )
 
 
 class DownloadManager:
     """Manager for handling YouTube downloads."""
     
-    def __init__(self):
-        """Initialize the download manager."""
-        self.download_queue = queue.Queue()
-        self.active_downloads: Dict[str, DownloadItem] = {}
-        self.completed_downloads: Dict[str, DownloadItem] = {}
-        self.failed_downloads: Dict[str, DownloadItem] = {}
-        self.queued_downloads: Dict[str, DownloadItem] = {}
+    def __init__(self, owner: str = "default", registry: Optional[JobRegistry] = None,
+                 scheduler: Optional[DownloadScheduler] = None):
+        """Initialize the download manager.
+        
+        Args:
+            owner: User the downloads belong to; also the scheduler's key
+                for fair sharing of the download slots.
+            registry: Registry tracking the downloads. Defaults to the
+                process-wide one.
+            scheduler: Scheduler running the downloads. Defaults to the
+                process-wide one.
+        """
+        self.owner = owner
+        self.jobs = registry or get_job_registry("downloads")
+        self.scheduler = scheduler or get_download_scheduler()
+        
+        # Files yt-dlp is writing for each active download, removed if it is cancelled
+        self._download_files: Dict[str, set] = {}
         
         self.max_concurrent_downloads = get_setting("max_concurrent_downloads", 3)
         
@@ -79,10 +138,6 @@ class DownloadManager:
         # Create downloads directory if it doesn't exist
         os.makedirs(self.downloads_directory, exist_ok=True)
         
-        # Start download worker thread
-        self.worker_thread = threading.Thread(target=self._download_worker, daemon=True)
-        self.worker_thread.start()
-        
         # Callbacks
         self.on_download_progress: Optional[Callable[[str, float, str, str], None]] = None
         self.on_download_complete: Optional[Callable[[str, str, str], None]] = None
@@ -98,10 +153,25 @@ class DownloadManager:
         Returns:
             Download ID.
         """
-        self.download_queue.put(item)
-        self.queued_downloads[item.download_id] = item
+        self.jobs.add(item.download_id, item, self.owner)
+        self.scheduler.submit(self.owner, self, item)
         return item.download_id
     
+    def resume_download(self, payload: Dict[str, Any]) -> str:
+        """Queue again a download a restart interrupted.
+        
+        yt-dlp picks up its ``.part`` file where the previous run left it.
+        
+        Args:
+            payload: Journal payload of the download.
+            
+        Returns:
+            Download ID.
+        """
+        item = DownloadItem.from_journal(payload)
+        print(f"Resuming download: {item.download_id}")
+        return self.add_download(item)
+    
     def cancel_download(self, download_id: str) -> bool:
         """Cancel a download.
         
@@ -113,15 +183,17 @@ class DownloadManager:
         """
         print(f"Attempting to cancel download: {download_id}")
         
-        # Check if the download is active
-        if download_id in self.active_downloads:
-            item = self.active_downloads[download_id]
+        item = self.jobs.get(download_id, self.owner)
+        if item is None:
+            print(f"Download not found for cancellation: {download_id}")
+            return False
+        
+        # Check if the download is active; its yt-dlp thread stops at the
+        # next progress update and removes what it wrote, unless other
+        # downloads of the same video still follow it
+        if self.jobs.transition(download_id, FAILED, (ACTIVE,)):
             item.status = DownloadStatus.CANCELLED
             
-            # Move from active to failed
-            del self.active_downloads[download_id]
-            self.failed_downloads[download_id] = item
-            
             # Notify of cancellation
             if self.on_download_error:
                 self.on_download_error(download_id, "Download cancelled by user")
@@ -130,13 +202,9 @@ class DownloadManager:
             return True
         
         # Check if the download is in the queue
-        if download_id in self.queued_downloads:
-            item = self.queued_downloads[download_id]
+        if self.jobs.transition(download_id, FAILED, (QUEUED,)):
             item.status = DownloadStatus.CANCELLED
-            
-            # Move from queue to failed
-            del self.queued_downloads[download_id]
-            self.failed_downloads[download_id] = item
+            self.scheduler.cancel(download_id)
             
             # Notify of cancellation
             if self.on_download_error:
@@ -145,17 +213,8 @@ class DownloadManager:
             print(f"Cancelled queued download: {download_id}")
             return True
         
-        # Check if the download is already completed
-        if download_id in self.completed_downloads:
-            print(f"Cannot cancel completed download: {download_id}")
-            return False
-            
-        # Check if the download is already failed
-        if download_id in self.failed_downloads:
-            print(f"Cannot cancel failed download: {download_id}")
-            return False
-        
-        print(f"Download not found for cancellation: {download_id}")
+        # Already completed or failed
+        print(f"Cannot cancel {self.jobs.state(download_id)} download: {download_id}")
         return False
     
     def get_download_status(self, download_id: str) -> Optional[DownloadItem]:
@@ -167,23 +226,7 @@ class DownloadManager:
         Returns:
             Download item or None if not found.
         """
-        # Check active downloads
-        if download_id in self.active_downloads:
-            return self.active_downloads[download_id]
-        
-        # Check completed downloads
-        if download_id in self.completed_downloads:
-            return self.completed_downloads[download_id]
-        
-        # Check failed downloads
-        if download_id in self.failed_downloads:
-            return self.failed_downloads[download_id]
-        
-        # Check queued downloads
-        if download_id in self.queued_downloads:
-            return self.queued_downloads[download_id]
-        
-        return None
+        return self.jobs.get(download_id, self.owner)
     
     def get_all_downloads(self) -> Dict[str, List[DownloadItem]]:
         """Get all downloads.
@@ -191,41 +234,13 @@ class DownloadManager:
         Returns:
             Dictionary with active, queued, completed, and failed downloads.
         """
-        return {
-            "active": list(self.active_downloads.values()),
-            "queued": list(self.queued_downloads.values()),
-            "completed": list(self.completed_downloads.values()),
-            "failed": list(self.failed_downloads.values())
-        }
-    
-    def _download_worker(self):
-        """Worker thread for processing downloads."""
-        while True:
-            # Check if we can start a new download
-            if len(self.active_downloads) >= self.max_concurrent_downloads:
-                time.sleep(1)
-                continue
-            
-            try:
-                # Get the next download item
-                item = self.download_queue.get(block=False)
-                
-                # Check if the download was cancelled
-                if item.status == DownloadStatus.CANCELLED:
-                    self.failed_downloads[item.download_id] = item
-                    del self.queued_downloads[item.download_id]
-                    self.download_queue.task_done()
-                    continue
-                
-                # Start the download
-                self._start_download(item)
-                
-            except queue.Empty:
-                # No downloads in the queue
-                time.sleep(1)
+        return self.jobs.by_state(self.owner)
     
     def _start_download(self, item: DownloadItem):
-        """Start a download.
+        """Run a download.
+        
+        Called by the scheduler once a slot is available; runs the download
+        to completion in the calling thread.
         
         Args:
             item: Download item to start.
@@ -233,26 +248,31 @@ class DownloadManager:
         # Check if this video was already downloaded
         existing = get_download_path(item.video_id)
         if existing and os.path.exists(existing):
+            if not self.jobs.transition(item.download_id, COMPLETED, (QUEUED,)):
+                return
             item.file_path = existing
             item.status = DownloadStatus.COMPLETED
             item.progress = 100.0
-            del self.queued_downloads[item.download_id]
-            self.completed_downloads[item.download_id] = item
             if self.on_download_complete:
                 self.on_download_complete(item.download_id, item.title, item.file_path)
             return
         elif existing and not os.path.exists(existing):
             remove_download(item.video_id)
 
-        # Update status
+        # Update status, unless it was cancelled meanwhile
+        if not self.jobs.transition(item.download_id, ACTIVE, (QUEUED,)):
+            return
         item.status = DownloadStatus.DOWNLOADING
-        self.active_downloads[item.download_id] = item
-        del self.queued_downloads[item.download_id]
         
         # Notify download start
         if self.on_download_start:
             self.on_download_start(item.download_id)
         
+        # Downloads queued by video ID alone (batches) learn their title now,
+        # from the info the download itself goes on to use
+        if not item.title:
+            self._resolve_title(item)
+        
         # Create individual directory for this YouTube video
         # Sanitize title for use as directory name
         safe_title = "".join([c if c.isalnum() or c in " -_" else "_" for c in item.title]).strip()
@@ -263,7 +283,11 @@ class DownloadManager:
         os.makedirs(output_dir, exist_ok=True)
 
         # Check on disk for an existing file
-        exts = ['.mp3'] if item.download_type == DownloadType.AUDIO else ['.mp4', '.mkv', '.webm']
+        native_audio = uses_native_audio()
+        if item.download_type == DownloadType.AUDIO:
+            exts = NATIVE_AUDIO_EXTENSIONS if native_audio else ['.mp3']
+        else:
+            exts = ['.mp4', '.mkv', '.webm']
         existing_file = None
         for f in os.listdir(output_dir):
             if os.path.splitext(f)[1].lower() in exts:
@@ -271,21 +295,34 @@ class DownloadManager:
                 break
 
         if existing_file and os.path.exists(existing_file):
+            if not self.jobs.transition(item.download_id, COMPLETED, (ACTIVE,)):
+                return
             item.file_path = existing_file
             item.status = DownloadStatus.COMPLETED
             item.progress = 100.0
-            del self.queued_downloads[item.download_id]
-            self.completed_downloads[item.download_id] = item
             save_download_path(item.video_id, item.file_path)
             if self.on_download_complete:
                 self.on_download_complete(item.download_id, item.title, item.file_path)
             return
         
+        # Follow the download of the same video and format if one is running:
+        # its progress and result are passed on to this one
+        key = (item.video_id, item.download_type.value, self._get_format_string(item), native_audio)
+        if not _in_flight.join(key, (self, item)):
+            print(f"Download {item.download_id} follows the running download of {item.video_id}")
+            return
+        
         # Configure yt-dlp options
         ydl_opts = {
             'format': self._get_format_string(item),
-            'outtmpl': {'default': os.path.join(output_dir, '%(title)s.%(ext)s')},
-            'progress_hooks': [lambda d: self._progress_hook(d, item)],
+            # The directory is passed in 'paths' so the outtmpl stays the same
+            # for every download and pooled YoutubeDL instances can be reused
+            'outtmpl': {'default': '%(title)s.%(ext)s'},
+            'paths': {'home': output_dir},
+            'progress_hooks': [lambda d: self._progress_hook(d, item, key)],
+            'postprocessor_hooks': [lambda d: self._postprocessor_hook(d, item, key)],
+            # Resume the .part file of a download a restart interrupted
+            'continuedl': True,
             'ffmpeg_location': get_ffmpeg_path(),
             'ignoreerrors': True,
             'quiet': True,
@@ -295,6 +332,15 @@ class DownloadManager:
         if item.download_type == DownloadType.AUDIO:
             # Configuration spécifique pour l'audio inspirée de l'implémentation originale
             ydl_opts['format'] = 'bestaudio/best'
+        
+        # Native audio keeps YouTube's stream: it is only remuxed (stream copy)
+        # out of its WebM container into .opus or .m4a, never re-encoded
+        if item.download_type == DownloadType.AUDIO and native_audio:
+            ydl_opts['postprocessors'] = [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'best',
+            }]
+        elif item.download_type == DownloadType.AUDIO:
             ydl_opts['postprocessors'] = [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
@@ -311,25 +357,33 @@ class DownloadManager:
                 '-b:a', '192k',  # Set audio bitrate explicitly
             ]
         
-        # Start download in a separate thread
-        download_thread = threading.Thread(
-            target=self._download_thread,
-            args=(f"https://www.youtube.com/watch?v={item.video_id}", ydl_opts, item),
-            daemon=True
-        )
-        download_thread.start()
+        # Download in the scheduler's slot thread, which is freed on return
+        self._run_download(f"https://www.youtube.com/watch?v={item.video_id}", ydl_opts, item, key, native_audio)
     
-    def _download_thread(self, url: str, ydl_opts: Dict[str, Any], item: DownloadItem):
-        """Thread for downloading a video.
+    def _run_download(self, url: str, ydl_opts: Dict[str, Any], item: DownloadItem, key: tuple,
+                      native_audio: bool = False):
+        """Download a video with yt-dlp.
         
         Args:
             url: YouTube URL.
             ydl_opts: yt-dlp options.
-            item: Download item.
+            item: Download item leading the run.
+            key: Key of the run in the in-flight table.
+            native_audio: Whether audio is kept in its native codec.
         """
+        members = []
+        pool = get_ytdl_pool()
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+            # A pooled instance of these options, and the video's info if it
+            # was resolved moments ago
+            with pool.session(ydl_opts) as ydl:
+                info = pool.download(ydl, url, item.video_id)
+                
+                if not self._live_members(key):
+                    members = _in_flight.finish(key)
+                    self._remove_download_files(item)
+                    return
+                self._download_files.pop(item.download_id, None)
                 
                 # Get the downloaded file path
                 if info:
@@ -337,16 +391,16 @@ class DownloadManager:
                         # Playlist
                         info = info['entries'][0]
                     
-                    # Get file extension
-                    ext = 'mp3' if item.download_type == DownloadType.AUDIO else info.get('ext', 'mp4')
-                    
                     # Get file path - outtmpl is now a dictionary
                     file_path = ydl_opts.get('outtmpl', {}).get('default')
                     if file_path:
                         # Replace placeholders with actual values
                         filename = ydl.prepare_filename(info)
                         
-                        if item.download_type == DownloadType.AUDIO:
+                        if item.download_type == DownloadType.AUDIO and native_audio:
+                            # The remux gives the file the extension of its codec
+                            filename = self._native_audio_path(info, filename)
+                        elif item.download_type == DownloadType.AUDIO and 'postprocessors' in ydl_opts:
                             # For audio, yt-dlp changes the extension to mp3
                             filename = os.path.splitext(filename)[0] + '.mp3'
                             
@@ -366,74 +420,154 @@ class DownloadManager:
                         # Update file path
                         item.file_path = filename
                     
-                    # Update status
-                    item.status = DownloadStatus.COMPLETED
-                    item.progress = 100.0
+                    # Hash the file while it is still in the page cache, so the
+                    # first extraction finds it in the hash index
+                    if item.file_path and os.path.exists(item.file_path):
+                        try:
+                            item.file_hash = file_hash(item.file_path)
+                        except OSError as e:
+                            print(f"Could not hash {item.file_path}: {e}")
+                    
+                    # Record the file before ending the run, so a download of
+                    # the same video asked for from now on finds it
+                    save_download_path(item.video_id, item.file_path)
+                    members = _in_flight.finish(key)
+                    
+                    # Move every download of the run from active to completed,
+                    # unless it was cancelled meanwhile
+                    completed = []
+                    for manager, member in members:
+                        if not manager.jobs.transition(member.download_id, COMPLETED, (ACTIVE,)):
+                            continue
+                        member.file_path = item.file_path
+                        member.file_hash = item.file_hash
+                        member.status = DownloadStatus.COMPLETED
+                        member.progress = 100.0
+                        completed.append((manager, member))
+                        
+                        # Assurez-vous que la progression atteint 100% dans l'interface
+                        if manager.on_download_progress:
+                            manager.on_download_progress(
+                                member.download_id,
+                                100.0,  # Force 100%
+                                "",     # Pas de vitesse à afficher une fois terminé
+                                ""      # Pas d'ETA à afficher une fois terminé
+                            )
                     
-                    # Assurez-vous que la progression atteint 100% dans l'interface
-                    if self.on_download_progress:
-                        self.on_download_progress(
-                            item.download_id,
-                            100.0,  # Force 100%
-                            "",     # Pas de vitesse à afficher une fois terminé
-                            ""      # Pas d'ETA à afficher une fois terminé
-                        )
+                    if not completed:
+                        remove_download(item.video_id)
+                        self._download_files[item.download_id] = {item.file_path}
+                        self._remove_download_files(item)
+                        return
                     
                     # Attendre un court instant pour que la mise à jour à 100% soit visible
                     time.sleep(0.2)
                     
-                    # Move from active to completed
-                    if item.download_id in self.active_downloads:
-                        del self.active_downloads[item.download_id]
-                    self.completed_downloads[item.download_id] = item
-                    save_download_path(item.video_id, item.file_path)
-                    
                     # Notify completion
-                    if self.on_download_complete:
-                        self.on_download_complete(
-                            item.download_id,
-                            item.title,
-                            item.file_path
-                        )
+                    for manager, member in completed:
+                        if manager.on_download_complete:
+                            manager.on_download_complete(
+                                member.download_id,
+                                member.title,
+                                member.file_path
+                            )
                         
-                    print(f"Download completed: {item.title}")
+                    print(f"Download completed: {item.title} ({len(completed)} request(s))")
                     return
                 
             # If we get here, the download failed
-            item.status = DownloadStatus.ERROR
-            item.error_message = "Failed to download video"
-            
-            # Move from active to failed
-            if item.download_id in self.active_downloads:
-                del self.active_downloads[item.download_id]
-            self.failed_downloads[item.download_id] = item
-            
-            # Notify error
-            if self.on_download_error:
-                self.on_download_error(
-                    item.download_id,
-                    "Failed to download video"
-                )
+            pool.forget(item.video_id)
+            members = _in_flight.finish(key)
+            self._fail_members(members, "Failed to download video")
                 
+        except yt_dlp.utils.DownloadCancelled:
+            members = _in_flight.finish(key)
+            self._remove_download_files(item)
+            # Downloads that joined after the last progress update
+            self._fail_members(members, "Download cancelled")
+            
         except Exception as e:
+            # The run may already be over if the error came after it
+            members = members or _in_flight.finish(key)
+            if members and all(member.status == DownloadStatus.CANCELLED for _, member in members):
+                self._remove_download_files(item)
+                return
+            self._download_files.pop(item.download_id, None)
+            
             # Handle exception
             error_message = str(e)
             print(f"Download error: {error_message}")
+            # The cached stream URLs may be the ones that failed
+            pool.forget(item.video_id)
             
-            item.status = DownloadStatus.ERROR
-            item.error_message = error_message
-            
-            # Move from active to failed
-            if item.download_id in self.active_downloads:
-                del self.active_downloads[item.download_id]
-            self.failed_downloads[item.download_id] = item
+            # Move from active to failed; with the run already ended (or
+            # never found), at least this download is
+            self._fail_members(members or [(self, item)], error_message)
+    
+    def _live_members(self, key: tuple) -> List[tuple]:
+        """(manager, item) pairs of a run's downloads that are not cancelled."""
+        return [(manager, member) for manager, member in _in_flight.members(key)
+                if member.status != DownloadStatus.CANCELLED]
+    
+    def _fail_members(self, members: List[tuple], error_message: str):
+        """Move the downloads of a run from active to failed and notify them.
+        
+        Args:
+            members: (manager, item) pairs of the run.
+            error_message: Error to report.
+        """
+        for manager, member in members:
+            if not manager.jobs.transition(member.download_id, FAILED, (ACTIVE,)):
+                continue
+            member.status = DownloadStatus.ERROR
+            member.error_message = error_message
             
             # Notify error
-            if self.on_download_error:
-                self.on_download_error(
-                    item.download_id,
-                    error_message
-                )
+            if manager.on_download_error:
+                manager.on_download_error(member.download_id, error_message)
+    
+    def _resolve_title(self, item: DownloadItem):
+        """Fill in the title and thumbnail of a download queued without them.
+        
+        The info lands in the yt-dlp pool's cache, so the download does not
+        resolve it again.
+        
+        Args:
+            item: Download item to complete.
+        """
+        pool = get_ytdl_pool()
+        info = None
+        try:
+            with pool.session({'ignoreerrors': True, 'quiet': True}) as ydl:
+                info = pool.extract_info(ydl, f"https://www.youtube.com/watch?v={item.video_id}", item.video_id)
+        except Exception as e:
+            print(f"Could not resolve the title of {item.video_id}: {e}")
+        
+        info = info or {}
+        item.title = info.get('title') or item.video_id
+        if not item.thumbnail_url:
+            item.thumbnail_url = info.get('thumbnail') or f"https://i.ytimg.com/vi/{item.video_id}/hqdefault.jpg"
+    
+    def _native_audio_path(self, info: Dict[str, Any], filename: str) -> str:
+        """Find the file a native audio download ended up in.
+        
+        Args:
+            info: yt-dlp info dictionary of the download.
+            filename: Path yt-dlp downloaded the stream to, before the remux.
+            
+        Returns:
+            Path of the remuxed file, or ``filename`` if it was kept as is.
+        """
+        # Recorded by yt-dlp once the postprocessors have run
+        for download in info.get('requested_downloads') or []:
+            if download.get('filepath') and os.path.exists(download['filepath']):
+                return download['filepath']
+        
+        base_filename = os.path.splitext(filename)[0]
+        for possible_ext in NATIVE_AUDIO_EXTENSIONS:
+            if os.path.exists(base_filename + possible_ext):
+                return base_filename + possible_ext
+        return filename
     
     def _convert_to_mp3(self, input_file: str, output_file: str):
         """Convertir un fichier audio en MP3 en utilisant FFmpeg.
@@ -473,14 +607,37 @@ class DownloadManager:
             print(f"Error converting file to MP3: {e}")
             return False
     
-    def _progress_hook(self, d: Dict[str, Any], item: DownloadItem):
+    def _progress_hook(self, d: Dict[str, Any], item: DownloadItem, key: tuple):
         """Progress hook for yt-dlp.
         
         Args:
             d: Progress information from yt-dlp.
-            item: Download item.
+            item: Download item leading the run.
+            key: Key of the run in the in-flight table.
         """
+        # Abort the download from inside yt-dlp once every download of the
+        # run is cancelled
+        live = self._live_members(key)
+        if not live:
+            raise yt_dlp.utils.DownloadCancelled()
+        
+        # Remember what is being written, to clean up after a cancellation
+        files = self._download_files.setdefault(item.download_id, set())
+        for name in ('filename', 'tmpfilename'):
+            if d.get(name):
+                files.add(d[name])
+        
         if d['status'] == 'downloading':
+            # Hold the download back while the host is over its bandwidth
+            # limit. The first update of each file (yt-dlp counts from zero
+            # again, or from a resumed .part file) only sets the baseline
+            downloaded = d.get('downloaded_bytes') or 0
+            received = 0
+            if item.downloaded_bytes and downloaded >= item.downloaded_bytes:
+                received = downloaded - item.downloaded_bytes
+            item.downloaded_bytes = downloaded
+            self.scheduler.throttle(received)
+            
             # Calculate progress
             if 'total_bytes' in d:
                 total = d['total_bytes']
@@ -496,18 +653,7 @@ class DownloadManager:
             item.eta = self._clean_ansi_codes(d.get('_eta_str', ''))
             
             # Notify progress - always call the callback to ensure UI updates
-            if self.on_download_progress:
-                # S'assurer que l'item est dans active_downloads
-                if item.download_id not in self.active_downloads and item.status != DownloadStatus.CANCELLED:
-                    self.active_downloads[item.download_id] = item
-                    
-                # Envoyer la mise à jour de progression
-                self.on_download_progress(
-                    item.download_id,
-                    item.progress,
-                    item.speed,
-                    item.eta
-                )
+            self._notify_progress(live, item)
         
         elif d['status'] == 'finished':
             # Download finished, now processing
@@ -516,26 +662,61 @@ class DownloadManager:
             item.eta = ""
             
             # Notify progress
-            if self.on_download_progress:
-                self.on_download_progress(
-                    item.download_id,
-                    item.progress,
-                    item.speed,
-                    item.eta
-                )
+            self._notify_progress(live, item)
         
         elif d['status'] == 'error':
             # Download error
-            item.status = DownloadStatus.ERROR
-            item.error_message = d.get('error', 'Unknown error')
-            
-            # Move from active to failed
-            del self.active_downloads[item.download_id]
-            self.failed_downloads[item.download_id] = item
-            
-            # Notify download error
-            if self.on_download_error:
-                self.on_download_error(item.download_id, item.error_message)
+            self._fail_members(live, d.get('error', 'Unknown error'))
+    
+    def _notify_progress(self, members: List[tuple], item: DownloadItem):
+        """Pass the progress of a run's leader on to every download of the run.
+        
+        Args:
+            members: (manager, item) pairs of the run that are not cancelled.
+            item: Download item leading the run.
+        """
+        for manager, member in members:
+            member.progress = item.progress
+            member.speed = item.speed
+            member.eta = item.eta
+            if manager.on_download_progress:
+                # Envoyer la mise à jour de progression
+                manager.on_download_progress(
+                    member.download_id,
+                    member.progress,
+                    member.speed,
+                    member.eta
+                )
+    
+    def _postprocessor_hook(self, d: Dict[str, Any], item: DownloadItem, key: tuple):
+        """Postprocessor hook for yt-dlp: stops the conversion of a cancelled download.
+        
+        Args:
+            d: Postprocessor information from yt-dlp.
+            item: Download item leading the run.
+            key: Key of the run in the in-flight table.
+        """
+        filepath = d.get('info_dict', {}).get('filepath')
+        if filepath:
+            self._download_files.setdefault(item.download_id, set()).add(filepath)
+        
+        if not self._live_members(key):
+            raise yt_dlp.utils.DownloadCancelled()
+    
+    def _remove_download_files(self, item: DownloadItem):
+        """Delete the partial and finished files of a cancelled download.
+        
+        Args:
+            item: Cancelled download item.
+        """
+        for path in self._download_files.pop(item.download_id, set()):
+            # Covers yt-dlp's .part, .ytdl and fragment files
+            for leftover in glob.glob(glob.escape(path) + '*'):
+                try:
+                    os.remove(leftover)
+                except OSError as e:
+                    print(f"Could not remove {leftover}: {e}")
+        print(f"Download cancelled: {item.title}")
     
     def _clean_ansi_codes(self, text: str) -> str:
         """Nettoyer les codes ANSI d'une chaîne de caractères.
@@ -589,6 +770,7 @@ class DownloadManager:
         """
         self.max_concurrent_downloads = max(1, max_downloads)
         update_setting("max_concurrent_downloads", self.max_concurrent_downloads)
+        self.scheduler.wake()
     
     def set_downloads_directory(self, directory: str) -> bool:
         """Set the downloads directory.
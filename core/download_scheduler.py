@@ -0,0 +1,254 @@
+"""
+Download scheduler for StemTubes application.
+Runs the downloads of every session on a shared pool of slots, fairly
+between users and under a host-wide bandwidth limit.
+"""
+import time
+import itertools
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from .config import get_setting
+
+
+# Bytes per second in one megabit per second
+BYTES_PER_MBPS = 125000
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens a second.
+
+    A consumer takes what it used and, if that puts the bucket in debt,
+    sleeps until the debt is paid back, so however many consumers share the
+    bucket their combined rate stays at ``rate``.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Initialize the bucket.
+
+        Args:
+            rate: Tokens added per second; 0 disables the limit.
+            capacity: Most tokens the bucket holds, i.e. the largest burst.
+                Defaults to one second's worth.
+        """
+        self._lock = threading.Lock()
+        self.set_rate(rate, capacity)
+
+    def set_rate(self, rate: float, capacity: Optional[float] = None):
+        """Change the refill rate (0 disables the limit)."""
+        with self._lock:
+            self.rate = max(0.0, float(rate))
+            self.capacity = capacity or self.rate
+            self._tokens = self.capacity
+            self._updated = time.monotonic()
+
+    def consume(self, amount: float):
+        """Take tokens, sleeping until the bucket can afford them."""
+        with self._lock:
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class DownloadScheduler:
+    """Process-wide executor for downloads.
+
+    Each session keeps its own DownloadManager (its view of its downloads
+    and its Socket.IO callbacks), but yt-dlp only runs in the slots handed
+    out here, so the limits hold for the whole host:
+
+    - ``download_slots`` downloads run at once.
+    - A user runs at most ``max_concurrent_downloads`` of them.
+    - A free slot goes to the user with the fewest downloads running, then
+      to the one whose next download has waited longest, so a user queueing
+      a playlist does not hold everybody else's single videos back.
+    - ``download_bandwidth_mbps`` caps the combined transfer rate.
+    """
+
+    def __init__(self, slots: Optional[int] = None, bandwidth_mbps: Optional[float] = None):
+        """Initialize the scheduler.
+
+        Args:
+            slots: Maximum number of downloads running at once. Defaults to
+                the ``download_slots`` setting.
+            bandwidth_mbps: Combined download rate limit in megabits per
+                second, 0 for none. Defaults to the ``download_bandwidth_mbps``
+                setting.
+        """
+        if not slots:
+            slots = get_setting("download_slots", 4)
+        self.slots = max(1, int(slots))
+
+        if bandwidth_mbps is None:
+            bandwidth_mbps = get_setting("download_bandwidth_mbps", 0)
+        self.bandwidth_mbps = max(0.0, float(bandwidth_mbps or 0))
+        self.bucket = TokenBucket(self.bandwidth_mbps * BYTES_PER_MBPS)
+
+        self._cond = threading.Condition()
+        # Per owner, a FIFO of (sequence, manager, item)
+        self._queues: Dict[str, Deque[Tuple[int, Any, Any]]] = {}
+        self._sequence = itertools.count()
+        # Download ID to owner of every running download
+        self._running: Dict[str, str] = {}
+
+        # Start dispatcher thread
+        self.dispatcher_thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self.dispatcher_thread.start()
+
+    def submit(self, owner: str, manager, item):
+        """Queue a download.
+
+        Args:
+            owner: Fairness key (usually the user the session belongs to).
+            manager: DownloadManager that owns the item; its
+                ``_start_download`` is called in a slot of its own, and its
+                ``max_concurrent_downloads`` caps the owner's running downloads.
+            item: Download item to run.
+        """
+        with self._cond:
+            self._queues.setdefault(owner, deque()).append((next(self._sequence), manager, item))
+            self._cond.notify_all()
+
+    def cancel(self, download_id: str) -> bool:
+        """Remove a queued download.
+
+        Args:
+            download_id: ID of the download to remove.
+
+        Returns:
+            True if the download was still queued, False otherwise.
+        """
+        with self._cond:
+            for owner, jobs in self._queues.items():
+                for job in jobs:
+                    if job[2].download_id == download_id:
+                        jobs.remove(job)
+                        if not jobs:
+                            del self._queues[owner]
+                        return True
+        return False
+
+    def throttle(self, num_bytes: int):
+        """Account for bytes a download received, sleeping if over the bandwidth limit."""
+        if num_bytes > 0:
+            self.bucket.consume(num_bytes)
+
+    def wake(self):
+        """Look at the queues again, e.g. after a per-user limit was raised."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def set_slots(self, slots: int):
+        """Change the number of concurrent downloads.
+
+        Args:
+            slots: New slot budget.
+        """
+        with self._cond:
+            self.slots = max(1, int(slots))
+            self._cond.notify_all()
+
+    def set_bandwidth(self, bandwidth_mbps: float):
+        """Change the combined download rate limit.
+
+        Args:
+            bandwidth_mbps: Megabits per second, 0 for none.
+        """
+        self.bandwidth_mbps = max(0.0, float(bandwidth_mbps or 0))
+        self.bucket.set_rate(self.bandwidth_mbps * BYTES_PER_MBPS)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get a snapshot of the scheduler state.
+
+        Returns:
+            Dictionary with slot budget, bandwidth limit, running and queued
+            counts.
+        """
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "bandwidth_mbps": self.bandwidth_mbps,
+                "running": len(self._running),
+                "running_by_owner": self._running_by_owner(),
+                "queued": sum(len(jobs) for jobs in self._queues.values()),
+                "queued_by_owner": {owner: len(jobs) for owner, jobs in self._queues.items()},
+            }
+
+    def _running_by_owner(self) -> Dict[str, int]:
+        """Number of running downloads of each owner. Caller holds the lock."""
+        counts: Dict[str, int] = {}
+        for owner in self._running.values():
+            counts[owner] = counts.get(owner, 0) + 1
+        return counts
+
+    def _next_job(self) -> Optional[Tuple[str, Any, Any]]:
+        """Pop the next job, or None if no owner may start one. Caller holds the lock."""
+        if len(self._running) >= self.slots:
+            return None
+
+        running = self._running_by_owner()
+        best = None
+        for owner, jobs in self._queues.items():
+            sequence, manager, _ = jobs[0]
+            if running.get(owner, 0) >= manager.max_concurrent_downloads:
+                continue
+            key = (running.get(owner, 0), sequence)
+            if best is None or key < best[0]:
+                best = (key, owner)
+        if best is None:
+            return None
+
+        owner = best[1]
+        jobs = self._queues[owner]
+        _, manager, item = jobs.popleft()
+        if not jobs:
+            del self._queues[owner]
+        return owner, manager, item
+
+    def _dispatch_loop(self):
+        """Start queued downloads whenever a slot is free."""
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                owner, manager, item = job
+                self._running[item.download_id] = owner
+
+            threading.Thread(
+                target=self._run_job,
+                args=(manager, item),
+                daemon=True
+            ).start()
+
+    def _run_job(self, manager, item):
+        """Run a download and free its slot afterwards."""
+        try:
+            manager._start_download(item)
+        except Exception as e:
+            print(f"Unexpected error running download {item.download_id}: {e}")
+        finally:
+            with self._cond:
+                self._running.pop(item.download_id, None)
+                self._cond.notify_all()
+
+
+# Create a singleton instance
+_download_scheduler = None
+_download_scheduler_lock = threading.Lock()
+
+def get_download_scheduler() -> DownloadScheduler:
+    """Get the download scheduler singleton instance."""
+    global _download_scheduler
+    with _download_scheduler_lock:
+        if _download_scheduler is None:
+            _download_scheduler = DownloadScheduler()
+    return _download_scheduler
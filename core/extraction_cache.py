@@ -0,0 +1,228 @@
+"""
+Extraction cache for StemTubes application.
+Serves a finished extraction again only when it matches a request exactly
+(same audio, model, stem set, two-stem mode and output format), and keeps
+the cached stems within a disk budget by evicting the least recently used.
+"""
+import os
+import json
+import time
+import hashlib
+from typing import Dict, List, Optional, Any
+
+from .config import get_setting, get_stem_recipe
+from .stem_encoder import DEFAULT_FORMAT
+from .processed_db import (
+    get_cache_entry,
+    save_cache_entry,
+    touch_cache_entry,
+    remove_cache_entry,
+    get_cache_entries_in_dir,
+    get_cache_entries_for_audio,
+    get_cache_entries_lru,
+    get_cache_size,
+)
+
+
+# Format assumed when a caller does not name one
+OUTPUT_FORMAT = DEFAULT_FORMAT
+
+
+def stem_variant(model_name: str, selected_stems: List[str], two_stem_mode: bool,
+                 primary_stem: str) -> str:
+    """Describe the stems a request produces, in a canonical form.
+
+    Each output stem is listed with the model stems mixed into it, e.g.
+    ``other=bass+drums+other,vocals`` for two-stem vocals.
+    """
+    recipe = get_stem_recipe(model_name, selected_stems, two_stem_mode, primary_stem)
+    return ",".join(
+        name if parts == [name] else f"{name}={'+'.join(sorted(parts))}"
+        for name, parts in sorted(recipe.items())
+    )
+
+
+def cache_key(audio_hash: str, model_name: str, selected_stems: List[str], two_stem_mode: bool,
+              primary_stem: str, output_format: str = OUTPUT_FORMAT) -> str:
+    """Key identifying one exact extraction result."""
+    variant = stem_variant(model_name, selected_stems, two_stem_mode, primary_stem)
+    raw = json.dumps([audio_hash, model_name, variant, output_format])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _signature(paths: List[str]) -> Dict[str, List[int]]:
+    """Size and modification time of each file, to notice later rewrites."""
+    signature = {}
+    for path in paths:
+        stat = os.stat(path)
+        signature[path] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def _entry_paths(entry: Dict[str, Any]) -> List[str]:
+    return list(json.loads(entry["output_paths"]).values())
+
+
+def _is_intact(entry: Dict[str, Any]) -> bool:
+    """Whether an entry's stems are still exactly as they were recorded."""
+    paths = _entry_paths(entry)
+    recorded = json.loads(entry["signature"])
+    try:
+        # Entries from before archives were streamed also signed their ZIP
+        return _signature(paths) == {path: recorded[path] for path in paths if path in recorded}
+    except OSError:
+        return False
+
+
+def _plain_stems(entry: Dict[str, Any]) -> Dict[str, str]:
+    """Stems of an entry that came straight out of the model, not mixed."""
+    output_paths = json.loads(entry["output_paths"])
+    mixed = {name for name, parts in get_stem_recipe(
+        entry["model_name"], list(output_paths), False).items() if parts != [name]}
+    if entry["two_stem_mode"]:
+        mixed.add("other")
+    return {name: path for name, path in output_paths.items() if name not in mixed}
+
+
+def find_source(audio_hash: str, model_name: str, selected_stems: List[str], two_stem_mode: bool,
+                primary_stem: str, output_format: str = OUTPUT_FORMAT) -> Optional[Dict[str, Any]]:
+    """Find a cached extraction the requested stems can be mixed from.
+
+    Any stem set can be built from an earlier result of the same model that
+    holds, unmixed, every model stem the request uses (see
+    separation.derive_stems).
+
+    Returns:
+        Dictionary with ``output_dir``, ``output_paths`` (the usable stems)
+        and ``recipe``, or None if no cached result will do.
+    """
+    recipe = get_stem_recipe(model_name, selected_stems, two_stem_mode, primary_stem)
+    needed = {part for parts in recipe.values() for part in parts}
+
+    for entry in get_cache_entries_for_audio(audio_hash):
+        if entry["model_name"] != model_name or entry["output_format"] != output_format:
+            continue
+        plain = _plain_stems(entry)
+        if not needed <= set(plain) or not _is_intact(entry):
+            continue
+
+        touch_cache_entry(entry["cache_key"], time.time())
+        return {
+            "output_dir": entry["output_dir"],
+            "output_paths": plain,
+            "recipe": recipe,
+        }
+
+    return None
+
+
+def lookup(audio_hash: str, model_name: str, selected_stems: List[str], two_stem_mode: bool,
+           primary_stem: str, output_format: str = OUTPUT_FORMAT) -> Optional[Dict[str, Any]]:
+    """Find a cached extraction matching a request.
+
+    The entry is dropped instead if any of its files went missing or was
+    rewritten since (for instance by another model writing to the same
+    directory).
+
+    Returns:
+        Dictionary with ``output_dir`` and ``output_paths``, or None on a miss.
+    """
+    key = cache_key(audio_hash, model_name, selected_stems, two_stem_mode, primary_stem, output_format)
+    entry = get_cache_entry(key)
+    if not entry:
+        return None
+
+    if not _is_intact(entry):
+        print(f"Cached extraction in {entry['output_dir']} changed on disk, discarding it")
+        remove_cache_entry(key)
+        return None
+
+    touch_cache_entry(key, time.time())
+    return {
+        "output_dir": entry["output_dir"],
+        "output_paths": json.loads(entry["output_paths"]),
+    }
+
+
+def store(audio_hash: str, model_name: str, selected_stems: List[str], two_stem_mode: bool,
+          primary_stem: str, output_dir: str, output_paths: Dict[str, str],
+          output_format: str = OUTPUT_FORMAT):
+    """Record a finished extraction, then evict old ones over the disk budget.
+
+    Args:
+        audio_hash: Hash of the source audio.
+        model_name: Demucs model name.
+        selected_stems: Stems requested.
+        two_stem_mode: Whether primary/other only was requested.
+        primary_stem: Primary stem for two-stem mode.
+        output_dir: Directory holding the stems.
+        output_paths: Dictionary of stem name to file path.
+        output_format: Audio format of the stems.
+    """
+    key = cache_key(audio_hash, model_name, selected_stems, two_stem_mode, primary_stem, output_format)
+    paths = list(output_paths.values())
+
+    # Older results whose files were just overwritten are no longer valid
+    for entry in get_cache_entries_in_dir(output_dir):
+        if entry["cache_key"] != key and set(_entry_paths(entry)) & set(paths) and not _is_intact(entry):
+            remove_cache_entry(entry["cache_key"])
+
+    signature = _signature(paths)
+    now = time.time()
+    save_cache_entry({
+        "cache_key": key,
+        "audio_hash": audio_hash,
+        "model_name": model_name,
+        "stems": stem_variant(model_name, selected_stems, two_stem_mode, primary_stem),
+        "two_stem_mode": int(bool(two_stem_mode)),
+        "output_format": output_format,
+        "output_dir": output_dir,
+        "output_paths": json.dumps(output_paths),
+        "signature": json.dumps(signature),
+        "size_bytes": sum(size for size, _ in signature.values()),
+        "created_at": now,
+        "last_access": now,
+    })
+
+    evict(keep=key)
+
+
+def evict(keep: Optional[str] = None) -> int:
+    """Delete least recently used results until the cache fits its budget.
+
+    The budget is the ``extraction_cache_max_gb`` setting; 0 means no limit.
+
+    Args:
+        keep: Cache key never to evict (the result just produced).
+
+    Returns:
+        Number of bytes freed.
+    """
+    max_bytes = float(get_setting("extraction_cache_max_gb", 0) or 0) * 1024 ** 3
+    if max_bytes <= 0:
+        return 0
+
+    total = get_cache_size()
+    freed = 0
+    for entry in get_cache_entries_lru():
+        if total <= max_bytes:
+            break
+        if entry["cache_key"] == keep:
+            continue
+
+        for path in _entry_paths(entry):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        try:
+            os.rmdir(entry["output_dir"])
+        except OSError:
+            pass  # Still holds other files
+
+        remove_cache_entry(entry["cache_key"])
+        total -= entry["size_bytes"]
+        freed += entry["size_bytes"]
+        print(f"Evicted cached extraction {entry['output_dir']} ({entry['model_name']}, {entry['stems']})")
+
+    return freed
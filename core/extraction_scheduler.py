@@ -0,0 +1,286 @@
+"""
+Extraction scheduler for StemTubes application.
+Dispatches stem extractions from every session onto a shared pool of slots.
+"""
+import time
+import heapq
+import itertools
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import get_setting
+
+
+# Priority classes, most urgent first
+PRIORITIES = {
+    "admin": 0,
+    "interactive": 1,
+    "background": 2,
+}
+DEFAULT_PRIORITY = "interactive"
+
+
+def check_priority(priority: Optional[str]) -> str:
+    """Validate a priority class name, defaulting to DEFAULT_PRIORITY.
+
+    Raises:
+        ValueError: If the priority is not one of PRIORITIES.
+    """
+    priority = (priority or DEFAULT_PRIORITY).lower()
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority} (expected one of {', '.join(PRIORITIES)})")
+    return priority
+
+
+class ExtractionScheduler:
+    """Process-wide dispatcher for stem extractions.
+
+    Each session keeps its own StemsExtractor (and therefore its own view of
+    its jobs and its own Socket.IO callbacks), but the actual Demucs runs are
+    admitted here so the slot budget applies to the whole host.
+
+    Jobs are ordered by priority class, then shortest predicted slot time
+    first, so a two-hour concert does not hold twenty songs behind it:
+
+    - Priority: each class below the most urgent adds
+      ``extraction_class_age_seconds`` to a job's cost.
+    - Aging: every second a job waits takes ``extraction_aging_rate``
+      seconds off its cost, so long jobs cannot starve, whatever their
+      class. A job of cost C and class rank R (0 for admin) is passed by
+      no job submitted more than (R * class_age_seconds + C) / aging_rate
+      seconds after it; fairness between owners only shifts that bound by
+      the difference in slot time they have been given.
+    - Owner fairness: jobs are queued per owner, and each owner's cost is
+      raised by the slot time it has been given since it last had nothing
+      queued. One user queueing an album therefore alternates with
+      everybody else's single tracks rather than going first.
+    """
+
+    def __init__(self, slots: Optional[int] = None):
+        """Initialize the scheduler.
+
+        Args:
+            slots: Maximum number of extractions running at once. Defaults to
+                the ``extraction_slots`` setting, or ``extraction_workers``
+                when the worker pool is larger.
+        """
+        if not slots:
+            # A worker pool can run as many jobs as it has workers
+            slots = max(int(get_setting("extraction_slots", 1)), int(get_setting("extraction_workers", 0) or 0))
+        self.slots = max(1, int(slots))
+
+        self.aging_rate = float(get_setting("extraction_aging_rate", 1.0) or 0)
+        self.class_age_seconds = float(get_setting("extraction_class_age_seconds", 3600) or 0)
+
+        self._cond = threading.Condition()
+        # Per owner, a heap of (aged cost, sequence, priority rank, cost, extractor, item)
+        self._queues: Dict[str, List[Tuple[float, int, int, float, Any, Any]]] = {}
+        # Predicted slot seconds given to each owner with jobs queued
+        self._served: Dict[str, float] = {}
+        self._sequence = itertools.count()
+        self._running: Dict[str, Any] = {}
+
+        # Start dispatcher thread
+        self.dispatcher_thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self.dispatcher_thread.start()
+
+    def submit(self, owner: str, extractor, item, priority: str = DEFAULT_PRIORITY, cost: float = 0.0):
+        """Queue an extraction.
+
+        Args:
+            owner: Fairness key (usually the user the session belongs to).
+            extractor: StemsExtractor that owns the item; its
+                ``_start_extraction`` is called when a slot is available.
+            item: Extraction item to run.
+            priority: One of PRIORITIES.
+            cost: Predicted seconds the job will hold its slot.
+        """
+        with self._cond:
+            self._add_owner(owner, self._queues, self._served)
+            heapq.heappush(self._queues[owner], self._entry(priority, cost, time.time(), extractor, item))
+            self._cond.notify_all()
+
+    def _entry(self, priority: str, cost: float, submitted_at: float,
+               extractor, item) -> Tuple[float, int, int, float, Any, Any]:
+        """Build a queue entry.
+
+        The priority class counts as ``rank * class_age_seconds`` of cost, so
+        waiting lowers a job's class as well. Every job ages at the same
+        rate, so ``cost - rate * (now - submitted)`` orders jobs the same as
+        ``cost + rate * submitted``: the aged cost is fixed at submission and
+        works as a heap key.
+        """
+        rank = PRIORITIES[check_priority(priority)]
+        aged_cost = rank * self.class_age_seconds + cost + self.aging_rate * submitted_at
+        return (aged_cost, next(self._sequence), rank, cost, extractor, item)
+
+    @staticmethod
+    def _add_owner(owner: str, queues: Dict[str, list], served: Dict[str, float]):
+        """Register an owner, starting level with the least served owner."""
+        if owner not in queues:
+            queues[owner] = []
+            served[owner] = min(served.values()) if served else 0.0
+
+    @staticmethod
+    def _pop(queues: Dict[str, list], served: Dict[str, float]) -> Optional[Tuple[Any, Any]]:
+        """Pop the job that goes next and charge its owner for it.
+
+        Returns:
+            Tuple of (extractor, item), or None if nothing is queued.
+        """
+        best = None
+        for owner, jobs in queues.items():
+            aged_cost, sequence = jobs[0][:2]
+            key = (aged_cost + served[owner], sequence)
+            if best is None or key < best[0]:
+                best = (key, owner)
+        if best is None:
+            return None
+
+        owner = best[1]
+        jobs = queues[owner]
+        _, _, _, cost, extractor, item = heapq.heappop(jobs)
+        served[owner] += cost
+        if not jobs:
+            # Forget owners with nothing queued
+            del queues[owner]
+            del served[owner]
+        return extractor, item
+
+    def cancel(self, extraction_id: str) -> bool:
+        """Remove a queued extraction.
+
+        Args:
+            extraction_id: ID of the extraction to remove.
+
+        Returns:
+            True if the extraction was still queued, False otherwise.
+        """
+        with self._cond:
+            for owner, jobs in self._queues.items():
+                for job in jobs:
+                    if job[5].extraction_id == extraction_id:
+                        jobs.remove(job)
+                        heapq.heapify(jobs)
+                        if not jobs:
+                            del self._queues[owner]
+                            del self._served[owner]
+                        return True
+        return False
+
+    def set_slots(self, slots: int):
+        """Change the number of concurrent extractions.
+
+        Args:
+            slots: New slot budget.
+        """
+        with self._cond:
+            self.slots = max(1, int(slots))
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get a snapshot of the scheduler state.
+
+        Returns:
+            Dictionary with slot budget, running and queued counts.
+        """
+        with self._cond:
+            queued_by_priority = {priority: 0 for priority in PRIORITIES}
+            names = {rank: priority for priority, rank in PRIORITIES.items()}
+            for jobs in self._queues.values():
+                for job in jobs:
+                    queued_by_priority[names[job[2]]] += 1
+            return {
+                "slots": self.slots,
+                "running": len(self._running),
+                "queued": sum(len(jobs) for jobs in self._queues.values()),
+                "queued_by_owner": {owner: len(jobs) for owner, jobs in self._queues.items() if jobs},
+                "queued_by_priority": queued_by_priority,
+            }
+
+    def estimate_start_times(self, slot_seconds: Callable[[Any], float],
+                             remaining_seconds: Callable[[Any], float],
+                             extra: Optional[Tuple[str, Any, str]] = None) -> Dict[str, float]:
+        """Predict when each queued extraction will get a slot.
+
+        Replays the dispatch order against the slots, each freed when its
+        running job is predicted to release it. Jobs submitted later are not
+        foreseen, so an estimate can only grow when shorter jobs arrive.
+
+        Args:
+            slot_seconds: Predicted slot time of a queued item.
+            remaining_seconds: Predicted slot time left for a running item.
+            extra: Optional (owner, item, priority) to predict as if it were
+                submitted now, without queueing it.
+
+        Returns:
+            Dictionary of extraction ID to seconds from now until it starts.
+        """
+        with self._cond:
+            free_at = [remaining_seconds(item) for item in self._running.values()]
+            free_at += [0.0] * max(0, self.slots - len(free_at))
+            queues = {owner: list(jobs) for owner, jobs in self._queues.items()}
+            served = dict(self._served)
+
+        if extra:
+            owner, item, priority = extra
+            self._add_owner(owner, queues, served)
+            queues[owner].append(self._entry(priority, slot_seconds(item), time.time(), None, item))
+        for jobs in queues.values():
+            heapq.heapify(jobs)
+
+        heapq.heapify(free_at)
+        starts = {}
+        while queues:
+            _, item = self._pop(queues, served)
+            start = heapq.heappop(free_at)
+            starts[item.extraction_id] = start
+            heapq.heappush(free_at, start + slot_seconds(item))
+        return starts
+
+    def _next_job(self) -> Optional[Tuple[Any, Any]]:
+        """Pop the next job. Caller holds the lock."""
+        return self._pop(self._queues, self._served)
+
+    def _dispatch_loop(self):
+        """Start queued extractions whenever a slot is free."""
+        while True:
+            with self._cond:
+                job = None
+                while job is None:
+                    if len(self._running) < self.slots:
+                        job = self._next_job()
+                    if job is None:
+                        self._cond.wait()
+                extractor, item = job
+                self._running[item.extraction_id] = item
+
+            threading.Thread(
+                target=self._run_job,
+                args=(extractor, item),
+                daemon=True
+            ).start()
+
+    def _run_job(self, extractor, item):
+        """Run an extraction and free its slot afterwards."""
+        try:
+            extractor._start_extraction(item)
+        except Exception as e:
+            print(f"Unexpected error running extraction {item.extraction_id}: {e}")
+        finally:
+            with self._cond:
+                self._running.pop(item.extraction_id, None)
+                self._cond.notify_all()
+
+
+# Create a singleton instance
+_extraction_scheduler = None
+_extraction_scheduler_lock = threading.Lock()
+
+def get_extraction_scheduler() -> ExtractionScheduler:
+    """Get the extraction scheduler singleton instance."""
+    global _extraction_scheduler
+    with _extraction_scheduler_lock:
+        if _extraction_scheduler is None:
+            _extraction_scheduler = ExtractionScheduler()
+    return _extraction_scheduler
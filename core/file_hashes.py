@@ -0,0 +1,65 @@
+"""
+File hash index for StemTubes application.
+Remembers the SHA-256 of audio files by (path, size, mtime, inode) so an
+unchanged file is only ever read once to hash it.
+"""
+import os
+import hashlib
+from typing import Optional
+
+from .processed_db import get_file_hash, save_file_hash
+
+
+# Large reads keep the number of round trips low on network filesystems
+READ_SIZE = 1024 * 1024
+
+
+def compute_file_hash(path: str) -> str:
+    """Return the SHA-256 of a file, reading it in full."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _index_key(path: str) -> tuple:
+    """(path, size, mtime, inode) of a file, as the index keys it."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def indexed_file_hash(path: str) -> Optional[str]:
+    """Return the SHA-256 of a file if the index has it, without ever reading the file.
+
+    Args:
+        path: File to look up.
+
+    Returns:
+        Hex digest of the file contents, or None if the file is not indexed
+        or changed since it was.
+    """
+    return get_file_hash(*_index_key(path))
+
+
+def file_hash(path: str) -> str:
+    """Return the SHA-256 of a file, from the index when it is unchanged.
+
+    Args:
+        path: File to hash.
+
+    Returns:
+        Hex digest of the file contents.
+    """
+    key = _index_key(path)
+    path = key[0]
+
+    digest = get_file_hash(*key)
+    if digest is None:
+        digest = compute_file_hash(path)
+        # Only trust the digest if the file did not change while being read
+        after = os.stat(path)
+        if (after.st_size, after.st_mtime_ns, after.st_ino) == key[1:]:
+            save_file_hash(*key, digest)
+    return digest
@@ -0,0 +1,159 @@
+"""
+Job journal for StemTubes application.
+Writes every job state change to the job_journal table of processed.db
+(SQLite, WAL mode), so the downloads and extractions a restart or crash
+interrupts can be queued again when the application starts.
+"""
+import json
+import time
+import queue
+import atexit
+import threading
+from typing import Any, Dict, List
+
+from . import processed_db
+from .processed_db import append_job_journal, get_latest_job_states, compact_job_journal
+from .job_registry import COMPLETED, FAILED
+
+
+# States a job is over in; jobs last seen in any other state are resumed
+FINISHED_STATES = [COMPLETED, FAILED]
+
+
+class _JournalWriter:
+    """Thread appending journal entries in the order they were recorded.
+
+    Entries that pile up while a write is in progress go to the database
+    together, in one transaction.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, row: tuple):
+        """Queue a (kind, job_id, owner, state, payload, recorded_at) row."""
+        self._queue.put(row)
+
+    def flush(self):
+        """Wait until every queued entry is written."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            rows = [self._queue.get()]
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                append_job_journal(rows)
+            except Exception as e:
+                print(f"Error writing {len(rows)} job journal entries: {e}")
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _get_writer() -> _JournalWriter:
+    """Get the journal writer singleton, flushed when the process exits."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _JournalWriter()
+            atexit.register(_writer.flush)
+    return _writer
+
+
+class JobJournal:
+    """Journal of one kind of job ("downloads", "extractions").
+
+    Jobs are written with their ``journal_payload()`` and read back with
+    the class's ``from_journal()``.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def record(self, job_id: str, owner: str, state: str, job: Any):
+        """Queue a job's new state for the journal.
+
+        The registry calls this under its lock, so entries keep the order of
+        the transitions, but only the snapshot is taken here: the write
+        happens on the journal's writer thread. A failed write is reported
+        but never stops the job itself.
+        """
+        try:
+            payload = json.dumps(job.journal_payload())
+        except Exception as e:
+            print(f"Error journaling {self.kind} job {job_id}: {e}")
+            return
+        _get_writer().put((self.kind, job_id, owner, state, payload, time.time()))
+
+    @staticmethod
+    def flush():
+        """Wait until every recorded state change is in the database."""
+        _get_writer().flush()
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Jobs whose last journal entry is not a finished state, oldest first.
+
+        Returns:
+            List of dictionaries with ``job_id``, ``owner``, ``state`` and
+            ``payload``.
+        """
+        return [
+            {"job_id": row["job_id"], "owner": row["owner"], "state": row["state"],
+             "payload": json.loads(row["payload"])}
+            for row in get_latest_job_states(self.kind)
+            if row["state"] not in FINISHED_STATES
+        ]
+
+
+def compact_journal():
+    """Forget finished jobs and every entry but the last of the others."""
+    compact_job_journal(FINISHED_STATES)
+
+
+_alive_lock_file = None
+
+def claim_recovery() -> bool:
+    """Register this process as serving, and tell whether it should resume interrupted jobs.
+
+    Only the first process to start while no other one serves gets True:
+    the other workers of a WSGI server, or a worker replacing one that
+    exited while its siblings keep running, would otherwise queue the same
+    jobs again. Locks are released by the system when a process ends, so
+    the first process after a restart or crash recovers.
+
+    Without ``fcntl`` (Windows) there is no cross-process lock and every
+    call returns True.
+    """
+    global _alive_lock_file
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    if _alive_lock_file is not None:
+        return False
+
+    # Every serving process holds a shared lock on the "alive" file while it
+    # lives; the "startup" one serializes processes starting up
+    with open(processed_db.DB_PATH + ".startup.lock", "a") as startup:
+        fcntl.flock(startup, fcntl.LOCK_EX)
+        alive = open(processed_db.DB_PATH + ".alive.lock", "a")
+        try:
+            fcntl.flock(alive, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            first = True
+        except OSError:
+            first = False
+        # Held until the process ends; the startup lock keeps others from
+        # testing it while an exclusive lock is turned into a shared one
+        fcntl.flock(alive, fcntl.LOCK_SH)
+        _alive_lock_file = alive
+    return first
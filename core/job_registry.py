@@ -0,0 +1,167 @@
+"""
+Job registry for StemTubes application.
+Keeps every download or extraction job of the process in one place, with
+O(1) lookup by ID, indexes by state and by owner, and state changes that
+are atomic with respect to every other thread. Every change can be written
+to a journal (see core.job_journal) to survive a restart.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from .config import get_setting
+
+
+# Registry states; the lists the API returns are named after them
+QUEUED = "queued"
+ACTIVE = "active"
+COMPLETED = "completed"
+FAILED = "failed"
+STATES = (ACTIVE, QUEUED, COMPLETED, FAILED)
+
+
+class JobRegistry:
+    """Thread-safe store of jobs indexed by ID, state and owner."""
+
+    def __init__(self, journal=None):
+        """Initialize the registry.
+
+        Args:
+            journal: Optional JobJournal recording every job added and every
+                transition, in order. Only a snapshot is taken under the
+                lock; the journal writes it to disk on its own thread.
+        """
+        self.journal = journal
+        self._lock = threading.RLock()
+        self._jobs: Dict[str, Any] = {}
+        self._states: Dict[str, str] = {}
+        self._owners: Dict[str, str] = {}
+        self._by_state: Dict[str, Dict[str, Any]] = {state: {} for state in STATES}
+        self._by_owner: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, job_id: str, job: Any, owner: str, state: str = QUEUED):
+        """Register a job.
+
+        Args:
+            job_id: Unique job ID.
+            job: The job object (DownloadItem, ExtractionItem...).
+            owner: User the job belongs to.
+            state: Initial state, one of STATES.
+
+        Raises:
+            ValueError: If the ID is already registered or the state unknown.
+        """
+        if state not in self._by_state:
+            raise ValueError(f"Unknown job state: {state}")
+        with self._lock:
+            if job_id in self._jobs:
+                raise ValueError(f"Job {job_id} is already registered")
+            self._jobs[job_id] = job
+            self._states[job_id] = state
+            self._owners[job_id] = owner
+            self._by_state[state][job_id] = job
+            self._by_owner.setdefault(owner, {})[job_id] = job
+            if self.journal:
+                self.journal.record(job_id, owner, state, job)
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Any]:
+        """Return a job by ID, or None.
+
+        Args:
+            job_id: Job ID.
+            owner: When given, only return the job if it belongs to this owner.
+        """
+        with self._lock:
+            if owner is not None and self._owners.get(job_id) != owner:
+                return None
+            return self._jobs.get(job_id)
+
+    def state(self, job_id: str) -> Optional[str]:
+        """Return the state of a job, or None if it is not registered."""
+        with self._lock:
+            return self._states.get(job_id)
+
+    def transition(self, job_id: str, state: str, from_states: Optional[Iterable[str]] = None) -> bool:
+        """Move a job to another state, atomically.
+
+        Args:
+            job_id: Job ID.
+            state: New state.
+            from_states: States the job must currently be in; any if None.
+
+        Returns:
+            True if the job moved, False if it is unknown or in another state.
+        """
+        with self._lock:
+            current = self._states.get(job_id)
+            if current is None or (from_states is not None and current not in from_states):
+                return False
+            job = self._by_state[current].pop(job_id)
+            self._by_state[state][job_id] = job
+            self._states[job_id] = state
+            if self.journal:
+                self.journal.record(job_id, self._owners[job_id], state, job)
+            return True
+
+    def remove(self, job_id: str) -> Optional[Any]:
+        """Forget a job and return it."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return None
+            del self._by_state[self._states.pop(job_id)][job_id]
+            owner = self._owners.pop(job_id)
+            del self._by_owner[owner][job_id]
+            if not self._by_owner[owner]:
+                del self._by_owner[owner]
+            return job
+
+    def jobs(self, state: Optional[str] = None, owner: Optional[str] = None) -> List[Any]:
+        """List jobs, optionally only those in a state and/or of an owner."""
+        with self._lock:
+            if owner is None:
+                return list((self._by_state[state] if state else self._jobs).values())
+            owned = self._by_owner.get(owner, {})
+            if state is None:
+                return list(owned.values())
+            return [job for job_id, job in owned.items() if self._states[job_id] == state]
+
+    def count(self, state: Optional[str] = None, owner: Optional[str] = None) -> int:
+        """Count jobs, optionally only those in a state and/or of an owner."""
+        with self._lock:
+            if owner is None:
+                return len(self._by_state[state]) if state else len(self._jobs)
+            owned = self._by_owner.get(owner, {})
+            if state is None:
+                return len(owned)
+            return sum(1 for job_id in owned if self._states[job_id] == state)
+
+    def by_state(self, owner: Optional[str] = None) -> Dict[str, List[Any]]:
+        """Snapshot of jobs grouped by state, taken under one lock."""
+        with self._lock:
+            grouped = {state: [] for state in STATES}
+            if owner is None:
+                for state, jobs in self._by_state.items():
+                    grouped[state] = list(jobs.values())
+            else:
+                for job_id, job in self._by_owner.get(owner, {}).items():
+                    grouped[self._states[job_id]].append(job)
+            return grouped
+
+
+# One registry per kind of job
+_registries: Dict[str, JobRegistry] = {}
+_registries_lock = threading.Lock()
+
+def get_job_registry(kind: str) -> JobRegistry:
+    """Get the process-wide registry for a kind of job ("downloads", "extractions").
+
+    Its changes are journaled unless the ``job_journal`` setting is off.
+    """
+    with _registries_lock:
+        if kind not in _registries:
+            journal = None
+            if get_setting("job_journal", True):
+                from .job_journal import JobJournal
+                journal = JobJournal(kind)
+            _registries[kind] = JobRegistry(journal)
+    return _registries[kind]
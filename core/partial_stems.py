@@ -0,0 +1,167 @@
+"""
+Partial stems for StemTubes application.
+Lets the mixer start playing a track while the rest of it is still being
+separated: finished audio is appended per stem as raw 16-bit PCM under
+``<output_dir>/.partial_<run>`` and served back as a WAV covering what is
+ready. Each run has a directory of its own, so runs of other models or stems
+writing to the same output directory leave each other's partial stems alone.
+"""
+import os
+import json
+import shutil
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import torch
+
+
+PARTIAL_DIR_NAME = ".partial"
+INFO_FILE_NAME = "info.json"
+SAMPLE_WIDTH = 2  # 16-bit PCM
+CHUNK_SIZE = 1024 * 1024
+
+
+def partial_dir(output_dir: str, run_id: str) -> str:
+    """Directory holding the partial stems of a run.
+
+    Args:
+        output_dir: Extraction output directory.
+        run_id: ID of the extraction leading the run.
+    """
+    return os.path.join(output_dir, f"{PARTIAL_DIR_NAME}_{run_id}")
+
+
+class PartialStemWriter:
+    """Appends finished stretches of each stem to its partial PCM file."""
+
+    def __init__(self, directory: str, samplerate: int, channels: int):
+        """Start a fresh set of partial stems.
+
+        Args:
+            directory: The run's partial directory (see partial_dir).
+            samplerate: Sample rate of the stems.
+            channels: Channel count of the stems.
+        """
+        self.directory = directory
+        self.samplerate = samplerate
+        self.channels = channels
+        self.frames = 0
+        self._files = {}
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def write(self, stems: Dict[str, torch.Tensor]) -> float:
+        """Append the next stretch of every stem.
+
+        Args:
+            stems: Dictionary of stem name to audio (channels, samples).
+
+        Returns:
+            Seconds of audio now available.
+        """
+        frames = 0
+        for stem_name, audio in stems.items():
+            if stem_name not in self._files:
+                self._files[stem_name] = open(os.path.join(self.directory, f"{stem_name}.pcm"), "ab")
+            pcm = (audio.clamp(-1, 1) * 32767).round().to(torch.int16)
+            self._files[stem_name].write(pcm.t().contiguous().numpy().tobytes())
+            self._files[stem_name].flush()
+            frames = audio.shape[-1]
+        self.frames += frames
+
+        # Publish the new length only once every stem holds it
+        info_path = os.path.join(self.directory, INFO_FILE_NAME)
+        with open(info_path + ".tmp", "w") as f:
+            json.dump({
+                "samplerate": self.samplerate,
+                "channels": self.channels,
+                "frames": self.frames,
+                "stems": self.stems,
+            }, f)
+        os.replace(info_path + ".tmp", info_path)
+
+        return self.available_seconds
+
+    @property
+    def available_seconds(self) -> float:
+        """Seconds of audio written so far."""
+        return self.frames / self.samplerate
+
+    @property
+    def stems(self) -> List[str]:
+        """Names of the stems being written."""
+        return list(self._files)
+
+    def close(self):
+        """Close the partial files; they stay readable until removed."""
+        for f in self._files.values():
+            f.close()
+
+
+def get_partial_info(directory: str) -> Optional[Dict]:
+    """Read what is available in a run's partial directory, or None if nothing is."""
+    if not directory:
+        return None
+    try:
+        with open(os.path.join(directory, INFO_FILE_NAME)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def stream_partial_wav(directory: str, stem_name: str,
+                       chunk_size: int = CHUNK_SIZE) -> Optional[Tuple[int, Iterator[bytes]]]:
+    """Stream a WAV file of the available part of a stem.
+
+    The PCM file is opened up front and read a chunk at a time while it is
+    sent, so a poll of a long track does not copy all of it into memory; it
+    stays readable if the run removes it meanwhile.
+
+    Args:
+        directory: The run's partial directory (see partial_dir).
+        stem_name: Stem to read.
+        chunk_size: Bytes read from the PCM file at a time.
+
+    Returns:
+        Size of the WAV file and a generator of its contents, or None if
+        the stem has no partial audio.
+    """
+    info = get_partial_info(directory)
+    if not info or stem_name not in info["stems"]:
+        return None
+
+    frame_size = info["channels"] * SAMPLE_WIDTH
+    try:
+        f = open(os.path.join(directory, f"{stem_name}.pcm"), "rb")
+    except (IOError, OSError):
+        return None
+    size = min(info["frames"] * frame_size, os.fstat(f.fileno()).st_size)
+    size -= size % frame_size
+
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + size, b"WAVE",
+        b"fmt ", 16, 1, info["channels"], info["samplerate"],
+        info["samplerate"] * frame_size, frame_size, SAMPLE_WIDTH * 8,
+        b"data", size
+    )
+
+    def generate():
+        with f:
+            yield header
+            remaining = size
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    return len(header) + size, generate()
+
+
+def remove_partial_stems(directory: str):
+    """Delete a run's partial directory (see partial_dir)."""
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,158 @@
+"""
+Decoded audio cache for StemTubes application.
+Decodes a source file once to raw float32 PCM on disk and hands out
+memory-mapped views of it, so separation and analysis never decode the
+same (possibly lossy) stream twice.
+"""
+import os
+import glob
+import subprocess
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .config import get_setting, get_ffmpeg_path, DOWNLOADS_DIR
+from .file_hashes import file_hash, indexed_file_hash
+
+
+_decode_lock = threading.Lock()
+
+
+def get_cache_dir() -> str:
+    """Directory holding decoded PCM, on the downloads volume."""
+    return os.path.join(get_setting("downloads_directory", DOWNLOADS_DIR), ".pcm_cache")
+
+
+def _pcm_path(audio_path: str, samplerate: int, channels: int) -> str:
+    return os.path.join(get_cache_dir(), f"{file_hash(audio_path)}.{samplerate}.{channels}.f32")
+
+
+def _open(pcm_path: str, channels: int) -> np.ndarray:
+    # Refresh the modification time: eviction drops the least recently used
+    os.utime(pcm_path)
+    # Copy-on-write: the array can be handed to torch as is, and a write
+    # only ever changes the page in memory, never the cache file
+    frames = np.memmap(pcm_path, dtype="<f4", mode="c")
+    # Frames are interleaved, so this is a strided view, not a copy
+    return frames.reshape(-1, channels).T
+
+
+def get_cached_pcm(audio_path: str, samplerate: Optional[int] = None,
+                   channels: Optional[int] = None) -> Optional[Tuple[np.ndarray, int]]:
+    """Return the decoded audio of a file if it is already cached.
+
+    Never reads the file itself: only a file whose hash is in the index
+    (every download is hashed) can be found.
+
+    Args:
+        audio_path: Source audio.
+        samplerate: Only accept a decode at this sample rate; any if None.
+        channels: Only accept a decode with this channel count; any if None.
+
+    Returns:
+        Array (channels, samples) mapped from the cache file and its sample
+        rate, or None.
+    """
+    try:
+        digest = indexed_file_hash(audio_path)
+    except OSError:
+        return None
+    if digest is None:
+        return None
+
+    # Cache files are named <hash>.<sample rate>.<channels>.f32
+    for pcm_path in sorted(glob.glob(os.path.join(get_cache_dir(), f"{digest}.*.*.f32"))):
+        try:
+            rate, count = (int(part) for part in os.path.basename(pcm_path).split(".")[1:3])
+        except ValueError:
+            continue
+        if (samplerate and rate != samplerate) or (channels and count != channels):
+            continue
+        try:
+            return _open(pcm_path, count), rate
+        except OSError:
+            continue  # Evicted meanwhile
+    return None
+
+
+def decode_to_pcm(audio_path: str, samplerate: int = 44100, channels: int = 2) -> np.ndarray:
+    """Decode an audio file to float32 PCM, once.
+
+    FFmpeg streams the decoded samples straight to the cache file; later
+    calls for the same file contents only map it.
+
+    Args:
+        audio_path: Source audio, in any container FFmpeg reads.
+        samplerate: Sample rate to resample to.
+        channels: Channel count to mix to.
+
+    Returns:
+        Array (channels, samples) mapped from the cache file; pages are only
+        read when the samples are used.
+    """
+    pcm_path = _pcm_path(audio_path, samplerate, channels)
+    if os.path.exists(pcm_path):
+        return _open(pcm_path, channels)
+
+    # One decode at a time per process, and never twice for the same file
+    with _decode_lock:
+        if not os.path.exists(pcm_path):
+            os.makedirs(os.path.dirname(pcm_path), exist_ok=True)
+            temp_path = f"{pcm_path}.{os.getpid()}.tmp"
+            cmd = [
+                get_ffmpeg_path(), "-v", "error", "-nostdin", "-y",
+                "-i", audio_path,
+                "-map", "0:a:0",
+                "-ar", str(samplerate),
+                "-ac", str(channels),
+                "-f", "f32le", temp_path,
+            ]
+            try:
+                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                os.replace(temp_path, pcm_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            print(f"Decoded {os.path.basename(audio_path)} to PCM cache ({os.path.getsize(pcm_path) >> 20} MB)")
+            evict(keep=pcm_path)
+
+    return _open(pcm_path, channels)
+
+
+def evict(keep: Optional[str] = None) -> int:
+    """Delete least recently used PCM files beyond the ``pcm_cache_max_gb`` budget.
+
+    Args:
+        keep: Cache file never to delete.
+
+    Returns:
+        Number of bytes freed.
+    """
+    max_bytes = float(get_setting("pcm_cache_max_gb", 5) or 0) * 1024 ** 3
+    cache_dir = get_cache_dir()
+    if max_bytes <= 0 or not os.path.isdir(cache_dir):
+        return 0
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith(".f32"):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue  # Still mapped elsewhere on some platforms
+        total -= size
+        freed += size
+
+    return freed
@@ -1,6 +1,6 @@
 import os
 import sqlite3
-from typing import Optional
+from typing import Optional, List, Dict, Any
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'processed.db')
 
@@ -8,14 +8,46 @@ DB_PATH = os.path.join(os.path.dirname(__file__), 'processed.db')
 def _get_conn():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    # Durable at every commit in WAL mode, without an fsync per write
+    conn.execute("PRAGMA synchronous=NORMAL")
     return conn
 
 
 def init_db():
     conn = _get_conn()
     try:
+        # Readers never block the job journal's writers, nor the other way round
+        conn.execute("PRAGMA journal_mode=WAL")
         conn.execute("CREATE TABLE IF NOT EXISTS downloads (video_id TEXT PRIMARY KEY, file_path TEXT)")
         conn.execute("CREATE TABLE IF NOT EXISTS extractions (audio_hash TEXT PRIMARY KEY, output_dir TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_cache ("
+            "cache_key TEXT PRIMARY KEY, audio_hash TEXT NOT NULL, model_name TEXT NOT NULL, "
+            "stems TEXT NOT NULL, two_stem_mode INTEGER NOT NULL, output_format TEXT NOT NULL, "
+            "output_dir TEXT NOT NULL, output_paths TEXT NOT NULL, signature TEXT NOT NULL, "
+            "size_bytes INTEGER NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_extraction_cache_access ON extraction_cache (last_access)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_extraction_cache_dir ON extraction_cache (output_dir)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_hashes ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "inode INTEGER NOT NULL, sha256 TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, model_name TEXT NOT NULL, audio_seconds REAL NOT NULL, "
+            "device TEXT NOT NULL, threads INTEGER NOT NULL, wall_seconds REAL NOT NULL, "
+            "slot_seconds REAL NOT NULL, phases TEXT NOT NULL, finished_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_extraction_history_model "
+                     "ON extraction_history (model_name, device, finished_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_journal ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, job_id TEXT NOT NULL, "
+            "owner TEXT NOT NULL, state TEXT NOT NULL, payload TEXT NOT NULL, recorded_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_job_journal_job ON job_journal (kind, job_id, seq)")
         conn.commit()
     finally:
         conn.close()
@@ -50,34 +82,175 @@ def remove_download(video_id: str):
         conn.close()
 
 
-# --------- Extraction helpers ---------
+# --------- File hash helpers ---------
 
-def get_extraction_dir(audio_hash: str) -> Optional[str]:
+def get_file_hash(path: str, size: int, mtime_ns: int, inode: int) -> Optional[str]:
     conn = _get_conn()
     try:
-        row = conn.execute("SELECT output_dir FROM extractions WHERE audio_hash=?", (audio_hash,)).fetchone()
+        row = conn.execute(
+            "SELECT sha256 FROM file_hashes WHERE path=? AND size=? AND mtime_ns=? AND inode=?",
+            (path, size, mtime_ns, inode)
+        ).fetchone()
         return row[0] if row else None
     finally:
         conn.close()
 
 
-def save_extraction_dir(audio_hash: str, output_dir: str):
+def save_file_hash(path: str, size: int, mtime_ns: int, inode: int, sha256: str):
     conn = _get_conn()
     try:
-        conn.execute("REPLACE INTO extractions (audio_hash, output_dir) VALUES (?, ?)", (audio_hash, output_dir))
+        conn.execute("REPLACE INTO file_hashes (path, size, mtime_ns, inode, sha256) VALUES (?, ?, ?, ?, ?)",
+                     (path, size, mtime_ns, inode, sha256))
         conn.commit()
     finally:
         conn.close()
 
 
-def remove_extraction(audio_hash: str):
+# --------- Extraction cache helpers ---------
+
+def get_cache_entry(cache_key: str) -> Optional[Dict[str, Any]]:
+    conn = _get_conn()
+    try:
+        row = conn.execute("SELECT * FROM extraction_cache WHERE cache_key=?", (cache_key,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def save_cache_entry(entry: Dict[str, Any]):
+    columns = ", ".join(entry)
+    placeholders = ", ".join("?" for _ in entry)
+    conn = _get_conn()
+    try:
+        conn.execute(f"REPLACE INTO extraction_cache ({columns}) VALUES ({placeholders})", tuple(entry.values()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def touch_cache_entry(cache_key: str, last_access: float):
+    conn = _get_conn()
+    try:
+        conn.execute("UPDATE extraction_cache SET last_access=? WHERE cache_key=?", (last_access, cache_key))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def remove_cache_entry(cache_key: str):
+    conn = _get_conn()
+    try:
+        conn.execute("DELETE FROM extraction_cache WHERE cache_key=?", (cache_key,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_cache_entries_in_dir(output_dir: str) -> List[Dict[str, Any]]:
+    conn = _get_conn()
+    try:
+        rows = conn.execute("SELECT * FROM extraction_cache WHERE output_dir=?", (output_dir,)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def get_cache_entries_for_audio(audio_hash: str) -> List[Dict[str, Any]]:
+    conn = _get_conn()
+    try:
+        rows = conn.execute("SELECT * FROM extraction_cache WHERE audio_hash=? ORDER BY last_access DESC",
+                            (audio_hash,)).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def get_cache_entries_lru() -> List[Dict[str, Any]]:
     conn = _get_conn()
     try:
-        conn.execute("DELETE FROM extractions WHERE audio_hash=?", (audio_hash,))
+        rows = conn.execute("SELECT * FROM extraction_cache ORDER BY last_access").fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def get_cache_size() -> int:
+    conn = _get_conn()
+    try:
+        row = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM extraction_cache").fetchone()
+        return row[0]
+    finally:
+        conn.close()
+
+
+
+# --------- Extraction history helpers ---------
+
+def save_extraction_history(record: Dict[str, Any]):
+    columns = ", ".join(record)
+    placeholders = ", ".join("?" for _ in record)
+    conn = _get_conn()
+    try:
+        conn.execute(f"INSERT INTO extraction_history ({columns}) VALUES ({placeholders})", tuple(record.values()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_extraction_history(model_name: str, device: str, limit: int = 100) -> List[Dict[str, Any]]:
+    conn = _get_conn()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM extraction_history WHERE model_name=? AND device=? ORDER BY finished_at DESC LIMIT ?",
+            (model_name, device, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+# --------- Job journal helpers ---------
+
+def append_job_journal(rows: List[tuple]):
+    """Append (kind, job_id, owner, state, payload, recorded_at) rows in one transaction."""
+    conn = _get_conn()
+    try:
+        conn.executemany(
+            "INSERT INTO job_journal (kind, job_id, owner, state, payload, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
         conn.commit()
     finally:
         conn.close()
 
 
+def get_latest_job_states(kind: str) -> List[Dict[str, Any]]:
+    """Last journal entry of every job of a kind, oldest job first."""
+    conn = _get_conn()
+    try:
+        rows = conn.execute(
+            "SELECT j.* FROM job_journal j "
+            "JOIN (SELECT job_id, MAX(seq) AS seq, MIN(seq) AS first_seq FROM job_journal "
+            "WHERE kind=? GROUP BY job_id) latest ON j.seq = latest.seq "
+            "ORDER BY latest.first_seq",
+            (kind,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def compact_job_journal(finished_states: List[str]):
+    """Drop superseded entries, and every entry of jobs that are finished."""
+    conn = _get_conn()
+    try:
+        conn.execute("DELETE FROM job_journal WHERE seq NOT IN "
+                     "(SELECT MAX(seq) FROM job_journal GROUP BY kind, job_id)")
+        conn.execute(f"DELETE FROM job_journal WHERE state IN ({', '.join('?' for _ in finished_states)})",
+                     tuple(finished_states))
+        conn.commit()
+    finally:
+        conn.close()
+
 # Initialize database on module load
 init_db()
@@ -0,0 +1,68 @@
+"""
+Extraction progress for StemTubes application.
+Progress travels as (progress, message, details): a percentage on the
+extractor's 0-100 scale, a status message, and a dictionary naming the
+phase and, while separating, the segment reached. ProgressThrottle keeps
+those updates to a few per second on their way to the browser.
+"""
+import time
+import threading
+from typing import Dict, Optional, Callable, Any
+
+from .config import get_setting
+
+
+PHASE_LOADING = "loading"
+PHASE_DECODING = "decoding"
+PHASE_SEPARATING = "separating"
+PHASE_ENCODING = "encoding"
+PHASE_FINALIZING = "finalizing"
+
+
+def progress_details(phase: str, segment: Optional[int] = None, segments: Optional[int] = None) -> Dict[str, Any]:
+    """Build the details of a progress update.
+
+    Args:
+        phase: One of the PHASE_* names.
+        segment: Segments done so far, while separating.
+        segments: Total number of segments, while separating.
+    """
+    details = {"phase": phase}
+    if segments:
+        details["segment"] = segment
+        details["segments"] = segments
+    return details
+
+
+class ProgressThrottle:
+    """Progress callback wrapper passing on at most ``max_hz`` updates a second.
+
+    Updates that start a new phase or reach 100% always go through, so a
+    dropped update is only ever superseded by a later one of the same phase.
+    """
+
+    def __init__(self, callback: Callable[[float, str, Dict[str, Any]], None], max_hz: Optional[float] = None):
+        """Wrap a progress callback.
+
+        Args:
+            callback: Receives (progress, message, details).
+            max_hz: Update rate limit. Defaults to the ``progress_emit_hz``
+                setting; 0 disables the limit.
+        """
+        if max_hz is None:
+            max_hz = float(get_setting("progress_emit_hz", 4) or 0)
+        self.callback = callback
+        self.interval = 1.0 / max_hz if max_hz > 0 else 0.0
+        self._last_time = 0.0
+        self._last_phase = None
+        self._lock = threading.Lock()
+
+    def __call__(self, progress: float, message: Optional[str] = None, details: Optional[Dict[str, Any]] = None):
+        phase = (details or {}).get("phase")
+        now = time.monotonic()
+        with self._lock:
+            if phase == self._last_phase and progress < 100.0 and now - self._last_time < self.interval:
+                return
+            self._last_time = now
+            self._last_phase = phase
+        self.callback(progress, message, details or {})
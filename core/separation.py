@@ -0,0 +1,642 @@
+"""
+Separation core for StemTubes application.
+Model loading, audio decoding, Demucs inference and stem encoding, shared by
+the in-process extractor and the resident separation workers.
+"""
+import os
+import glob
+import shutil
+import tempfile
+import threading
+import subprocess
+from typing import Dict, List, Optional, Callable, Any, Tuple
+
+import torch
+import torchaudio
+from demucs.pretrained import get_model
+from demucs.apply import apply_model, BagOfModels, TensorChunk
+from demucs.audio import AudioFile, convert_audio
+
+from .config import STEM_MODELS, get_setting, get_ffmpeg_path, get_stem_recipe
+from .pcm_cache import decode_to_pcm
+from .partial_stems import PartialStemWriter, remove_partial_stems
+from .progress import progress_details, PHASE_LOADING, PHASE_DECODING, PHASE_SEPARATING, PHASE_ENCODING
+from .stem_encoder import (
+    DEFAULT_FORMAT,
+    stem_filename,
+    write_raw_stems,
+    discard_raw_stems,
+    encode_stems,
+    get_stem_encoder,
+)
+
+
+# Overlap between consecutive model segments, as in demucs.separate
+SEGMENT_OVERLAP = 0.25
+
+# Models loaded in this process, keyed by (model name, device type).
+# Shared by every caller so a model is only read from disk once.
+_models: Dict[Tuple[str, str], Any] = {}
+_models_lock = threading.Lock()
+
+_ffmpeg_path_configured = False
+
+
+class SeparationCancelled(Exception):
+    """Raised when a separation is stopped because its job was cancelled."""
+
+
+def check_cancelled(cancel_event: Optional[threading.Event]):
+    """Raise SeparationCancelled if ``cancel_event`` is set."""
+    if cancel_event is not None and cancel_event.is_set():
+        raise SeparationCancelled("Extraction cancelled")
+
+
+def ensure_ffmpeg_on_path():
+    """Make the configured FFmpeg visible to Demucs' audio loader."""
+    global _ffmpeg_path_configured
+    if _ffmpeg_path_configured:
+        return
+
+    ffmpeg_path = get_ffmpeg_path()
+    ffmpeg_dir = ffmpeg_path if os.path.isdir(ffmpeg_path) else os.path.dirname(ffmpeg_path)
+    if ffmpeg_dir and os.path.exists(ffmpeg_dir):
+        os.environ["PATH"] = ffmpeg_dir + os.pathsep + os.environ.get("PATH", "")
+        print(f"Using FFmpeg from: {ffmpeg_dir}")
+
+    _ffmpeg_path_configured = True
+
+
+def load_model(model_name: str, device: torch.device):
+    """Load a Demucs model, reusing the process-wide cache.
+
+    Args:
+        model_name: Name of the model to load.
+        device: Device to place the model on.
+
+    Returns:
+        Loaded model.
+    """
+    key = (model_name, device.type)
+    with _models_lock:
+        if key in _models:
+            return _models[key]
+
+        # Check if model exists in STEM_MODELS
+        if model_name not in STEM_MODELS:
+            raise ValueError(f"Model '{model_name}' not found")
+
+        # Load model
+        model = get_model(model_name)
+        model.to(device)
+        model.eval()
+
+        # Cache model
+        _models[key] = model
+
+    return model
+
+
+def load_audio(audio_path: str, model) -> Tuple[torch.Tensor, int]:
+    """Load audio from file.
+
+    Args:
+        audio_path: Path to audio file.
+        model: Demucs model, used for its sample rate and channel count.
+
+    Returns:
+        Tuple of audio tensor (channels, samples) and sample rate.
+    """
+    ensure_ffmpeg_on_path()
+
+    sr = model.samplerate
+    if get_setting("lossless_audio_pipeline", False):
+        # Decode the source once; later jobs on the same file map the cached
+        # PCM. The tensor shares the mapping: nothing is copied until
+        # normalization reads the samples
+        return torch.from_numpy(decode_to_pcm(audio_path, sr, model.audio_channels)), sr
+
+    try:
+        # FFmpeg reads any container yt-dlp may have produced
+        audio = AudioFile(audio_path).read(streams=0, samplerate=sr, channels=model.audio_channels)
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
+        print(f"FFmpeg could not decode {audio_path}, falling back to torchaudio: {e}")
+        try:
+            waveform, file_sr = torchaudio.load(audio_path)
+        except Exception as e:
+            raise Exception(f"Failed to load audio file: {e}")
+        audio = convert_audio(waveform, file_sr, sr, model.audio_channels)
+
+    return audio, sr
+
+
+def probe_duration(audio_path: str) -> float:
+    """Return the duration of an audio file in seconds, or 0 if unknown."""
+    ensure_ffmpeg_on_path()
+    try:
+        return float(AudioFile(audio_path).duration())
+    except Exception as e:
+        print(f"Could not probe duration of {audio_path}: {e}")
+        return 0.0
+
+
+def separate(model, audio: torch.Tensor, device: torch.device, model_name: str,
+             selected_stems: List[str], two_stem_mode: bool = False,
+             primary_stem: str = "vocals",
+             on_progress: Optional[Callable[[int, int], None]] = None,
+             on_chunk: Optional[Callable[[Dict[str, torch.Tensor], int, int], None]] = None,
+             cancel_event: Optional[threading.Event] = None) -> Dict[str, torch.Tensor]:
+    """Separate audio into stems.
+
+    Args:
+        model: Demucs model.
+        audio: Audio tensor (channels, samples).
+        device: Device to run the model on.
+        model_name: Name of the model, used to look up its stems.
+        selected_stems: Stems to keep, derived stems included; all model
+            stems if empty.
+        two_stem_mode: Return only the primary stem and the sum of the others.
+        primary_stem: Primary stem for two-stem mode.
+        on_progress: Optional callback receiving (segments done, total
+            segments). Only models separate_in_order supports report it.
+        on_chunk: Optional callback receiving (stems, start, end) each time a
+            further stretch of the stems is final, for models
+            separate_in_order supports.
+        cancel_event: Optional event; once set, the separation stops at the
+            next segment with SeparationCancelled.
+
+    Returns:
+        Dictionary of stem name to audio tensor.
+    """
+    # Work out the stems to produce from the model's own
+    recipe = get_stem_recipe(model_name, selected_stems, two_stem_mode, primary_stem)
+
+    # Normalize like demucs.separate does before applying the model
+    audio, mean, std = normalize(audio)
+
+    # Apply model to extract stems, segment by segment where possible so
+    # progress is known per segment
+    if supports_in_order(model):
+        publish = None
+        if on_chunk is not None:
+            def publish(start, end, chunk):
+                stems = select_stems(chunk * std + mean, model.sources, recipe)
+                on_chunk(stems, start, end)
+
+        sources = separate_in_order(model, audio, device, on_finalized=publish, on_progress=on_progress,
+                                    cancel_event=cancel_event)
+    else:
+        sources = apply_model(model, audio[None], device=device, split=True, overlap=SEGMENT_OVERLAP, progress=False)[0]
+        check_cancelled(cancel_event)
+    sources = sources * std + mean
+
+    return select_stems(sources, model.sources, recipe)
+
+
+def normalize(audio: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Normalize a mix the way demucs.separate does.
+
+    Returns:
+        Tuple of normalized audio, mean and standard deviation.
+    """
+    ref = audio.mean(0)
+    mean, std = ref.mean(), ref.std()
+    return (audio - mean) / std, mean, std
+
+
+def sub_models(model) -> List[Tuple[Any, Optional[List[float]]]]:
+    """List the plain models inside a model with their per-source weights.
+
+    A BagOfModels is applied one member at a time; a plain model is its own
+    single member with no weights.
+    """
+    if isinstance(model, BagOfModels):
+        return list(zip(model.models, model.weights))
+    return [(model, None)]
+
+
+def segment_length(model) -> int:
+    """Length in samples of the segments apply_model splits a track into."""
+    return int(model.samplerate * model.segment)
+
+
+def model_metadata(model) -> Dict[str, Any]:
+    """What segment-parallel separation needs to know about a model, as plain data.
+
+    Returns:
+        Dictionary with samplerate, audio_channels, sources, and members: for
+        each plain model (see sub_models) its segment_length and per-source
+        weights (None for a plain model).
+    """
+    return {
+        "samplerate": model.samplerate,
+        "audio_channels": model.audio_channels,
+        "sources": list(model.sources),
+        "members": [
+            {"segment_length": segment_length(member),
+             "weights": None if weights is None else [float(weight) for weight in weights]}
+            for member, weights in sub_models(model)
+        ],
+    }
+
+
+def plan_offsets(length: int, seg_length: int) -> List[int]:
+    """Start offsets of the overlapping segments apply_model would use."""
+    stride = int((1 - SEGMENT_OVERLAP) * seg_length)
+    return list(range(0, length, stride))
+
+
+def segment_weight(seg_length: int) -> torch.Tensor:
+    """Triangular window apply_model uses to cross-fade overlapping segments."""
+    weight = torch.cat([torch.arange(1, seg_length // 2 + 1),
+                        torch.arange(seg_length - seg_length // 2, 0, -1)]).float()
+    return weight / weight.max()
+
+
+def separate_offsets(model, mix: torch.Tensor, offsets: List[int], seg_length: int,
+                     device: torch.device,
+                     on_progress: Optional[Callable[[int, int], None]] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Run a plain model on some of the segments of a mix.
+
+    This is the body of apply_model's split loop (same triangular window,
+    no random shift), restricted to ``offsets``. Summing the returned
+    weighted outputs and weights over a partition of plan_offsets() and
+    dividing gives exactly what apply_model(shifts=0) returns.
+
+    Args:
+        model: Plain (non-bag) Demucs model.
+        mix: Normalized audio (channels, samples).
+        offsets: Segment start offsets, relative to ``mix``.
+        seg_length: Segment length in samples.
+        device: Device to run the model on.
+        on_progress: Optional callback receiving (offsets done, total offsets).
+
+    Returns:
+        Tuple of weighted output (sources, channels, samples) and weight sum
+        (samples), both over the whole of ``mix``.
+    """
+    weight = segment_weight(seg_length)
+
+    length = mix.shape[-1]
+    out = torch.zeros(len(model.sources), mix.shape[0], length)
+    sum_weight = torch.zeros(length)
+    for i, offset in enumerate(offsets):
+        chunk = TensorChunk(mix[None], offset, seg_length)
+        chunk_out = apply_model(model, chunk, shifts=0, split=False, device=device)[0].cpu()
+        chunk_length = chunk_out.shape[-1]
+        out[..., offset:offset + chunk_length] += weight[:chunk_length] * chunk_out
+        sum_weight[offset:offset + chunk_length] += weight[:chunk_length]
+        if on_progress:
+            on_progress(i + 1, len(offsets))
+
+    return out, sum_weight
+
+
+def supports_in_order(model) -> bool:
+    """Whether separate_in_order can run a model: every member must share one segment length."""
+    return len({segment_length(member) for member, _ in sub_models(model)}) == 1
+
+
+def separate_in_order(model, mix: torch.Tensor, device: torch.device,
+                      on_finalized: Optional[Callable[[int, int, torch.Tensor], None]] = None,
+                      on_progress: Optional[Callable[[int, int], None]] = None,
+                      cancel_event: Optional[threading.Event] = None) -> torch.Tensor:
+    """Apply a model to a normalized mix segment by segment, in time order.
+
+    Uses the segments and window of separate_offsets, but runs every member
+    of a bag on a segment before moving to the next one. Once segment i is
+    done, no later segment touches the audio before segment i + 1 starts, so
+    that stretch is divided by its weights straight away and handed to
+    ``on_finalized``. The result equals apply_model(shifts=0).
+
+    Args:
+        model: Demucs model or bag of models (see supports_in_order).
+        mix: Normalized audio (channels, samples).
+        device: Device to run the model on.
+        on_finalized: Optional callback receiving (start, end, sources) for
+            each newly final stretch; ``sources`` is a view into the result.
+        on_progress: Optional callback receiving (segments done, total segments).
+        cancel_event: Optional event checked before each segment; once set,
+            SeparationCancelled is raised.
+
+    Returns:
+        Separated sources tensor (sources, channels, samples).
+    """
+    members = sub_models(model)
+    seg_length = segment_length(members[0][0])
+    weight = segment_weight(seg_length)
+
+    length = mix.shape[-1]
+    offsets = plan_offsets(length, seg_length)
+    out = torch.zeros(len(model.sources), mix.shape[0], length)
+    sum_weight = torch.zeros(length)
+    totals = torch.zeros(len(model.sources))
+    for _, weights in members:
+        totals += torch.tensor(weights, dtype=torch.float) if weights is not None else 1.0
+
+    finalized = 0
+    for i, offset in enumerate(offsets):
+        check_cancelled(cancel_event)
+        chunk = TensorChunk(mix[None], offset, seg_length)
+        for member, weights in members:
+            chunk_out = apply_model(member, chunk, shifts=0, split=False, device=device)[0].cpu()
+            if weights is not None:
+                chunk_out *= torch.tensor(weights, dtype=torch.float)[:, None, None]
+            chunk_length = chunk_out.shape[-1]
+            out[..., offset:offset + chunk_length] += weight[:chunk_length] * chunk_out
+        sum_weight[offset:offset + chunk_length] += weight[:chunk_length]
+
+        end = offsets[i + 1] if i + 1 < len(offsets) else length
+        if end > finalized:
+            region = out[..., finalized:end]
+            region /= sum_weight[finalized:end]
+            region /= totals[:, None, None]
+            if on_finalized:
+                on_finalized(finalized, end, region)
+            finalized = end
+
+        if on_progress:
+            on_progress(i + 1, len(offsets))
+
+    return out
+
+
+def select_stems(sources: torch.Tensor, source_names: List[str],
+                 recipe: Dict[str, List[str]]) -> Dict[str, torch.Tensor]:
+    """Build the requested stems out of a model's output.
+
+    Args:
+        sources: Model output (sources, channels, samples).
+        source_names: Name of each source, in model order.
+        recipe: Output stem name to the sources summed into it (see
+            config.get_stem_recipe).
+
+    Returns:
+        Dictionary of stem name to audio tensor.
+    """
+    stems = {}
+    for stem_name, parts in recipe.items():
+        indexes = [source_names.index(part) for part in parts if part in source_names]
+        if len(indexes) == 1:
+            stems[stem_name] = sources[indexes[0]]
+        elif indexes:
+            stems[stem_name] = sources[indexes].sum(0)
+
+    return stems
+
+
+def derive_stems(recipe: Dict[str, List[str]], source_paths: Dict[str, str], output_dir: str,
+                 on_progress: Optional[Callable[[float, str], None]] = None,
+                 output_format: str = DEFAULT_FORMAT) -> Dict[str, str]:
+    """Build stems from an earlier separation instead of running a model.
+
+    Stems taken as they are get hard-linked (or copied); mixed stems such as
+    two-stem "other" or "instrumental" are decoded, summed and encoded in
+    parallel on the stem encoder.
+
+    Args:
+        recipe: Output stem name to the stems summed into it.
+        source_paths: Dictionary of already separated stem name to file path;
+            must hold every stem the recipe uses, in ``output_format``.
+        output_dir: Directory to write the stems to.
+        on_progress: Optional callback receiving (fraction done, message).
+        output_format: Format of the source and output stems.
+
+    Returns:
+        Dictionary of stem name to output path.
+    """
+    ensure_ffmpeg_on_path()
+    staging = staging_dir(output_dir)
+    raw = None
+    try:
+        staged = {}
+        output_paths = {}
+        mixes = {}
+        sr = None
+        for i, (stem_name, parts) in enumerate(recipe.items()):
+            if on_progress:
+                on_progress(i / len(recipe) * 0.5, f"Assemblage de {stem_name}...")
+
+            output_path = os.path.join(output_dir, stem_filename(stem_name, output_format))
+            output_paths[stem_name] = output_path
+            if len(parts) == 1:
+                source_path = source_paths[parts[0]]
+                if os.path.abspath(source_path) == os.path.abspath(output_path):
+                    continue
+                staged[stem_name] = os.path.join(staging, os.path.basename(output_path))
+                link_or_copy(source_path, staged[stem_name])
+            else:
+                source = AudioFile(source_paths[parts[0]])
+                sr, channels = source.samplerate(), source.channels()
+                mixes[stem_name] = sum(AudioFile(source_paths[part]).read(streams=0, samplerate=sr,
+                                                                          channels=channels)
+                                       for part in parts)
+
+        if mixes:
+            raw = write_raw_stems(mixes, sr, output_dir)
+            staged.update(get_stem_encoder().encode_raw(
+                raw, output_format,
+                lambda fraction, message: on_progress(0.5 + fraction * 0.5, message) if on_progress else None
+            ))
+
+        output_paths.update(publish_files(staged, output_dir))
+        return output_paths
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        if raw:
+            discard_raw_stems(raw)
+
+
+def save_stems(stems: Dict[str, torch.Tensor], sr: int, output_dir: str,
+               on_progress: Optional[Callable[[float, str], None]] = None,
+               output_format: str = DEFAULT_FORMAT) -> Dict[str, str]:
+    """Encode stems to files named <stem>.<extension>.
+
+    The stems are encoded side by side by the stem encoder in a staging
+    directory next to the output, and moved into place together once all of
+    them are written, so readers never see a half-encoded stem and a failed
+    job leaves earlier stems untouched.
+
+    Args:
+        stems: Dictionary of stem name to audio tensor.
+        sr: Sample rate.
+        output_dir: Directory to write the stems to.
+        on_progress: Optional callback receiving (fraction done, message).
+        output_format: One of stem_encoder.OUTPUT_FORMATS.
+
+    Returns:
+        Dictionary of stem name to output path.
+    """
+    return encode_stems(write_raw_stems(stems, sr, output_dir), output_dir, output_format, on_progress)
+
+
+def staging_dir(output_dir: str) -> str:
+    """Create a scratch directory inside ``output_dir``.
+
+    Being on the same filesystem as the output, its files can be published
+    with a rename instead of a copy. The name carries the process ID, so
+    the directories of a killed worker can be found (see
+    remove_staging_dirs).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f".staging_{os.getpid()}_", dir=output_dir)
+
+
+def remove_staging_dirs(output_dir: str, pid: Optional[int] = None):
+    """Delete the staging directories a process (any if None) left in ``output_dir``."""
+    pattern = f".staging_{pid}_*" if pid is not None else ".staging_*"
+    for path in glob.glob(os.path.join(glob.escape(output_dir), pattern)):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_stale_staging_dirs(output_dir: str):
+    """Delete the staging directories of processes that are no longer running.
+
+    Directories of live processes (this one, pool workers, another server
+    sharing the folder) may belong to a job in progress and are left alone.
+    """
+    for path in glob.glob(os.path.join(glob.escape(output_dir), ".staging_*")):
+        try:
+            pid = int(os.path.basename(path).split("_")[1])
+        except (IndexError, ValueError):
+            continue
+        if not _process_alive(pid):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _process_alive(pid: int) -> bool:
+    """Whether a process ID is in use; assumed so where it cannot be checked."""
+    if os.name != "posix":
+        # os.kill(pid, 0) would signal the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # Exists, owned by another user
+    return True
+
+
+def link_or_copy(source_path: str, target_path: str):
+    """Hard-link a file, copying it only if linking is not possible."""
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+
+
+def publish_files(staged: Dict[str, str], output_dir: str) -> Dict[str, str]:
+    """Move staged files into ``output_dir``, replacing any previous version.
+
+    Each file is renamed atomically; a copy is only made when the staged file
+    sits on another device.
+
+    Args:
+        staged: Dictionary of name to staged file path.
+        output_dir: Directory to publish to.
+
+    Returns:
+        Dictionary of name to published path.
+    """
+    published = {}
+    for name, staged_path in staged.items():
+        target_path = os.path.join(output_dir, os.path.basename(staged_path))
+        try:
+            os.replace(staged_path, target_path)
+        except OSError:
+            # Different filesystem: copy next to the target, then rename
+            temp_path = target_path + ".tmp"
+            shutil.copy2(staged_path, temp_path)
+            os.replace(temp_path, target_path)
+        published[name] = target_path
+    return published
+
+
+def run_separation(audio_path: str, output_dir: str, model_name: str, selected_stems: List[str],
+                   two_stem_mode: bool, primary_stem: str, device: torch.device,
+                   on_progress: Optional[Callable[[float, str, Dict[str, Any]], None]] = None,
+                   on_partial: Optional[Callable[[float, List[str]], None]] = None,
+                   output_format: str = DEFAULT_FORMAT, encode: bool = True,
+                   cancel_event: Optional[threading.Event] = None,
+                   partial_directory: str = "") -> Dict[str, Any]:
+    """Run a complete separation job: load, separate and encode.
+
+    Progress is reported on the same 0-100 scale the extractor uses, leaving
+    the last percent for the caller's own finalisation.
+
+    Args:
+        audio_path: Path to the source audio.
+        output_dir: Directory to write the stems to.
+        model_name: Demucs model name.
+        selected_stems: Stems to keep.
+        two_stem_mode: Whether to produce primary/other only.
+        primary_stem: Primary stem for two-stem mode.
+        device: Device to run the model on.
+        on_progress: Optional callback receiving (progress, message, details);
+            see core.progress.
+        on_partial: Optional callback receiving (seconds available, stem
+            names). When given, the stems are separated in time order and
+            published as partial stems (see core.partial_stems) while the
+            rest of the track is still being separated. Needs
+            ``partial_directory``.
+        output_format: One of stem_encoder.OUTPUT_FORMATS.
+        encode: When False, stop after separation and return the raw stems
+            (see stem_encoder.write_raw_stems) for the caller to encode with
+            encode_stems; partial stems then stay up until that is done.
+        cancel_event: Optional event; once set, the job stops at the next
+            phase or segment boundary, removes its partial stems and raises
+            SeparationCancelled.
+        partial_directory: Directory of the run's partial stems (see
+            partial_stems.partial_dir). The raw stems carry it as
+            ``partial_dir`` so it is removed once they are encoded.
+
+    Returns:
+        Dictionary of stem name to output path, or the raw stems when
+        ``encode`` is False.
+    """
+    def report(progress, message, phase, segment=None, segments=None):
+        if on_progress:
+            on_progress(progress, message, progress_details(phase, segment, segments))
+
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"Source audio file not found: {audio_path}")
+
+    report(1.0, "Chargement du modèle...", PHASE_LOADING)
+    model = load_model(model_name, device)
+
+    check_cancelled(cancel_event)
+    report(5.0, "Décodage de l'audio...", PHASE_DECODING)
+    audio, sr = load_audio(audio_path, model)
+
+    on_chunk = None
+    writer = None
+    if on_partial is not None:
+        writer = PartialStemWriter(partial_directory, sr, audio.shape[0])
+
+        def on_chunk(stems, start, end):
+            on_partial(writer.write(stems), writer.stems)
+
+    try:
+        report(10.0, "Extracting stems", PHASE_SEPARATING)
+        stems = separate(model, audio, device, model_name, selected_stems, two_stem_mode, primary_stem,
+                         on_progress=lambda done, total: report(10.0 + done / total * 80.0, "Extracting stems",
+                                                                PHASE_SEPARATING, done, total),
+                         on_chunk=on_chunk, cancel_event=cancel_event)
+
+        report(90.0, "Finalisation en cours...", PHASE_ENCODING)
+        raw = write_raw_stems(stems, sr, output_dir)
+        if writer:
+            raw["partial_dir"] = writer.directory
+    except Exception:
+        if writer:
+            remove_partial_stems(writer.directory)
+        raise
+    finally:
+        if writer:
+            writer.close()
+
+    if not encode:
+        return raw
+    return encode_stems(raw, output_dir, output_format,
+                        lambda fraction, message: report(90.0 + fraction * 9.0, message, PHASE_ENCODING))
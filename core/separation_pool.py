@@ -0,0 +1,512 @@
+"""
+Separation worker pool for StemTubes application.
+Keeps N resident Demucs worker processes warm so several extractions can run
+side by side on a many-core host without oversubscribing it.
+"""
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import signal
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Callable, Any
+
+from .config import get_setting, APP_DIR
+
+
+# How often a waiting job looks at its cancel event
+CANCEL_POLL_SECONDS = 0.1
+
+
+class _Worker:
+    """One resident separation process and its event reader."""
+
+    def __init__(self, index: int, model_name: str, device: str, threads: int):
+        self.index = index
+        self.model_name = model_name
+        self.device = device
+        self.threads = threads
+
+        self.process: Optional[subprocess.Popen] = None
+        self.ready = threading.Event()
+        self._job_id: Optional[str] = None
+        self._on_progress: Optional[Callable[[float, str, Dict[str, Any]], None]] = None
+        self._on_partial: Optional[Callable[[float, List[str]], None]] = None
+        self._done = threading.Event()
+        self._result: Optional[Dict[str, Any]] = None
+
+    def start(self):
+        """Start (or restart) the worker process."""
+        env = os.environ.copy()
+        # Keep BLAS/OpenMP pools to this worker's share of the cores
+        if self.threads > 0:
+            env["OMP_NUM_THREADS"] = str(self.threads)
+            env["MKL_NUM_THREADS"] = str(self.threads)
+
+        cmd = [
+            sys.executable, "-m", "core.separation_worker",
+            "--model", self.model_name,
+            "--device", self.device,
+            "--threads", str(self.threads),
+        ]
+        self.ready.clear()
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            cwd=os.path.dirname(APP_DIR),
+            env=env,
+            # Own process group, so cancelling also stops FFmpeg children
+            start_new_session=(os.name == "posix")
+        )
+        threading.Thread(target=self._read_events, args=(self.process,), daemon=True).start()
+        print(f"Started separation worker {self.index} (pid {self.process.pid}, {self.threads} threads)")
+
+    def is_alive(self) -> bool:
+        """Check whether the worker process is running."""
+        return self.process is not None and self.process.poll() is None
+
+    def kill(self):
+        """Kill the worker process and everything it started."""
+        process = self.process
+        if process is None:
+            return
+        try:
+            if os.name == "posix":
+                # Its children may outlive it: the whole group goes, even once
+                # the worker itself has exited
+                os.killpg(process.pid, signal.SIGKILL)
+            elif process.poll() is None:
+                process.kill()
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+    def run(self, job: Dict[str, Any], on_progress: Optional[Callable[[float, str, Dict[str, Any]], None]] = None,
+            on_partial: Optional[Callable[[float, List[str]], None]] = None,
+            cancel_event: Optional[threading.Event] = None) -> Any:
+        """Send a job to the worker and wait for its result.
+
+        Args:
+            job: Job description (see core.separation_worker).
+            on_progress: Optional callback receiving (progress, message, details);
+                see core.progress.
+            on_partial: Optional callback receiving (seconds available, stems)
+                for progressive jobs.
+            cancel_event: Optional event; once set, the worker is killed, its
+                staging files removed and a fresh worker started in its place.
+
+        Returns:
+            The job's result payload.
+
+        Raises:
+            SeparationCancelled: If ``cancel_event`` was set.
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            from .separation import SeparationCancelled
+            raise SeparationCancelled("Extraction cancelled")
+        if not self.is_alive():
+            self.start()
+
+        self._job_id = job["job_id"]
+        self._on_progress = on_progress
+        self._on_partial = on_partial
+        self._result = None
+        self._done.clear()
+
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+            while not self._done.wait(CANCEL_POLL_SECONDS if cancel_event is not None else None):
+                if cancel_event.is_set():
+                    self._cancel(job)
+        finally:
+            self._job_id = None
+            self._on_progress = None
+            self._on_partial = None
+
+        result = self._result or {"event": "error", "error": "Separation worker exited unexpectedly"}
+        if result["event"] != "done":
+            if cancel_event is not None and cancel_event.is_set():
+                from .separation import SeparationCancelled
+                raise SeparationCancelled("Extraction cancelled")
+            raise Exception(result.get("error", "Separation failed"))
+        return result["result"]
+
+    def _cancel(self, job: Dict[str, Any]):
+        """Stop the running job by replacing the worker process."""
+        from .separation import SeparationCancelled, remove_staging_dirs
+
+        pid = self.process.pid
+        self.kill()
+        print(f"Killed separation worker {self.index} (pid {pid}) to cancel job {job['job_id']}")
+        if job.get("output_dir"):
+            remove_staging_dirs(job["output_dir"], pid)
+
+        # Warm up the replacement while the slot goes to the next job
+        self.start()
+        raise SeparationCancelled("Extraction cancelled")
+
+    def _read_events(self, process: subprocess.Popen):
+        """Route the worker's JSON events to the job waiting on it."""
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+
+            kind = event.get("event")
+            if kind == "ready":
+                self.ready.set()
+            elif event.get("job_id") != self._job_id:
+                continue
+            elif kind == "progress":
+                if self._on_progress:
+                    self._on_progress(event["progress"], event.get("message"), event.get("details") or {})
+            elif kind == "partial":
+                if self._on_partial:
+                    self._on_partial(event["available_until"], event.get("stems") or [])
+            elif kind in ("done", "error"):
+                self._result = event
+                self._done.set()
+
+        # The process is gone; release whoever was waiting on it
+        process.wait()
+        if process is self.process:
+            self._done.set()
+
+
+class SeparationPool:
+    """Pool of warm separation worker processes."""
+
+    def __init__(self, workers: int, threads_per_worker: int = 0,
+                 model_name: Optional[str] = None, device: str = "cpu"):
+        """Start the pool.
+
+        Args:
+            workers: Number of worker processes.
+            threads_per_worker: Torch threads per worker; 0 splits the cores
+                evenly between workers.
+            model_name: Model each worker preloads. Defaults to the
+                ``default_stem_model`` setting.
+            device: Torch device the workers run on.
+        """
+        self.size = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.size)
+        self.model_name = model_name or get_setting("default_stem_model", "htdemucs")
+        self.device = device
+
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self.workers: List[_Worker] = []
+        for index in range(self.size):
+            worker = _Worker(index, self.model_name, self.device, self.threads_per_worker)
+            worker.start()
+            self.workers.append(worker)
+            self._idle.put(worker)
+
+    def run(self, audio_path: str, output_dir: str, model_name: str, selected_stems: List[str],
+            two_stem_mode: bool = False, primary_stem: str = "vocals",
+            on_progress: Optional[Callable[[float, str, Dict[str, Any]], None]] = None,
+            on_partial: Optional[Callable[[float, List[str]], None]] = None,
+            output_format: str = "mp3", encode: bool = True,
+            cancel_event: Optional[threading.Event] = None,
+            partial_directory: str = "") -> Dict[str, Any]:
+        """Run a separation, blocking until done.
+
+        Tracks longer than ``segment_parallel_min_seconds`` are split across
+        all workers (see run_segmented); others run on the next idle worker.
+        Split tracks finish out of time order, so they publish no partial
+        stems.
+
+        Args:
+            audio_path: Path to the source audio.
+            output_dir: Directory to write the stems to.
+            model_name: Demucs model name.
+            selected_stems: Stems to keep.
+            two_stem_mode: Whether to produce primary/other only.
+            primary_stem: Primary stem for two-stem mode.
+            on_progress: Optional callback receiving (progress, message, details);
+                see core.progress.
+            on_partial: Optional callback receiving (seconds available, stems);
+                see run_separation.
+            output_format: One of stem_encoder.OUTPUT_FORMATS.
+            encode: When False, return the raw stems instead of encoding
+                them; see run_separation.
+            cancel_event: Optional event; once set, the workers running the
+                job are killed and replaced, and SeparationCancelled is raised
+                within CANCEL_POLL_SECONDS.
+            partial_directory: Directory of the run's partial stems; see
+                run_separation.
+
+        Returns:
+            Dictionary of stem name to output path, or the raw stems.
+        """
+        if self.size > 1 and float(get_setting("segment_parallel_min_seconds", 600) or 0) > 0:
+            from .separation import probe_duration
+            if self.uses_segments(probe_duration(audio_path)):
+                return self.run_segmented(audio_path, output_dir, model_name, selected_stems,
+                                          two_stem_mode, primary_stem, on_progress, output_format, encode,
+                                          cancel_event)
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "audio_path": audio_path,
+            "output_dir": output_dir,
+            "model_name": model_name,
+            "selected_stems": selected_stems,
+            "two_stem_mode": two_stem_mode,
+            "primary_stem": primary_stem,
+            "progressive": on_partial is not None,
+            "output_format": output_format,
+            "encode": encode,
+            "partial_dir": partial_directory,
+        }
+        return self.run_job(job, on_progress, on_partial, cancel_event)
+
+    def uses_segments(self, audio_seconds: float) -> bool:
+        """Whether a track this long is split across all workers (see run_segmented)."""
+        min_seconds = float(get_setting("segment_parallel_min_seconds", 600) or 0)
+        return self.size > 1 and min_seconds > 0 and audio_seconds >= min_seconds
+
+    def run_job(self, job: Dict[str, Any], on_progress: Optional[Callable[[float, str, Dict[str, Any]], None]] = None,
+                on_partial: Optional[Callable[[float, List[str]], None]] = None,
+                cancel_event: Optional[threading.Event] = None) -> Any:
+        """Run a raw worker job on the next idle worker, blocking until done."""
+        job.setdefault("job_id", uuid.uuid4().hex)
+        worker = self._idle.get()
+        try:
+            return worker.run(job, on_progress, on_partial, cancel_event)
+        finally:
+            self._idle.put(worker)
+
+    def run_segmented(self, audio_path: str, output_dir: str, model_name: str, selected_stems: List[str],
+                      two_stem_mode: bool = False, primary_stem: str = "vocals",
+                      on_progress: Optional[Callable[[float, str, Dict[str, Any]], None]] = None,
+                      output_format: str = "mp3", encode: bool = True,
+                      cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Separate one long track using every worker at once.
+
+        A worker decodes and normalizes the track to a shared .npy file and
+        reports the model's metadata, so this process loads no model and
+        decodes nothing; the model segments are then shared out between the
+        workers, see separate_segmented.
+
+        Args:
+            Same as run.
+
+        Returns:
+            Dictionary of stem name to output path, or the raw stems.
+        """
+        from .config import get_stem_recipe
+        from .separation import select_stems, check_cancelled
+        from .stem_encoder import write_raw_stems, encode_stems
+        from .progress import progress_details, PHASE_DECODING, PHASE_SEPARATING, PHASE_ENCODING
+
+        def report(progress, message, phase, segment=None, segments=None):
+            if on_progress:
+                on_progress(progress, message, progress_details(phase, segment, segments))
+
+        if not os.path.exists(audio_path):
+            raise FileNotFoundError(f"Source audio file not found: {audio_path}")
+
+        scratch_dir = tempfile.mkdtemp(prefix="stemtubes_segments_")
+        try:
+            report(1.0, "Décodage de l'audio...", PHASE_DECODING)
+            mix_path = os.path.join(scratch_dir, "mix.npy")
+            metadata = self.run_job({
+                "kind": "prepare",
+                "audio_path": audio_path,
+                "model_name": model_name,
+                "mix_path": mix_path,
+            }, cancel_event=cancel_event)
+
+            check_cancelled(cancel_event)
+            report(10.0, f"Extracting stems ({self.size} workers)", PHASE_SEPARATING)
+            sources = self.separate_segmented(
+                model_name, metadata, mix_path,
+                on_progress=lambda done, total: report(10.0 + done / total * 80.0, "Extracting stems",
+                                                       PHASE_SEPARATING, done, total),
+                cancel_event=cancel_event
+            )
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        sources = sources * metadata["std"] + metadata["mean"]
+
+        report(90.0, "Finalisation en cours...", PHASE_ENCODING)
+        recipe = get_stem_recipe(model_name, selected_stems, two_stem_mode, primary_stem)
+        raw = write_raw_stems(select_stems(sources, metadata["sources"], recipe), metadata["samplerate"], output_dir)
+        if not encode:
+            return raw
+        return encode_stems(raw, output_dir, output_format,
+                            lambda fraction, message: report(90.0 + fraction * 9.0, message, PHASE_ENCODING))
+
+    def separate_segmented(self, model_name: str, metadata: Dict[str, Any], mix_path: str,
+                           on_progress: Optional[Callable[[int, int], None]] = None,
+                           cancel_event: Optional[threading.Event] = None):
+        """Apply a model to a normalized mix, spreading its segments over the workers.
+
+        Each plain model (every member of a bag in turn) cuts the mix into the
+        same overlapping segments apply_model uses. The segment offsets are
+        split into one contiguous share per worker; each worker returns its
+        triangular-window weighted sum and weights, which are added up and
+        divided here. The result equals apply_model(shifts=0) up to float
+        rounding.
+
+        Args:
+            model_name: Model name, for the workers to load.
+            metadata: The model's sources and members (see
+                separation.model_metadata), with the mix's channels and length.
+            mix_path: Normalized audio (channels, samples) saved with
+                ``numpy.save``; the workers' results are written next to it.
+            on_progress: Optional callback receiving (segments done, total
+                segments), counting the segments of every bag member.
+            cancel_event: Optional event; once set, every worker on a share
+                is killed and SeparationCancelled raised.
+
+        Returns:
+            Separated sources tensor (sources, channels, samples).
+        """
+        import numpy as np
+        import torch
+        from .separation import plan_offsets
+
+        scratch_dir = os.path.dirname(mix_path)
+        length = metadata["length"]
+        channels = metadata["channels"]
+        num_sources = len(metadata["sources"])
+        members = metadata["members"]
+
+        estimates = torch.zeros(num_sources, channels, length)
+        totals = [0.0] * num_sources
+        total_segments = sum(len(plan_offsets(length, member["segment_length"])) for member in members)
+        segments_before = 0
+        for member_index, member in enumerate(members):
+            seg_length = member["segment_length"]
+            weights = member["weights"]
+            offsets = plan_offsets(length, seg_length)
+            per_share = -(-len(offsets) // self.size)
+            shares = [offsets[i:i + per_share] for i in range(0, len(offsets), per_share)]
+            done = [0] * len(shares)
+
+            def share_progress(index, details, segments_before=segments_before):
+                done[index] = details.get("segment", done[index])
+                if on_progress:
+                    on_progress(segments_before + sum(done), total_segments)
+
+            jobs = []
+            for index, share in enumerate(shares):
+                # Give each worker enough context around its share for the
+                # padding apply_model takes from neighbouring audio
+                jobs.append({
+                    "kind": "segments",
+                    "mix_path": mix_path,
+                    "model_name": model_name,
+                    "sub_model": member_index if weights is not None else None,
+                    "window_start": max(0, share[0] - seg_length),
+                    "window_end": min(length, share[-1] + 2 * seg_length),
+                    "offsets": share,
+                    "segment_length": seg_length,
+                    "out_path": os.path.join(scratch_dir, f"out_{member_index}_{index}.npy"),
+                    "weight_path": os.path.join(scratch_dir, f"weight_{member_index}_{index}.npy"),
+                })
+
+            with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+                futures = [
+                    executor.submit(self.run_job, job,
+                                    lambda progress, message, details, index=index: share_progress(index, details),
+                                    None, cancel_event)
+                    for index, job in enumerate(jobs)
+                ]
+                results = [future.result() for future in futures]
+
+            out = torch.zeros(num_sources, channels, length)
+            sum_weight = torch.zeros(length)
+            for job, result in zip(jobs, results):
+                start, end = job["window_start"], job["window_end"]
+                out[..., start:end] += torch.from_numpy(np.load(result["out_path"]))
+                sum_weight[start:end] += torch.from_numpy(np.load(result["weight_path"]))
+                os.remove(result["out_path"])
+                os.remove(result["weight_path"])
+            out /= sum_weight
+
+            if weights is None:
+                return out
+            for k, inst_weight in enumerate(weights):
+                estimates[k] += out[k] * inst_weight
+                totals[k] += inst_weight
+            segments_before += len(offsets)
+
+        for k in range(num_sources):
+            estimates[k] /= totals[k]
+        return estimates
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop every worker process and whatever it started.
+
+        Workers run in process groups of their own, so a Ctrl-C in the
+        terminal never reaches them: this must be called for them not to
+        outlive the application, holding their model and GPU memory.
+
+        Args:
+            timeout: Seconds each worker gets to exit before it is killed.
+        """
+        for worker in self.workers:
+            if worker.is_alive():
+                try:
+                    worker.process.stdin.close()
+                except OSError:
+                    pass
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                pass
+            worker.kill()
+
+
+# Create a singleton instance
+_separation_pool = None
+_separation_pool_lock = threading.Lock()
+
+def get_separation_pool() -> Optional[SeparationPool]:
+    """Get the separation pool singleton, or None when the pool is disabled.
+
+    The pool is enabled by setting ``extraction_workers`` above zero.
+    """
+    global _separation_pool
+    workers = int(get_setting("extraction_workers", 0) or 0)
+    if workers <= 0:
+        return None
+
+    with _separation_pool_lock:
+        if _separation_pool is None:
+            import torch
+            device = "cuda" if torch.cuda.is_available() and get_setting("use_gpu_for_extraction", True) else "cpu"
+            _separation_pool = SeparationPool(
+                workers,
+                int(get_setting("extraction_threads_per_worker", 0) or 0),
+                device=device
+            )
+            atexit.register(shutdown_separation_pool)
+    return _separation_pool
+
+
+def shutdown_separation_pool():
+    """Stop the separation pool's workers, if the pool was started."""
+    global _separation_pool
+    with _separation_pool_lock:
+        pool, _separation_pool = _separation_pool, None
+    if pool is not None:
+        print(f"Stopping {pool.size} separation worker(s)")
+        pool.shutdown()
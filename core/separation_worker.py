@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Resident separation worker for StemTubes application.
+Started by core.separation_pool; keeps a Demucs model loaded and runs jobs
+received as JSON lines on stdin, answering with JSON events on stdout.
+"""
+import os
+import sys
+import json
+import argparse
+import traceback
+
+# Allow running as a script as well as with ``python -m core.separation_worker``
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def prepare_segments(job, device):
+    """Decode and normalize a long track for segment-parallel separation.
+
+    Done here, where the model is already loaded, so the pool process needs
+    neither a model of its own nor a decode: the normalized mix goes to the
+    .npy file the segment jobs map, and the model's metadata comes back
+    with the normalization statistics.
+    """
+    import numpy as np
+    from core.separation import load_model, load_audio, normalize, model_metadata
+
+    model = load_model(job["model_name"], device)
+    audio, sr = load_audio(job["audio_path"], model)
+    mix, mean, std = normalize(audio)
+    np.save(job["mix_path"], mix.cpu().numpy())
+
+    metadata = model_metadata(model)
+    metadata.update({
+        "samplerate": sr,
+        "channels": mix.shape[0],
+        "length": mix.shape[-1],
+        "mean": float(mean),
+        "std": float(std),
+    })
+    return metadata
+
+
+def run_segments(job, device, on_progress):
+    """Separate a share of a long track's segments (segment-parallel mode).
+
+    The normalized mix is read from a memory-mapped .npy file; the weighted
+    output and weight sum for this share are written next to it.
+    """
+    import numpy as np
+    import torch
+    from core.separation import load_model, separate_offsets
+    from core.progress import progress_details, PHASE_SEPARATING
+
+    model = load_model(job["model_name"], device)
+    if job.get("sub_model") is not None:
+        model = model.models[job["sub_model"]]
+
+    start, end = job["window_start"], job["window_end"]
+    mix = np.load(job["mix_path"], mmap_mode="r")[:, start:end]
+    window = torch.from_numpy(np.ascontiguousarray(mix))
+    offsets = [offset - start for offset in job["offsets"]]
+
+    out, sum_weight = separate_offsets(
+        model, window, offsets, job["segment_length"], device,
+        on_progress=lambda done, total: on_progress(done / total * 100.0, None,
+                                                    progress_details(PHASE_SEPARATING, done, total))
+    )
+
+    np.save(job["out_path"], out.numpy())
+    np.save(job["weight_path"], sum_weight.numpy())
+    return {"out_path": job["out_path"], "weight_path": job["weight_path"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StemTubes separation worker")
+    parser.add_argument("--model", default="htdemucs", help="Model to preload")
+    parser.add_argument("--device", default="cpu", help="Torch device")
+    parser.add_argument("--threads", type=int, default=0, help="Torch intra-op threads (0 = torch default)")
+    args = parser.parse_args()
+
+    # stdout carries the protocol; everything else printed goes to stderr
+    events = sys.stdout
+    sys.stdout = sys.stderr
+
+    def emit(event):
+        events.write(json.dumps(event) + "\n")
+        events.flush()
+
+    import torch
+    from core.separation import load_model, run_separation
+    from core.progress import ProgressThrottle
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    device = torch.device(args.device)
+
+    # Preload the default model so the first job starts warm
+    try:
+        load_model(args.model, device)
+    except Exception as e:
+        print(f"Worker {os.getpid()}: could not preload {args.model}: {e}")
+    emit({"event": "ready", "pid": os.getpid()})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        job = json.loads(line)
+        job_id = job["job_id"]
+
+        # Structured progress, at most progress_emit_hz events a second
+        on_progress = ProgressThrottle(
+            lambda progress, message, details, job_id=job_id: emit({
+                "event": "progress", "job_id": job_id,
+                "progress": progress, "message": message, "details": details,
+            })
+        )
+
+        def on_partial(available_until, stems):
+            emit({"event": "partial", "job_id": job_id, "available_until": available_until, "stems": stems})
+
+        try:
+            if job.get("kind") == "prepare":
+                result = prepare_segments(job, device)
+            elif job.get("kind") == "segments":
+                result = run_segments(job, device, on_progress)
+            else:
+                result = run_separation(
+                    job["audio_path"],
+                    job["output_dir"],
+                    job["model_name"],
+                    job.get("selected_stems") or [],
+                    job.get("two_stem_mode", False),
+                    job.get("primary_stem", "vocals"),
+                    device,
+                    on_progress=on_progress,
+                    on_partial=on_partial if job.get("progressive") else None,
+                    output_format=job.get("output_format", "mp3"),
+                    encode=job.get("encode", True),
+                    partial_directory=job.get("partial_dir", "")
+                )
+            emit({"event": "done", "job_id": job_id, "result": result})
+        except Exception as e:
+            traceback.print_exc()
+            emit({"event": "error", "job_id": job_id, "error": str(e)})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Single-flight coalescing for StemTubes application.
+Identical jobs asked for at the same time (the same video by two users, the
+same separation from two tabs) share one run: the first becomes the leader
+and does the work, the others follow it and get its progress and results.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, List
+
+
+class SingleFlight:
+    """Process-wide table of the jobs running for each key, leader first."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, List[Any]] = {}
+
+    def join(self, key: Hashable, member: Any) -> bool:
+        """Attach a job to the run for a key, starting one if there is none.
+
+        Args:
+            key: What the job does, e.g. (video ID, format).
+            member: The job, in whatever form the caller fans results out to.
+
+        Returns:
+            True if the job leads the run and must do the work.
+        """
+        with self._lock:
+            members = self._flights.get(key)
+            if members is None:
+                self._flights[key] = [member]
+                return True
+            members.append(member)
+            return False
+
+    def members(self, key: Hashable, leader: Any = None) -> List[Any]:
+        """Jobs attached to the run for a key, leader first.
+
+        Args:
+            key: Key of the run.
+            leader: When given, only return them if this job leads the run.
+        """
+        with self._lock:
+            members = self._flights.get(key, [])
+            if members and leader is not None and members[0] != leader:
+                return []
+            return list(members)
+
+    def finish(self, key: Hashable, leader: Any = None) -> List[Any]:
+        """End the run for a key and return its jobs.
+
+        A job asking for the same work afterwards starts a new run, so this
+        must only be called once the result is where that run will find it.
+
+        Args:
+            key: Key of the run.
+            leader: When given, only end the run if this job still leads it
+                (it may have been abandoned and replaced meanwhile).
+        """
+        with self._lock:
+            members = self._flights.get(key)
+            if members is None or (leader is not None and members[0] != leader):
+                return []
+            return self._flights.pop(key)
+
+    def abandon(self, key: Hashable, is_live: Callable[[Any], bool]) -> List[Any]:
+        """End the run for a key if none of its jobs is still wanted.
+
+        Checked and done under one lock, so no job can join a run that is
+        being given up.
+
+        Args:
+            key: Key of the run.
+            is_live: Tells whether a job still wants the result.
+
+        Returns:
+            The jobs of the abandoned run, leader first, or an empty list if
+            the run goes on (or is already over).
+        """
+        with self._lock:
+            members = self._flights.get(key, [])
+            if not members or any(is_live(member) for member in members):
+                return []
+            return self._flights.pop(key)
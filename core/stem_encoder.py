@@ -0,0 +1,186 @@
+"""
+Stem encoder for StemTubes application.
+Encodes separated stems to their output format in a stage of their own:
+separation only dumps raw float32 PCM, and every stem is then encoded by its
+own FFmpeg process, in parallel and outside the extraction slot, so encoding
+one job overlaps the next job's inference.
+"""
+import os
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Optional, Callable, Any
+
+from .config import get_setting, get_ffmpeg_path
+
+
+# Output format -> file extension and FFmpeg encoder arguments
+OUTPUT_FORMATS = {
+    "mp3": {"extension": "mp3", "args": ["-c:a", "libmp3lame", "-b:a", "320k"]},
+    "opus": {"extension": "opus", "args": ["-c:a", "libopus", "-b:a", "192k", "-ar", "48000"]},
+    "flac": {"extension": "flac", "args": ["-c:a", "flac"]},
+    "wav": {"extension": "wav", "args": ["-c:a", "pcm_s16le"]},
+}
+DEFAULT_FORMAT = "mp3"
+
+
+def check_format(output_format: Optional[str]) -> str:
+    """Validate an output format name, defaulting to the ``stem_output_format`` setting.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    output_format = (output_format or get_setting("stem_output_format", DEFAULT_FORMAT)).lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format} "
+                         f"(expected one of {', '.join(OUTPUT_FORMATS)})")
+    return output_format
+
+
+def stem_filename(stem_name: str, output_format: str) -> str:
+    """File name of a stem in a given output format."""
+    return f"{stem_name}.{OUTPUT_FORMATS[output_format]['extension']}"
+
+
+def write_raw_stems(stems: Dict[str, Any], sr: int, output_dir: str) -> Dict[str, Any]:
+    """Dump separated stems as raw float32 PCM, ready for encode_stems.
+
+    The files go to a staging directory inside ``output_dir`` (see
+    separation.staging_dir), which encode_stems removes once done.
+
+    Args:
+        stems: Dictionary of stem name to audio tensor (channels, samples).
+        sr: Sample rate.
+        output_dir: Directory the stems will be published to.
+
+    Returns:
+        JSON-serializable description of the raw stems: ``directory``,
+        ``samplerate``, ``channels`` and ``stems`` (stem name to raw path).
+    """
+    from .separation import staging_dir
+
+    directory = staging_dir(output_dir)
+    raw_paths = {}
+    channels = 0
+    for stem_name, audio in stems.items():
+        channels = audio.shape[0]
+        raw_paths[stem_name] = os.path.join(directory, f"{stem_name}.f32")
+        audio.cpu().float().t().contiguous().numpy().astype("<f4", copy=False).tofile(raw_paths[stem_name])
+
+    return {"directory": directory, "samplerate": sr, "channels": channels, "stems": raw_paths}
+
+
+def discard_raw_stems(raw: Dict[str, Any]):
+    """Delete raw stems that will not be encoded."""
+    shutil.rmtree(raw["directory"], ignore_errors=True)
+
+
+def _encode_file(raw_path: str, samplerate: int, channels: int, output_path: str, output_format: str):
+    cmd = [
+        get_ffmpeg_path(), "-v", "error", "-nostdin", "-y",
+        "-f", "f32le", "-ar", str(samplerate), "-ac", str(channels), "-i", raw_path,
+        *OUTPUT_FORMATS[output_format]["args"],
+        output_path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Encoding {os.path.basename(output_path)} failed: {result.stderr.strip()}")
+
+
+class StemEncoder:
+    """Shared pool of encoding slots, one FFmpeg process per slot."""
+
+    def __init__(self, workers: int = 0):
+        """Initialize the encoder.
+
+        Args:
+            workers: Number of stems encoded at once; 0 uses one per core.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stem-encoder")
+
+    def encode_raw(self, raw: Dict[str, Any], output_format: str = DEFAULT_FORMAT,
+                   on_progress: Optional[Callable[[float, str], None]] = None) -> Dict[str, str]:
+        """Encode raw stems next to their raw files, all at once.
+
+        Args:
+            raw: Raw stems, as returned by write_raw_stems.
+            output_format: One of OUTPUT_FORMATS.
+            on_progress: Optional callback receiving (fraction done, message).
+
+        Returns:
+            Dictionary of stem name to encoded (still staged) file path.
+        """
+        output_format = check_format(output_format)
+        staged = {
+            stem_name: os.path.join(raw["directory"], stem_filename(stem_name, output_format))
+            for stem_name in raw["stems"]
+        }
+        futures = {
+            self._executor.submit(_encode_file, raw_path, raw["samplerate"], raw["channels"],
+                                  staged[stem_name], output_format): stem_name
+            for stem_name, raw_path in raw["stems"].items()
+        }
+
+        if on_progress:
+            on_progress(0.0, f"Encodage {output_format.upper()} ({len(futures)} stems)...")
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            if on_progress:
+                on_progress(done / len(futures), f"Encodage de {futures[future]} terminé")
+
+        return staged
+
+    def encode(self, raw: Dict[str, Any], output_dir: str, output_format: str = DEFAULT_FORMAT,
+               on_progress: Optional[Callable[[float, str], None]] = None) -> Dict[str, str]:
+        """Encode raw stems and publish them to ``output_dir``.
+
+        The stems are moved into place together once every one of them is
+        encoded; the run's partial stems (``partial_dir`` of the raw
+        stems, if any) are removed then.
+
+        Args:
+            raw: Raw stems, as returned by write_raw_stems.
+            output_dir: Directory to publish the stems to.
+            output_format: One of OUTPUT_FORMATS.
+            on_progress: Optional callback receiving (fraction done, message).
+
+        Returns:
+            Dictionary of stem name to output path.
+        """
+        from .separation import publish_files
+        from .partial_stems import remove_partial_stems
+
+        try:
+            published = publish_files(self.encode_raw(raw, output_format, on_progress), output_dir)
+            remove_partial_stems(raw.get("partial_dir"))
+            return published
+        finally:
+            discard_raw_stems(raw)
+
+    def shutdown(self):
+        """Stop accepting stems; running encodes finish."""
+        self._executor.shutdown(wait=False)
+
+
+# Create a singleton instance
+_stem_encoder = None
+_stem_encoder_lock = threading.Lock()
+
+def get_stem_encoder() -> StemEncoder:
+    """Get the stem encoder singleton instance.
+
+    Its size is the ``stem_encoding_workers`` setting (0 = one per core).
+    """
+    global _stem_encoder
+    with _stem_encoder_lock:
+        if _stem_encoder is None:
+            _stem_encoder = StemEncoder(int(get_setting("stem_encoding_workers", 0) or 0))
+    return _stem_encoder
+
+
+def encode_stems(raw: Dict[str, Any], output_dir: str, output_format: str = DEFAULT_FORMAT,
+                 on_progress: Optional[Callable[[float, str], None]] = None) -> Dict[str, str]:
+    """Encode raw stems on the shared encoder; see StemEncoder.encode."""
+    return get_stem_encoder().encode(raw, output_dir, output_format, on_progress)
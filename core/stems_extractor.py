@@ -4,39 +4,55 @@ Handles extraction of audio stems using Demucs models.
 """
 import os
 import time
+import uuid
 import threading
-import queue
 from typing import Dict, List, Optional, Callable, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
-import tempfile
-import subprocess
-import shutil
-import platform
-import sys
 
 import torch
-import torchaudio
-from demucs.pretrained import get_model
-from demucs.apply import apply_model
-from demucs.separate import load_track
 
-from .config import get_setting, STEM_MODELS, MODELS_DIR, get_ffmpeg_path, ensure_valid_downloads_directory
-from .processed_db import (
-    get_extraction_dir,
-    save_extraction_dir,
-    remove_extraction,
-)
-import hashlib
+from .config import get_setting, get_stem_recipe, MODELS_DIR, STEM_MODELS, ensure_valid_downloads_directory
+from .extraction_scheduler import ExtractionScheduler, get_extraction_scheduler, check_priority
+from .separation import run_separation, derive_stems, probe_duration, SeparationCancelled, remove_stale_staging_dirs
+from .stem_encoder import check_format, encode_stems, discard_raw_stems
+from .partial_stems import partial_dir, remove_partial_stems
+from .progress import ProgressThrottle, progress_details, PHASE_SEPARATING, PHASE_ENCODING, PHASE_FINALIZING
+from .separation_pool import get_separation_pool
+from . import extraction_cache
+from .file_hashes import file_hash
+from .job_registry import JobRegistry, get_job_registry, QUEUED, ACTIVE, COMPLETED, FAILED
+from .cost_model import get_cost_model, remaining_seconds
+from .single_flight import SingleFlight
 
 
-def _file_hash(path: str) -> str:
-    """Return SHA256 hash of a file."""
-    h = hashlib.sha256()
-    with open(path, 'rb') as f:
-        for chunk in iter(lambda: f.read(8192), b''):
-            h.update(chunk)
-    return h.hexdigest()
+# Extractions running or queued in the process, keyed by their extraction
+# cache key: the same audio, model and stems asked for by several sessions
+# is separated once
+_in_flight = SingleFlight()
+
+
+def variant_output_dir(output_dir: str, model_name: str, selected_stems: List[str],
+                       two_stem_mode: bool, primary_stem: str) -> str:
+    """Subdirectory of ``output_dir`` the stems of one model and stem set go to.
+
+    Named ``<model>`` for every stem of the model, ``<model>_two_stem_<primary>``
+    or ``<model>_<stems>`` otherwise, so results of other models or stem sets
+    on the same track never overwrite each other. A directory already named
+    so is returned as is.
+    """
+    available = STEM_MODELS.get(model_name, {}).get("stems", [])
+    recipe = get_stem_recipe(model_name, selected_stems, two_stem_mode, primary_stem)
+    if two_stem_mode and primary_stem in available:
+        variant = f"{model_name}_two_stem_{primary_stem}"
+    elif sorted(recipe) == sorted(available):
+        variant = model_name
+    else:
+        variant = f"{model_name}_{'_'.join(sorted(recipe))}"
+
+    if os.path.basename(os.path.normpath(output_dir)) == variant:
+        return output_dir
+    return os.path.join(output_dir, variant)
 
 
 class ExtractionStatus(Enum):
@@ -57,31 +73,88 @@ class ExtractionItem:
     selected_stems: List[str]
     two_stem_mode: bool = False
     primary_stem: str = "vocals"
+    output_format: str = ""
+    priority: str = ""
     status: ExtractionStatus = ExtractionStatus.QUEUED
     progress: float = 0.0
+    phase: str = ""
+    segment: int = 0
+    segments: int = 0
+    audio_seconds: float = 0.0
+    predicted_seconds: float = 0.0
+    predicted_slot_seconds: float = 0.0
+    started_at: float = 0.0
+    phase_started_at: float = 0.0
+    phase_seconds: Dict[str, float] = None
     extraction_id: str = ""
     error_message: str = ""
     output_paths: Dict[str, str] = None
-    zip_path: str = None
+    available_seconds: float = 0.0
+    partial_stems: List[str] = None
+    # Where the run this extraction follows writes its partial stems
+    partial_dir: str = ""
+    cancel_event: threading.Event = None
+    flight_key: str = ""
     
     def __post_init__(self):
         """Generate a unique extraction ID if not provided and initialize output_paths."""
         if not self.extraction_id:
-            self.extraction_id = f"{os.path.basename(self.audio_path)}_{int(time.time())}"
+            # Unique across users: the job registry is shared by the process
+            self.extraction_id = f"{os.path.basename(self.audio_path)}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
         
         if self.output_paths is None:
             self.output_paths = {}
+        
+        if self.partial_stems is None:
+            self.partial_stems = []
+        
+        if self.phase_seconds is None:
+            self.phase_seconds = {}
+        
+        if self.cancel_event is None:
+            self.cancel_event = threading.Event()
+        
+        # Validate the format now rather than once the stems are separated
+        self.output_format = check_format(self.output_format)
+        self.priority = check_priority(self.priority)
+    
+    def journal_payload(self) -> Dict[str, Any]:
+        """What the job journal keeps to run the extraction again after a restart."""
+        return {
+            "audio_path": self.audio_path,
+            "model_name": self.model_name,
+            "output_dir": self.output_dir,
+            "selected_stems": self.selected_stems,
+            "two_stem_mode": self.two_stem_mode,
+            "primary_stem": self.primary_stem,
+            "output_format": self.output_format,
+            "priority": self.priority,
+            "extraction_id": self.extraction_id,
+        }
+    
+    @classmethod
+    def from_journal(cls, payload: Dict[str, Any]) -> "ExtractionItem":
+        """Rebuild an extraction from its journal payload."""
+        return cls(**payload)
 
 
 class StemsExtractor:
     """Manager for handling audio stem extraction."""
     
-    def __init__(self):
-        """Initialize the stems extractor."""
-        self.extraction_queue = queue.Queue()
-        self.active_extractions: Dict[str, ExtractionItem] = {}
-        self.completed_extractions: Dict[str, ExtractionItem] = {}
-        self.failed_extractions: Dict[str, ExtractionItem] = {}
+    def __init__(self, owner: str = "default", scheduler: Optional[ExtractionScheduler] = None,
+                 registry: Optional[JobRegistry] = None):
+        """Initialize the stems extractor.
+        
+        Args:
+            owner: User the extractions belong to; also the scheduler's key
+                for fair queueing between users.
+            scheduler: Scheduler to submit jobs to. Defaults to the process-wide one.
+            registry: Registry tracking the extractions. Defaults to the
+                process-wide one.
+        """
+        self.owner = owner
+        self.scheduler = scheduler or get_extraction_scheduler()
+        self.jobs = registry or get_job_registry("extractions")
         
         # Check if GPU is available
         self.device = torch.device("cuda" if torch.cuda.is_available() and 
@@ -94,18 +167,12 @@ class StemsExtractor:
         # Ensure we have a valid downloads directory for default outputs
         self.default_output_dir = ensure_valid_downloads_directory()
         
-        # Preloaded models
-        self.models = {}
-        
-        # Start extraction worker thread
-        self.worker_thread = threading.Thread(target=self._extraction_worker, daemon=True)
-        self.worker_thread.start()
-        
         # Callbacks
-        self.on_extraction_progress: Optional[Callable[[str, float, str], None]] = None
+        self.on_extraction_progress: Optional[Callable[[str, float, str, Dict[str, Any]], None]] = None
         self.on_extraction_complete: Optional[Callable[[str], None]] = None
         self.on_extraction_error: Optional[Callable[[str, str], None]] = None
         self.on_extraction_start: Optional[Callable[[str], None]] = None
+        self.on_extraction_partial: Optional[Callable[[str, float, List[str]], None]] = None
     
     def add_extraction(self, item: ExtractionItem) -> str:
         """Add an extraction to the queue.
@@ -129,9 +196,56 @@ class StemsExtractor:
             print(f"Falling back to default directory: {self.default_output_dir}")
             item.output_dir = self.default_output_dir
         
-        self.extraction_queue.put(item)
+        # Predict the runtime now: the scheduler runs shorter jobs first
+        self._predict(item)
+        
+        # Identical extractions (same audio, model and stems) share one run;
+        # the hash is usually an index lookup since downloads are hashed
+        audio_hash = file_hash(item.audio_path) if os.path.exists(item.audio_path) else None
+        if audio_hash:
+            item.flight_key = extraction_cache.cache_key(audio_hash, item.model_name, item.selected_stems,
+                                                         item.two_stem_mode, item.primary_stem,
+                                                         item.output_format)
+        else:
+            item.flight_key = item.extraction_id
+        
+        self.jobs.add(item.extraction_id, item, self.owner)
+        if not _in_flight.join(item.flight_key, (self, item)):
+            # Follow the identical extraction already queued or running
+            print(f"Extraction {item.extraction_id} follows an identical extraction")
+            return item.extraction_id
+        self.scheduler.submit(self.owner, self, item, item.priority, item.predicted_slot_seconds)
         return item.extraction_id
     
+    def resume_extraction(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Queue again an extraction a restart interrupted.
+        
+        The separation starts over: the interrupted run's partial stems, and
+        staging directories of processes that are gone, are removed first.
+        Other jobs may be writing to the same directory, so nothing else is.
+        
+        Args:
+            payload: Journal payload of the extraction.
+            
+        Returns:
+            Extraction ID, or None if the audio file is gone.
+        """
+        item = ExtractionItem.from_journal(payload)
+        if not os.path.exists(item.audio_path):
+            # Registered as failed so the journal stops offering it
+            item.status = ExtractionStatus.FAILED
+            item.error_message = f"Audio file no longer exists: {item.audio_path}"
+            self.jobs.add(item.extraction_id, item, self.owner, FAILED)
+            print(f"Not resuming extraction {item.extraction_id}: {item.error_message}")
+            return None
+        
+        output_dir = variant_output_dir(item.output_dir, item.model_name, item.selected_stems,
+                                        item.two_stem_mode, item.primary_stem)
+        remove_partial_stems(partial_dir(output_dir, item.extraction_id))
+        remove_stale_staging_dirs(output_dir)
+        print(f"Resuming extraction: {item.extraction_id}")
+        return self.add_extraction(item)
+    
     def cancel_extraction(self, extraction_id: str) -> bool:
         """Cancel an extraction.
         
@@ -141,25 +255,35 @@ class StemsExtractor:
         Returns:
             True if the extraction was cancelled, False otherwise.
         """
-        # Check if the extraction is active
-        if extraction_id in self.active_extractions:
-            item = self.active_extractions[extraction_id]
+        item = self.jobs.get(extraction_id, self.owner)
+        if item is None:
+            return False
+        
+        # Check if the extraction is active or in the queue; its run stops
+        # unless another session's identical extraction still follows it
+        if self.jobs.transition(extraction_id, FAILED, (ACTIVE, QUEUED)):
             item.status = ExtractionStatus.CANCELLED
+            self._abandon_run(item)
             return True
         
-        # Check if the extraction is in the queue
-        for _ in range(self.extraction_queue.qsize()):
-            item = self.extraction_queue.get()
-            if item.extraction_id == extraction_id:
-                item.status = ExtractionStatus.CANCELLED
-                self.failed_extractions[extraction_id] = item
-                return True
-            else:
-                # Put the item back in the queue
-                self.extraction_queue.put(item)
-        
         return False
     
+    def _abandon_run(self, item: ExtractionItem):
+        """Stop the run of a cancelled extraction if no extraction follows it any more.
+        
+        Args:
+            item: Cancelled extraction item.
+        """
+        members = _in_flight.abandon(item.flight_key, _wants_result)
+        if not members:
+            return
+        
+        # Queued, the run is dropped; running, the separation stops at the
+        # next segment (or its worker is killed) and the slot is released then
+        extractor, leader = members[0]
+        extractor.scheduler.cancel(leader.extraction_id)
+        leader.cancel_event.set()
+    
     def get_extraction_status(self, extraction_id: str) -> Optional[ExtractionItem]:
         """Get the status of an extraction.
         
@@ -169,26 +293,7 @@ class StemsExtractor:
         Returns:
             Extraction item or None if not found.
         """
-        # Check active extractions
-        if extraction_id in self.active_extractions:
-            return self.active_extractions[extraction_id]
-        
-        # Check completed extractions
-        if extraction_id in self.completed_extractions:
-            return self.completed_extractions[extraction_id]
-        
-        # Check failed extractions
-        if extraction_id in self.failed_extractions:
-            return self.failed_extractions[extraction_id]
-        
-        # Check queue
-        for _ in range(self.extraction_queue.qsize()):
-            item = self.extraction_queue.get()
-            self.extraction_queue.put(item)
-            if item.extraction_id == extraction_id:
-                return item
-        
-        return None
+        return self.jobs.get(extraction_id, self.owner)
     
     def get_all_extractions(self) -> Dict[str, List[ExtractionItem]]:
         """Get all extractions.
@@ -196,19 +301,7 @@ class StemsExtractor:
         Returns:
             Dictionary with active, queued, completed, and failed extractions.
         """
-        # Get queued extractions
-        queued_extractions = []
-        for _ in range(self.extraction_queue.qsize()):
-            item = self.extraction_queue.get()
-            queued_extractions.append(item)
-            self.extraction_queue.put(item)
-        
-        return {
-            "active": list(self.active_extractions.values()),
-            "queued": queued_extractions,
-            "completed": list(self.completed_extractions.values()),
-            "failed": list(self.failed_extractions.values())
-        }
+        return self.jobs.by_state(self.owner)
     
     def get_current_extraction(self) -> Optional[Dict[str, Any]]:
         """Get the currently active extraction.
@@ -217,12 +310,11 @@ class StemsExtractor:
             Dictionary containing extraction information or None if no active extraction.
         """
         # Check if there's an active extraction
-        if self.active_extractions:
-            # Get the most recent active extraction
-            extraction_id = list(self.active_extractions.keys())[0]
-            item = self.active_extractions[extraction_id]
+        active = self.jobs.jobs(ACTIVE, self.owner)
+        if active:
+            item = active[0]
             return {
-                "extraction_id": extraction_id,
+                "extraction_id": item.extraction_id,
                 "progress": item.progress,
                 "status": "Extracting stems",
                 "model_name": item.model_name,
@@ -232,574 +324,474 @@ class StemsExtractor:
         # No active extraction
         return None
         
-    def _extraction_worker(self):
-        """Worker thread for processing extractions."""
-        while True:
-            # Check if we can start a new extraction
-            if len(self.active_extractions) >= 1 and not self.using_gpu:
-                # Only allow one extraction at a time on CPU
-                time.sleep(1)
-                continue
-            
-            try:
-                # Get the next extraction item
-                item = self.extraction_queue.get(block=False)
-                
-                # Check if the extraction was cancelled
-                if item.status == ExtractionStatus.CANCELLED:
-                    self.failed_extractions[item.extraction_id] = item
-                    self.extraction_queue.task_done()
-                    continue
-                
-                # Start the extraction
-                self._start_extraction(item)
-                
-            except queue.Empty:
-                # No extractions in the queue
-                time.sleep(1)
-    
     def _start_extraction(self, item: ExtractionItem):
         """Start an extraction.
         
+        Called by the scheduler once a slot is available; runs the extraction
+        to completion in the calling thread.
+        
         Args:
             item: Extraction item to start.
         """
-        # Compute audio hash for caching
-        audio_hash = _file_hash(item.audio_path) if os.path.exists(item.audio_path) else None
-
-        # Check database for previous extraction
-        cached_dir = get_extraction_dir(audio_hash) if audio_hash else None
-        check_dir = cached_dir or item.output_dir
-
-        # Look for existing stems in the directory
-        expected_stems = item.selected_stems if item.selected_stems else ["vocals", "drums", "bass", "other"]
-        found = {}
-        for stem in expected_stems:
-            mp3 = os.path.join(check_dir, f"{stem}.mp3")
-            wav = os.path.join(check_dir, f"{stem}.wav")
-            if os.path.exists(mp3):
-                found[stem] = mp3
-            elif os.path.exists(wav):
-                found[stem] = wav
-            else:
-                found = None
-                break
-
-        if found:
-            item.output_dir = check_dir
-            item.output_paths = found
-            zip_path = os.path.join(check_dir, f"{os.path.splitext(os.path.basename(item.audio_path))[0]}_stems.zip")
-            if os.path.exists(zip_path):
-                item.zip_path = zip_path
-            item.status = ExtractionStatus.COMPLETED
-            item.progress = 100.0
-            self.completed_extractions[item.extraction_id] = item
-            if audio_hash:
-                save_extraction_dir(audio_hash, check_dir)
-            if self.on_extraction_complete:
-                self.on_extraction_complete(item.extraction_id)
+        # Move the run's extractions to active, unless all of them were
+        # cancelled while queued
+        if not self._activate_run(item, started=False):
             return
+        
+        # Audio hash for caching; downloads are already indexed, so this is
+        # usually a lookup rather than a full read
+        audio_hash = file_hash(item.audio_path) if os.path.exists(item.audio_path) else None
 
-        if cached_dir and not os.path.exists(cached_dir):
-            remove_extraction(audio_hash)
+        # Reuse a previous extraction only if it matches this request exactly
+        cached = None
+        source = None
+        if audio_hash:
+            cached = extraction_cache.lookup(audio_hash, item.model_name, item.selected_stems,
+                                             item.two_stem_mode, item.primary_stem, item.output_format)
+            if not cached:
+                # A fuller result of the same model can be mixed down instead
+                source = extraction_cache.find_source(audio_hash, item.model_name, item.selected_stems,
+                                                      item.two_stem_mode, item.primary_stem,
+                                                      item.output_format)
 
-        # Update status
-        item.status = ExtractionStatus.EXTRACTING
-        self.active_extractions[item.extraction_id] = item
+        if cached:
+            item.output_dir = cached["output_dir"]
+            item.output_paths = cached["output_paths"]
+            self._complete_run(item)
+            return
 
-        # Notify extraction start
-        if self.on_extraction_start:
-            self.on_extraction_start(item.extraction_id)
+        # Each model and stem set gets a directory of its own, so this run
+        # does not overwrite the cached results of other variants
+        item.output_dir = variant_output_dir(item.output_dir, item.model_name, item.selected_stems,
+                                             item.two_stem_mode, item.primary_stem)
 
+        # Update status and notify extraction start, for every extraction of the run
+        item.started_at = time.time()
+        item.partial_dir = partial_dir(item.output_dir, item.extraction_id)
+        self._start_members(item, self._activate_run(item, started=False))
+        
         # Create output directory if it doesn't exist
         os.makedirs(item.output_dir, exist_ok=True)
         
-        # Start extraction in a separate thread
-        extraction_thread = threading.Thread(
-            target=self._extraction_thread,
-            args=(item,),
-            daemon=True
-        )
-        extraction_thread.start()
+        # Run the extraction in the scheduler's thread
+        self._extraction_thread(item, audio_hash, source)
     
-    def _on_extraction_progress(self, extraction_id: str, progress: float, status_message: str = None):
+    def _activate_run(self, item: ExtractionItem, started: bool = True) -> List[Tuple["StemsExtractor", ExtractionItem]]:
+        """Move the queued extractions of a run to active.
+        
+        Args:
+            item: Extraction item leading the run.
+            started: Whether the separation is under way, in which case the
+                extractions moved are notified of their start.
+            
+        Returns:
+            (extractor, item) pairs of the run's active extractions.
+        """
+        active = []
+        for extractor, member in _in_flight.members(item.flight_key, (self, item)):
+            if extractor.jobs.transition(member.extraction_id, ACTIVE, (QUEUED,)) and started:
+                self._start_members(item, [(extractor, member)])
+            if extractor.jobs.state(member.extraction_id) == ACTIVE:
+                active.append((extractor, member))
+        return active
+    
+    def _start_members(self, item: ExtractionItem, members: List[Tuple["StemsExtractor", ExtractionItem]]):
+        """Mark extractions of a run as extracting and notify their start.
+        
+        Args:
+            item: Extraction item leading the run.
+            members: (extractor, item) pairs to start.
+        """
+        for extractor, member in members:
+            member.status = ExtractionStatus.EXTRACTING
+            member.started_at = item.started_at
+            # Partial stems are read from where the run writes them
+            member.output_dir = item.output_dir
+            member.partial_dir = item.partial_dir
+            
+            # Notify extraction start
+            if extractor.on_extraction_start:
+                extractor.on_extraction_start(member.extraction_id)
+    
+    def _on_run_progress(self, item: ExtractionItem, progress: float, status_message: str = None,
+                         details: Optional[Dict[str, Any]] = None):
+        """Pass the progress of a run on to every extraction following it.
+        
+        Args:
+            item: Extraction item leading the run.
+            progress: Extraction progress.
+            status_message: Optional status message.
+            details: Optional phase and segment (see core.progress).
+        """
+        for extractor, member in self._activate_run(item):
+            extractor._on_extraction_progress(member.extraction_id, progress, status_message, details)
+    
+    def _on_run_partial(self, item: ExtractionItem, available_seconds: float, stems: List[str]):
+        """Pass partial stems of a run on to every extraction following it.
+        
+        Args:
+            item: Extraction item leading the run.
+            available_seconds: Seconds of every stem that can be played.
+            stems: Names of the partial stems.
+        """
+        for extractor, member in self._activate_run(item):
+            extractor._on_extraction_partial(member.extraction_id, available_seconds, stems)
+    
+    def _on_extraction_progress(self, extraction_id: str, progress: float, status_message: str = None,
+                                details: Optional[Dict[str, Any]] = None):
         """Handle extraction progress update from worker thread.
         
         Args:
             extraction_id: Extraction ID.
             progress: Extraction progress.
             status_message: Optional status message.
+            details: Optional phase and segment (see core.progress).
         """
         # Find extraction item
-        item = self.active_extractions.get(extraction_id)
-        if not item:
+        item = self.jobs.get(extraction_id)
+        if not item or self.jobs.state(extraction_id) != ACTIVE:
             return
         
         # Update progress
         item.progress = progress
+        details = details or {}
+        if details.get("phase"):
+            # Time each phase, for the cost model
+            now = time.time()
+            if details["phase"] != item.phase:
+                if item.phase:
+                    item.phase_seconds[item.phase] = item.phase_seconds.get(item.phase, 0.0) + now - item.phase_started_at
+                item.phase_started_at = now
+            item.phase = details["phase"]
+            item.segment = details.get("segment", 0)
+            item.segments = details.get("segments", 0)
+        details = dict(details, predicted_seconds=item.predicted_seconds,
+                       remaining_seconds=_remaining_seconds(item))
         
         # Notify progress listeners
         if self.on_extraction_progress:
             status = status_message if status_message else "Extracting stems"
-            self.on_extraction_progress(extraction_id, progress, status)
+            self.on_extraction_progress(extraction_id, progress, status, details)
+    
+    def _on_extraction_partial(self, extraction_id: str, available_seconds: float, stems: List[str]):
+        """Handle more of the stems becoming playable.
+        
+        Args:
+            extraction_id: Extraction ID.
+            available_seconds: Seconds of every stem that can be played.
+            stems: Names of the partial stems.
+        """
+        item = self.jobs.get(extraction_id)
+        if not item or self.jobs.state(extraction_id) != ACTIVE:
+            return
+        
+        item.available_seconds = available_seconds
+        item.partial_stems = stems
+        
+        if self.on_extraction_partial:
+            self.on_extraction_partial(extraction_id, available_seconds, stems)
     
-    def _extraction_thread(self, item: ExtractionItem):
+    def _extraction_thread(self, item: ExtractionItem, audio_hash: Optional[str] = None,
+                           source: Optional[Dict[str, Any]] = None):
         """Thread for extracting stems.
         
+        Separation runs on the warm worker pool when one is configured,
+        otherwise in-process with the shared model cache. Either way only the
+        first job for a given model pays for the model load.
+        
+        With ``progressive_stems`` enabled the track is separated in time
+        order and each finished stretch is published as a partial stem, so
+        the mixer can start playing long before the extraction completes.
+        
+        Only the separation holds the scheduler slot: the stems come back as
+        raw PCM and are encoded by the stem encoder in a thread of their own,
+        so the next queued job's inference starts while they are encoded.
+        
+        Progress updates carry the phase and segment reached and are passed
+        on at most ``progress_emit_hz`` times a second.
+        
         Args:
             item: Extraction item.
+            audio_hash: Hash of the source audio, to record the result in the
+                extraction cache.
+            source: Cached extraction to mix the stems from instead of running
+                a model (see extraction_cache.find_source).
         """
         try:
-            # Create temporary directory for extraction
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # Get FFmpeg path for setting environment variables
-                ffmpeg_path = get_ffmpeg_path()
-                ffmpeg_dir = os.path.dirname(ffmpeg_path)
-                
-                # Ensure we have the correct ffmpeg path with ffmpeg.exe at the end on Windows
-                if platform.system() == "Windows" and not ffmpeg_path.endswith("ffmpeg.exe"):
-                    ffmpeg_path = os.path.join(ffmpeg_path, "ffmpeg.exe")
-                    
-                # Print FFmpeg information before setting up environment
-                print(f"FFmpeg path: {ffmpeg_path}")
-                print(f"FFmpeg exists: {os.path.exists(ffmpeg_path)}")
-
-                # Configure environment variables for FFmpeg
-                env = os.environ.copy()
-                
-                # Add FFmpeg directory to PATH and set FFMPEG_PATH
-                if os.path.exists(ffmpeg_dir):
-                    # On Windows, PATH separator is semicolon
-                    if platform.system() == "Windows":
-                        env["PATH"] = ffmpeg_dir + ";" + env.get("PATH", "")
-                    else:
-                        # On Unix-like systems, PATH separator is colon
-                        env["PATH"] = ffmpeg_dir + ":" + env.get("PATH", "")
-                    
-                    # Set explicit FFMPEG_PATH environment variable directly to the ffmpeg executable
-                    env["FFMPEG_PATH"] = ffmpeg_path
-                    print(f"Using FFmpeg at: {ffmpeg_path}")
-                    print(f"PATH environment: {env['PATH']}")
-                    
-                    # Verify FFmpeg is accessible
-                    try:
-                        result = subprocess.run(
-                            [ffmpeg_path, "-version"],
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            text=True,
-                            env=env,
-                            check=False
-                        )
-                        if result.returncode == 0:
-                            print(f"FFmpeg verification successful: {result.stdout.splitlines()[0]}")
-                        else:
-                            print(f"FFmpeg verification failed: {result.stderr}")
-                    except Exception as e:
-                        print(f"Error verifying FFmpeg: {e}")
-                else:
-                    print(f"FFmpeg directory not found: {ffmpeg_dir}")
-                
-                # Instead of running demucs directly, use our wrapper script
-                # to ensure environment variables are correctly set
-                cmd = [
-                    sys.executable, 
-                    os.path.join(os.path.dirname(os.path.abspath(__file__)), "wrap_demucs.py"),
-                    ffmpeg_path,  # First arg to wrapper is FFmpeg path
-                    '--mp3',                  # Output as MP3
-                    '--mp3-bitrate', '320',   # High quality MP3
-                    '-v',                     # Verbose output for progress tracking
-                    '-n', item.model_name,    # Model name
-                    '-o', temp_dir            # Output to temp directory
-                ]
-                
-                # Add device (GPU or CPU)
-                if self.device.type == 'cuda':
-                    cmd.extend(['-d', 'cuda'])
-                else:
-                    cmd.extend(['-d', 'cpu'])
-                
-                # Add two stem mode if needed
-                if item.two_stem_mode and item.primary_stem:
-                    cmd.extend(['--two-stems', item.primary_stem])
-                
-                # Add audio file at the end (use the temporary file if available)
-                temp_audio_path = None
-                try:
-                    # Obtenir l'extension du fichier original
-                    _, ext = os.path.splitext(item.audio_path)
-                    
-                    # Créer un fichier temporaire avec un nom simple
-                    temp_audio_path = os.path.join(temp_dir, f"input{ext}")
-                    
-                    # Vérifier que le répertoire source existe
-                    if not os.path.exists(item.audio_path):
-                        raise FileNotFoundError(f"Source audio file not found: {item.audio_path}")
-                    
-                    # Copier le fichier audio vers le fichier temporaire
-                    print(f"Copying audio file to temporary location: {temp_audio_path}")
-                    shutil.copy2(item.audio_path, temp_audio_path)
-                    
-                    # Utiliser le fichier temporaire pour l'extraction
-                    audio_path_for_extraction = temp_audio_path
-                    print(f"Using temporary audio file: {audio_path_for_extraction}")
-                except Exception as e:
-                    print(f"Error creating temporary audio file: {e}")
-                    # En cas d'erreur, utiliser le fichier original mais avec des guillemets
-                    audio_path_for_extraction = item.audio_path
-                    print(f"Falling back to original audio file: {audio_path_for_extraction}")
-                
-                # Add audio file to the command
-                if temp_audio_path and os.path.exists(temp_audio_path):
-                    cmd.append(temp_audio_path)
-                else:
-                    cmd.append(audio_path_for_extraction)
-                
-                # Print the command for debugging
-                print(f"Running command: {' '.join(cmd)}")
-                
-                # Run demucs.separate as a subprocess
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True,
-                    env=env  # Use the environment with FFmpeg configured
-                )
-                
-                # Store output lines for error reporting
-                output_lines = []
-                
-                # Process output to update progress
-                for line in iter(process.stdout.readline, ''):
-                    output_line = line.strip()
-                    print(f"Demucs output: {output_line}")
-                    output_lines.append(output_line)
-                    
-                    # Update progress based on output
-                    if '%' in line:
-                        try:
-                            # Try to parse progress percentage
-                            percent_str = line.split('%')[0].split('|')[-1].strip()
-                            if ':' in percent_str:
-                                percent_str = percent_str.split(':')[-1].strip()
-                            # Limiter la progression à 90% pour réserver 10% pour la phase de copie
-                            progress_value = min(float(percent_str), 90.0)
-                            item.progress = progress_value
-                            
-                            # Notify progress
-                            self._on_extraction_progress(item.extraction_id, item.progress)
-                        except (ValueError, IndexError):
-                            pass
-                
-                # Wait for process to complete
-                return_code = process.wait()
-                
-                if return_code != 0:
-                    # Join the last 20 lines of output for error reporting
-                    error_output = "\n".join(output_lines[-20:]) if output_lines else "No output captured"
-                    raise Exception(f"Demucs exited with code {return_code}. Output:\n{error_output}")
-                
-                # Indiquer que nous sommes maintenant en phase de finalisation
-                item.progress = 90.0
-                self._on_extraction_progress(item.extraction_id, item.progress, "Finalisation en cours...")
-                
-                # Copy extracted stems from temp directory to final destination
-                model_dir = os.path.join(temp_dir, item.model_name)
-                if not os.path.exists(model_dir):
-                    raise FileNotFoundError(f"Expected output directory not found: {model_dir}")
-                
-                # Find track directory (should be only one)
-                track_dirs = [d for d in os.listdir(model_dir) if os.path.isdir(os.path.join(model_dir, d))]
-                if not track_dirs:
-                    raise FileNotFoundError(f"No track directories found in {model_dir}")
-                
-                track_dir = os.path.join(model_dir, track_dirs[0])
-                
-                # Create output directory if it doesn't exist
-                os.makedirs(item.output_dir, exist_ok=True)
-                
-                # Copy each stem file to final destination
-                stem_files = {}
-                total_stems = len(item.selected_stems) if item.selected_stems else 4  # Default to 4 stems if none selected
-                for i, stem in enumerate(item.selected_stems if item.selected_stems else ["vocals", "drums", "bass", "other"]):
-                    # Mise à jour de la progression pendant la copie des fichiers (de 90% à 99%)
-                    progress = 90.0 + (i / total_stems) * 9.0
-                    item.progress = progress
-                    self._on_extraction_progress(item.extraction_id, progress, f"Copie de {stem}...")
-                    
-                    # Vérifier si le stem est sélectionné ou si tous les stems sont sélectionnés
-                    if not item.selected_stems or stem in item.selected_stems:
-                        stem_file_mp3 = os.path.join(track_dir, f"{stem}.mp3")
-                        stem_file_wav = os.path.join(track_dir, f"{stem}.wav")
-                        
-                        if os.path.exists(stem_file_mp3):
-                            output_file = os.path.join(item.output_dir, f"{stem}.mp3")
-                            shutil.copy2(stem_file_mp3, output_file)
-                            stem_files[stem] = output_file
-                        elif os.path.exists(stem_file_wav):
-                            output_file = os.path.join(item.output_dir, f"{stem}.wav")
-                            shutil.copy2(stem_file_wav, output_file)
-                            stem_files[stem] = output_file
-                
-                # Maintenir la progression à 99% pendant la finalisation
-                item.progress = 99.0
-                self._on_extraction_progress(item.extraction_id, 99.0, "Finalisation...")
-                
-                # Save stem file paths
-                item.output_paths = stem_files
-                
-                # Create ZIP archive of all stems
-                zip_path = self._create_zip_archive(item, os.path.splitext(os.path.basename(item.audio_path))[0])
-                if zip_path:
-                    item.zip_path = zip_path
-                
-                # Update status
-                item.status = ExtractionStatus.COMPLETED
-                item.progress = 100.0
-                
-                # Envoyer une notification explicite que nous avons atteint 100%
-                self._on_extraction_progress(item.extraction_id, 100.0, "Extraction terminée")
-                
-                # Move from active to completed
-                del self.active_extractions[item.extraction_id]
-                self.completed_extractions[item.extraction_id] = item
-
-                # Cache result directory
-                try:
-                    audio_hash = _file_hash(item.audio_path)
-                    save_extraction_dir(audio_hash, item.output_dir)
-                except Exception:
-                    pass
-                
-                # Notify extraction complete
-                if self.on_extraction_complete:
-                    self.on_extraction_complete(item.extraction_id)
+            on_progress = ProgressThrottle(
+                lambda progress, message, details: self._on_run_progress(item, progress, message, details)
+            )
+            on_partial = None
+            if get_setting("progressive_stems", True):
+                on_partial = lambda seconds, stems: self._on_run_partial(item, seconds, stems)
             
+            pool = get_separation_pool()
+            if source:
+                print(f"Building stems for {item.extraction_id} from {source['output_dir']}")
+                item.output_paths = derive_stems(
+                    source["recipe"],
+                    source["output_paths"],
+                    item.output_dir,
+                    on_progress=lambda fraction, message: on_progress(10.0 + fraction * 89.0, message,
+                                                                      progress_details(PHASE_ENCODING)),
+                    output_format=item.output_format
+                )
+                self._finish_extraction(item, audio_hash)
+                return
+            elif pool:
+                raw = pool.run(
+                    item.audio_path,
+                    item.output_dir,
+                    item.model_name,
+                    item.selected_stems,
+                    item.two_stem_mode,
+                    item.primary_stem,
+                    on_progress=on_progress,
+                    on_partial=on_partial,
+                    output_format=item.output_format,
+                    encode=False,
+                    cancel_event=item.cancel_event,
+                    partial_directory=item.partial_dir
+                )
+            else:
+                raw = run_separation(
+                    item.audio_path,
+                    item.output_dir,
+                    item.model_name,
+                    item.selected_stems,
+                    item.two_stem_mode,
+                    item.primary_stem,
+                    self.device,
+                    on_progress=on_progress,
+                    on_partial=on_partial,
+                    output_format=item.output_format,
+                    encode=False,
+                    cancel_event=item.cancel_event,
+                    partial_directory=item.partial_dir
+                )
         except Exception as e:
-            # Update status
-            item.status = ExtractionStatus.FAILED
-            item.error_message = str(e)
-            
-            # Move from active to failed
-            del self.active_extractions[item.extraction_id]
-            self.failed_extractions[item.extraction_id] = item
-
-            try:
-                audio_hash = _file_hash(item.audio_path)
-                remove_extraction(audio_hash)
-            except Exception:
-                pass
-            
-            # Notify extraction error
-            if self.on_extraction_error:
-                self.on_extraction_error(item.extraction_id, str(e))
+            if isinstance(e, SeparationCancelled) or item.cancel_event.is_set():
+                self._clean_up_cancelled(item)
+            else:
+                self._fail_extraction(item, e)
+            return
         
-        finally:
-            # Mark the task as done
-            self.extraction_queue.task_done()
+        # Encode outside the scheduler slot
+        threading.Thread(
+            target=self._encode_thread,
+            args=(item, raw, audio_hash, on_progress),
+            daemon=True
+        ).start()
     
-    def _load_model(self, model_name: str):
-        """Load a Demucs model.
+    def _encode_thread(self, item: ExtractionItem, raw: Dict[str, Any], audio_hash: Optional[str],
+                       on_progress: Callable[[float, str, Dict[str, Any]], None]):
+        """Thread encoding the raw stems of a separated item, then finishing it.
         
         Args:
-            model_name: Name of the model to load.
-            
-        Returns:
-            Loaded model.
+            item: Extraction item.
+            raw: Raw stems (see stem_encoder.write_raw_stems).
+            audio_hash: Hash of the source audio.
+            on_progress: The item's progress callback.
         """
-        if model_name in self.models:
-            return self.models[model_name]
-        
-        # Check if model exists in STEM_MODELS
-        if model_name not in STEM_MODELS:
-            raise ValueError(f"Model '{model_name}' not found")
-        
-        # Load model
-        model = get_model(model_name)
-        model.to(self.device)
-        
-        # Cache model
-        self.models[model_name] = model
+        if item.cancel_event.is_set():
+            self._clean_up_cancelled(item, raw)
+            return
         
-        return model
+        try:
+            item.output_paths = encode_stems(
+                raw,
+                item.output_dir,
+                item.output_format,
+                lambda fraction, message: on_progress(90.0 + fraction * 9.0, message,
+                                                      progress_details(PHASE_ENCODING))
+            )
+            self._finish_extraction(item, audio_hash)
+        except Exception as e:
+            if item.cancel_event.is_set():
+                self._clean_up_cancelled(item)
+            else:
+                self._fail_extraction(item, e)
     
-    def _load_audio(self, audio_path: str) -> Tuple[torch.Tensor, int]:
-        """Load audio from file.
+    def _finish_extraction(self, item: ExtractionItem, audio_hash: Optional[str]):
+        """Mark an item completed and cache the result.
+        
+        No archive is made here: /api/extractions/<id>/zip streams one on
+        demand (see core.zip_stream).
         
         Args:
-            audio_path: Path to audio file.
-            
-        Returns:
-            Tuple of audio tensor and sample rate.
+            item: Extraction item whose stems are written.
+            audio_hash: Hash of the source audio.
         """
-        # Check file extension
-        file_ext = os.path.splitext(audio_path)[1].lower()
+        # Envoyer une notification explicite que nous avons atteint 100%
+        self._on_run_progress(item, 100.0, "Extraction terminée", progress_details(PHASE_FINALIZING))
         
-        # If not MP3, convert to MP3 first
-        if file_ext != '.mp3':
+        # Cancelled while its stems were being encoded, the run stays
+        # cancelled and out of the cache
+        if not self._activate_run(item):
+            return
+
+        # Teach the cost model how long the separation took; only the leader
+        # timed every phase
+        if (self.jobs.state(item.extraction_id) == ACTIVE and PHASE_SEPARATING in item.phase_seconds
+                and item.audio_seconds > 0):
             try:
-                # Get FFmpeg path
-                ffmpeg_path = get_ffmpeg_path()
-                
-                # Create a temporary MP3 file
-                temp_mp3_path = os.path.splitext(audio_path)[0] + '_temp.mp3'
-                
-                # Convert to MP3 using FFmpeg
-                import subprocess
-                cmd = [
-                    ffmpeg_path,
-                    '-i', audio_path,
-                    '-vn',  # No video
-                    '-ar', '44100',  # Sample rate
-                    '-ac', '2',  # Stereo
-                    '-b:a', '192k',  # Bitrate
-                    '-f', 'mp3',  # Format
-                    temp_mp3_path
-                ]
-                
-                # Run FFmpeg
-                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                
-                # Use the converted file
-                audio_path = temp_mp3_path
-                
+                device, threads = self._execution_profile(item.audio_seconds)
+                get_cost_model().record(item.model_name, item.audio_seconds, device, threads,
+                                        time.time() - item.started_at, item.phase_seconds)
             except Exception as e:
-                print(f"Error converting audio file: {e}")
-                # Continue with original file if conversion fails
-        
-        try:
-            # First load the audio to get the sample rate
-            waveform, sample_rate = torchaudio.load(audio_path)
-            
-            # Use demucs.separate.load_track with the sample rate
+                print(f"Error recording extraction history: {e}")
 
-            audio, sr = load_track(audio_path, sample_rate, self.device)
-
-            # Clean up temporary file if it exists
-            temp_mp3_path = os.path.splitext(audio_path)[0] + '_temp.mp3'
-            if os.path.exists(temp_mp3_path) and temp_mp3_path != audio_path:
-                try:
-                    os.remove(temp_mp3_path)
-                except:
-                    pass
-                
-            return audio, sr
-        except Exception as e:
-            raise Exception(f"Failed to load audio file: {e}")
+        # Record the result in the extraction cache
+        if audio_hash:
+            try:
+                extraction_cache.store(audio_hash, item.model_name, item.selected_stems,
+                                       item.two_stem_mode, item.primary_stem,
+                                       item.output_dir, item.output_paths,
+                                       output_format=item.output_format)
+            except Exception as e:
+                print(f"Error caching extraction result: {e}")
+        
+        self._complete_run(item)
     
-    def _extract_stems(self, model, audio: torch.Tensor, sr: int, item: ExtractionItem) -> Dict[str, torch.Tensor]:
-        """Extract stems from audio.
+    def _complete_run(self, item: ExtractionItem):
+        """End a run and move its extractions to completed with the leader's stems.
+        
+        The run ends once its result is in the extraction cache, where an
+        identical extraction asked for from then on finds it.
         
         Args:
-            model: Demucs model.
-            audio: Audio tensor.
-            sr: Sample rate.
-            item: Extraction item.
-            
-        Returns:
-            Dictionary of stem name to audio tensor.
+            item: Extraction item leading the run, with its stems written.
         """
-        # Get available stems for the model
-        model_info = STEM_MODELS.get(item.model_name, {})
-        available_stems = model_info.get("stems", [])
-        
-        # Filter selected stems
-        selected_stems = [s for s in item.selected_stems if s in available_stems]
-        if not selected_stems:
-            selected_stems = available_stems
-        
-        # Apply model to extract stems
-        sources = apply_model(model, audio, self.device, progress=True)
-        
-        # Create dictionary of stems
-        stems = {}
-        for i, source_name in enumerate(model.sources):
-            if source_name in selected_stems:
-                stems[source_name] = sources[:, i]
-                
-                # Update progress
-                progress = (i + 1) / len(model.sources) * 100
-                item.progress = progress
-                
-                # Notify progress
-                self._on_extraction_progress(item.extraction_id, progress)
-        
-        # Handle two-stem mode
-        if item.two_stem_mode and item.primary_stem in stems:
-            # Create a mix of all other stems
-            other_stems = torch.zeros_like(stems[item.primary_stem])
-            for name, source in stems.items():
-                if name != item.primary_stem:
-                    other_stems += source
+        completed = []
+        for extractor, member in _in_flight.finish(item.flight_key, (self, item)):
+            # Cancelled extractions stay cancelled
+            if not extractor.jobs.transition(member.extraction_id, COMPLETED, (QUEUED, ACTIVE)):
+                continue
+            member.output_dir = item.output_dir
+            member.output_paths = item.output_paths
+            member.status = ExtractionStatus.COMPLETED
+            member.progress = 100.0
+            completed.append((extractor, member))
+        
+        # Notify extraction complete
+        for extractor, member in completed:
+            if extractor.on_extraction_complete:
+                extractor.on_extraction_complete(member.extraction_id)
+    
+    def _fail_extraction(self, item: ExtractionItem, error: Exception):
+        """Mark an item, and every extraction following it, failed.
+        
+        Args:
+            item: Extraction item leading the run.
+            error: What went wrong.
+        """
+        remove_partial_stems(item.partial_dir)
+        for extractor, member in _in_flight.finish(item.flight_key, (self, item)):
+            # Move from active to failed
+            if not extractor.jobs.transition(member.extraction_id, FAILED, (QUEUED, ACTIVE)):
+                continue
+            member.status = ExtractionStatus.FAILED
+            member.error_message = str(error)
             
-            # Keep only primary stem and "other"
-            stems = {
-                item.primary_stem: stems[item.primary_stem],
-                "other": other_stems
-            }
+            # Notify extraction error
+            if extractor.on_extraction_error:
+                extractor.on_extraction_error(member.extraction_id, str(error))
+    
+    def _clean_up_cancelled(self, item: ExtractionItem, raw: Optional[Dict[str, Any]] = None):
+        """Remove what a cancelled extraction left behind.
         
-        return stems
+        Args:
+            item: Extraction item, already moved to the failed list by
+                cancel_extraction.
+            raw: Raw stems that were waiting to be encoded, if any.
+        """
+        if raw:
+            discard_raw_stems(raw)
+        remove_partial_stems(item.partial_dir)
+        print(f"Extraction cancelled: {item.extraction_id}")
+    
+    def _execution_profile(self, audio_seconds: float) -> Tuple[str, int]:
+        """Device type and torch thread count a separation of this length runs with."""
+        pool = get_separation_pool()
+        if pool:
+            threads = pool.threads_per_worker * (pool.size if pool.uses_segments(audio_seconds) else 1)
+            return pool.device, threads
+        return self.device.type, torch.get_num_threads()
     
-    def _save_stems(self, stems: Dict[str, torch.Tensor], sr: int, item: ExtractionItem):
-        """Save stems to files.
+    def _predict(self, item: ExtractionItem):
+        """Fill in the predicted runtime of an item from the cost model.
         
         Args:
-            stems: Dictionary of stem name to audio tensor.
-            sr: Sample rate.
-            item: Extraction item.
+            item: Extraction item; its audio is probed if its duration is unknown.
         """
-        # Get base filename without extension
-        base_name = os.path.splitext(os.path.basename(item.audio_path))[0]
+        if not item.audio_seconds and os.path.exists(item.audio_path):
+            item.audio_seconds = probe_duration(item.audio_path)
         
-        # Ensure output directory exists
-        os.makedirs(item.output_dir, exist_ok=True)
+        device, threads = self._execution_profile(item.audio_seconds)
+        prediction = get_cost_model().predict(item.model_name, item.audio_seconds, device, threads)
+        item.predicted_seconds = prediction["wall_seconds"]
+        item.predicted_slot_seconds = prediction["slot_seconds"]
+    
+    def get_estimates(self) -> Dict[str, Dict[str, float]]:
+        """Predict runtime, start and completion of this session's unfinished extractions.
         
-        # Save each stem
-        for stem_name, audio in stems.items():
-            # Create output path
-            output_path = os.path.join(item.output_dir, f"{base_name}_{stem_name}.wav")
-            
-            # Save audio
-            torchaudio.save(output_path, audio.cpu(), sr)
-            
-            # Store output path
-            item.output_paths[stem_name] = output_path
+        Start times account for every job queued or running on the shared
+        scheduler, not only this session's.
         
-        # Create ZIP archive of all stems
-        zip_path = self._create_zip_archive(item, base_name)
-        if zip_path:
-            item.zip_path = zip_path
+        Returns:
+            Dictionary of extraction ID to ``predicted_seconds``,
+            ``estimated_start_seconds`` and ``estimated_remaining_seconds``
+            (both from now).
+        """
+        starts = self.scheduler.estimate_start_times(lambda queued: queued.predicted_slot_seconds,
+                                                     _remaining_slot_seconds)
+        
+        estimates = {}
+        for item in self.jobs.jobs(QUEUED, self.owner):
+            start = starts.get(item.extraction_id)
+            if start is None:
+                # Following an identical extraction: starts with it
+                members = _in_flight.members(item.flight_key)
+                start = starts.get(members[0][1].extraction_id, 0.0) if members else 0.0
+            estimates[item.extraction_id] = {
+                "predicted_seconds": item.predicted_seconds,
+                "estimated_start_seconds": start,
+                "estimated_remaining_seconds": start + item.predicted_seconds,
+            }
+        for item in self.jobs.jobs(ACTIVE, self.owner):
+            estimates[item.extraction_id] = {
+                "predicted_seconds": item.predicted_seconds,
+                "estimated_start_seconds": 0.0,
+                "estimated_remaining_seconds": _remaining_seconds(item),
+            }
+        return estimates
     
-    def _create_zip_archive(self, item: ExtractionItem, base_name: str) -> str:
-        """Create a ZIP archive of extracted stems.
+    def estimate_new(self, audio_path: str, model_name: str, audio_seconds: float = 0.0,
+                     priority: str = "") -> Dict[str, float]:
+        """Predict runtime and start of an extraction if it were queued now.
         
         Args:
-            item: Extraction item.
-            base_name: Base filename without extension.
+            audio_path: Path to the source audio.
+            model_name: Demucs model name.
+            audio_seconds: Duration of the audio, if already known.
+            priority: Priority class it would be queued with.
             
         Returns:
-            Path to the created ZIP archive, or None if creation failed.
+            Dictionary with ``audio_seconds``, ``predicted_seconds`` and
+            ``estimated_start_seconds``.
         """
-        try:
-            import zipfile
-            
-            # Create ZIP file path
-            zip_path = os.path.join(item.output_dir, f"{base_name}_stems.zip")
-            
-            # Create ZIP file
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for stem_name, file_path in item.output_paths.items():
-                    # Add file to ZIP
-                    zipf.write(file_path, os.path.basename(file_path))
-            
-            print(f"Created ZIP archive: {zip_path}")
-            return zip_path
-        except Exception as e:
-            print(f"Error creating ZIP archive: {e}")
-            return None
+        item = ExtractionItem(audio_path=audio_path, model_name=model_name, output_dir="",
+                              selected_stems=[], extraction_id="__estimate__", audio_seconds=audio_seconds,
+                              priority=priority)
+        self._predict(item)
+        starts = self.scheduler.estimate_start_times(lambda queued: queued.predicted_slot_seconds,
+                                                     _remaining_slot_seconds,
+                                                     extra=(self.owner, item, item.priority))
+        return {
+            "audio_seconds": item.audio_seconds,
+            "predicted_seconds": item.predicted_seconds,
+            "estimated_start_seconds": starts.get(item.extraction_id, 0.0),
+        }
     
     def is_using_gpu(self) -> bool:
         """Check if GPU is being used for extraction.
@@ -819,9 +811,26 @@ class StemsExtractor:
         if use_gpu != self.using_gpu and torch.cuda.is_available():
             self.using_gpu = use_gpu
             self.device = torch.device("cuda" if use_gpu else "cpu")
-            
-            # Clear model cache to reload models on the new device
-            self.models.clear()
+
+
+def _wants_result(member: Tuple[StemsExtractor, ExtractionItem]) -> bool:
+    """Whether an extraction of a run is still queued or running."""
+    extractor, item = member
+    return extractor.jobs.state(item.extraction_id) in (QUEUED, ACTIVE)
+
+
+def _remaining_seconds(item: ExtractionItem) -> float:
+    """Predicted time left until a running item completes."""
+    return remaining_seconds(item.predicted_seconds, time.time() - item.started_at, item.progress)
+
+
+def _remaining_slot_seconds(item: ExtractionItem) -> float:
+    """Predicted time left until a running item releases its scheduler slot.
+    
+    The slot is released once separation is done, at 90% progress.
+    """
+    return remaining_seconds(item.predicted_slot_seconds, time.time() - item.started_at,
+                             min(item.progress / 0.9, 100.0))
 
 
 # Create a singleton instance
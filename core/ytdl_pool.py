@@ -0,0 +1,175 @@
+"""
+yt-dlp session pool for StemTubes application.
+Keeps long-lived YoutubeDL instances, a few per option profile, so a
+download does not set up extractors and HTTP connections again, and caches
+the info of recently resolved videos for a short time.
+"""
+import copy
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import yt_dlp
+
+from .config import get_setting
+
+
+# Options that change with every download; the others make up the profile
+_PER_DOWNLOAD_OPTIONS = ('paths', 'progress_hooks', 'postprocessor_hooks')
+
+
+class _Session:
+    """A pooled YoutubeDL and the hooks of the download using it."""
+
+    def __init__(self, options: Dict[str, Any]):
+        self.progress_hooks: List[Callable[[Dict[str, Any]], None]] = []
+        self.postprocessor_hooks: List[Callable[[Dict[str, Any]], None]] = []
+        # Hooks are installed once and forward to the current download's
+        options = dict(options, progress_hooks=[self._on_progress], postprocessor_hooks=[self._on_postprocessor])
+        self.ydl = yt_dlp.YoutubeDL(options)
+
+    def _on_progress(self, d: Dict[str, Any]):
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def _on_postprocessor(self, d: Dict[str, Any]):
+        for hook in self.postprocessor_hooks:
+            hook(d)
+
+    def close(self):
+        """Release the instance's HTTP connections."""
+        try:
+            self.ydl.close()
+        except Exception as e:
+            print(f"Error closing yt-dlp session: {e}")
+
+
+class YtdlPool:
+    """Pool of YoutubeDL instances keyed by option profile, and video info cache.
+
+    An instance serves one download at a time. Its HTTP connections stay
+    open between downloads, so a video fetched after another one of the
+    same profile reuses them.
+    """
+
+    def __init__(self, max_idle: Optional[int] = None, info_ttl: Optional[float] = None):
+        """Initialize the pool.
+
+        Args:
+            max_idle: Idle instances kept per profile. Defaults to the
+                ``ytdl_pool_size`` setting.
+            info_ttl: Seconds a resolved video info stays cached. Defaults to
+                the ``ytdl_info_ttl_seconds`` setting; 0 disables the cache.
+        """
+        self.max_idle = max(1, int(max_idle or get_setting("ytdl_pool_size", 2)))
+        if info_ttl is None:
+            info_ttl = get_setting("ytdl_info_ttl_seconds", 300)
+        self.info_ttl = max(0.0, float(info_ttl or 0))
+
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[_Session]] = {}
+        # Video ID to (time resolved, info)
+        self._info: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    @contextmanager
+    def session(self, options: Dict[str, Any]) -> Iterator[yt_dlp.YoutubeDL]:
+        """Lease a YoutubeDL configured with ``options`` for one download.
+
+        ``paths`` and the hooks apply to this download only; the other
+        options select the instance. An instance a download failed in is
+        discarded rather than reused.
+
+        Args:
+            options: yt-dlp options, as for ``yt_dlp.YoutubeDL``.
+        """
+        profile = json.dumps({key: value for key, value in options.items() if key not in _PER_DOWNLOAD_OPTIONS},
+                             sort_keys=True, default=str)
+        with self._lock:
+            idle = self._idle.get(profile)
+            session = idle.pop() if idle else None
+        if session is None:
+            session = _Session({key: value for key, value in options.items() if key not in _PER_DOWNLOAD_OPTIONS})
+
+        session.ydl.params['paths'] = dict(options.get('paths') or {})
+        session.progress_hooks = list(options.get('progress_hooks') or [])
+        session.postprocessor_hooks = list(options.get('postprocessor_hooks') or [])
+        reusable = False
+        try:
+            yield session.ydl
+            reusable = True
+        finally:
+            session.progress_hooks = []
+            session.postprocessor_hooks = []
+            with self._lock:
+                idle = self._idle.setdefault(profile, [])
+                if reusable and len(idle) < self.max_idle:
+                    idle.append(session)
+                    session = None
+            if session is not None:
+                session.close()
+
+    def extract_info(self, ydl: yt_dlp.YoutubeDL, url: str, video_id: str) -> Optional[Dict[str, Any]]:
+        """Resolve a video's info (formats included) without downloading it.
+
+        Args:
+            ydl: Instance to resolve with, on a cache miss.
+            url: Video URL.
+            video_id: Cache key.
+
+        Returns:
+            A copy of the unprocessed info, or None if it could not be resolved.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._info.get(video_id)
+            if cached and now - cached[0] < self.info_ttl:
+                return copy.deepcopy(cached[1])
+
+        info = ydl.extract_info(url, download=False, process=False)
+        if not info:
+            return None
+
+        if self.info_ttl > 0:
+            with self._lock:
+                self._info[video_id] = (now, info)
+                # Forget expired entries
+                for key in [key for key, (resolved, _) in self._info.items() if now - resolved >= self.info_ttl]:
+                    del self._info[key]
+        return copy.deepcopy(info)
+
+    def download(self, ydl: yt_dlp.YoutubeDL, url: str, video_id: str) -> Optional[Dict[str, Any]]:
+        """Download a video, resolving its info from the cache when fresh.
+
+        Args:
+            ydl: Leased instance to download with.
+            url: Video URL.
+            video_id: Cache key.
+
+        Returns:
+            Processed info of the download, as ``extract_info(download=True)``
+            returns it, or None if the video could not be resolved.
+        """
+        info = self.extract_info(ydl, url, video_id)
+        if info is None:
+            return None
+        return ydl.process_ie_result(info, download=True)
+
+    def forget(self, video_id: str):
+        """Drop a video's cached info, e.g. after its stream URLs failed."""
+        with self._lock:
+            self._info.pop(video_id, None)
+
+
+# Create a singleton instance
+_ytdl_pool = None
+_ytdl_pool_lock = threading.Lock()
+
+def get_ytdl_pool() -> YtdlPool:
+    """Get the yt-dlp session pool singleton instance."""
+    global _ytdl_pool
+    with _ytdl_pool_lock:
+        if _ytdl_pool is None:
+            _ytdl_pool = YtdlPool()
+    return _ytdl_pool
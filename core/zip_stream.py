@@ -0,0 +1,73 @@
+"""
+Streamed ZIP archives for StemTubes application.
+Builds an archive of stems while it is being sent, so nothing is written to
+disk and nothing is spent compressing audio that does not compress.
+"""
+import os
+import time
+import zipfile
+from typing import Dict, Iterator
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _StreamBuffer:
+    """Write-only, unseekable file collecting what ZipFile writes.
+
+    Being unseekable makes ZipFile write each entry's sizes and CRC after
+    its data instead of going back to patch the header.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        """Return and forget everything written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files: Dict[str, str], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Generate a ZIP archive of files, stored without compression.
+
+    Args:
+        files: Dictionary of name in the archive to file path.
+        chunk_size: Bytes read from a file at a time.
+
+    Yields:
+        Successive pieces of the archive.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for arcname, path in files.items():
+            stat = os.stat(path)
+            info = zipfile.ZipInfo(arcname, time.localtime(stat.st_mtime)[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            # Known up front so ZipFile picks ZIP64 headers for huge files
+            info.file_size = stat.st_size
+
+            with open(path, "rb") as source, archive.open(info, "w") as entry:
+                while True:
+                    data = source.read(chunk_size)
+                    if not data:
+                        break
+                    entry.write(data)
+                    yield buffer.take()
+            yield buffer.take()
+
+    # Central directory
+    yield buffer.take()
@@ -96,6 +96,11 @@ function initializeSocketIO() {
         updateExtractionProgress(data);
     });
     
+    socket.on('extraction_partial', (data) => {
+        console.log('Extraction partial:', data);
+        updateExtractionPartial(data);
+    });
+    
     socket.on('extraction_complete', (data) => {
         console.log('Extraction complete:', data);
         updateExtractionComplete(data);
@@ -626,6 +631,42 @@ function updateModelDescription() {
     
     // Mettre à jour la description
     modelDescriptionElement.textContent = modelDescriptions[selectedModel] || '';
+    
+    updateModelEstimate();
+}
+
+// Durée prévue de l'extraction et attente dans la file, selon le modèle choisi
+function updateModelEstimate() {
+    const estimateElement = document.getElementById('modelEstimate');
+    const selectedModel = document.getElementById('stemModel').value;
+    estimateElement.textContent = '';
+    if (!currentExtractionItem) return;
+    
+    const params = new URLSearchParams({
+        audio_path: currentExtractionItem.audio_path,
+        model_name: selectedModel
+    });
+    fetch(`/api/extractions/estimate?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            const estimate = data[selectedModel];
+            if (!estimate || document.getElementById('stemModel').value !== selectedModel) return;
+            
+            let text = `Durée estimée : ${formatEta(estimate.predicted_seconds)}`;
+            if (estimate.estimated_start_seconds > 1) {
+                text += `, début dans ${formatEta(estimate.estimated_start_seconds)}`;
+            }
+            estimateElement.textContent = text;
+        })
+        .catch(error => console.error('Error fetching extraction estimate:', error));
+}
+
+// Formater une durée estimée en secondes
+function formatEta(seconds) {
+    if (seconds == null) return '?';
+    if (seconds < 60) return `~${Math.max(1, Math.round(seconds))} s`;
+    if (seconds < 3600) return `~${Math.round(seconds / 60)} min`;
+    return `~${Math.floor(seconds / 3600)} h ${Math.round((seconds % 3600) / 60)} min`;
 }
 
 // Fonction pour mettre à jour les options de stems en fonction du modèle sélectionné
@@ -663,6 +704,17 @@ function updateStemOptions() {
         stemCheckboxes.appendChild(checkboxDiv);
     });
     
+    // Mix dérivé : tout sauf la voix (karaoké), décoché par défaut
+    if (availableStems.includes('vocals')) {
+        const checkboxDiv = document.createElement('div');
+        checkboxDiv.className = 'stem-checkbox';
+        checkboxDiv.innerHTML = `
+            <input type="checkbox" id="instrumentalCheckbox">
+            <label for="instrumentalCheckbox">Instrumental</label>
+        `;
+        stemCheckboxes.appendChild(checkboxDiv);
+    }
+    
     // Mettre à jour également les options dans le sélecteur primaryStem
     const primaryStemSelect = document.getElementById('primaryStem');
     primaryStemSelect.innerHTML = '';
@@ -689,6 +741,7 @@ function startExtraction() {
     const modelName = document.getElementById('stemModel').value;
     const twoStemMode = document.getElementById('twoStemMode').checked;
     const primaryStem = document.getElementById('primaryStem').value;
+    const outputFormat = document.getElementById('outputFormat').value;
     
     // Get selected stems from dynamically created checkboxes
     const selectedStems = [];
@@ -712,7 +765,8 @@ function startExtraction() {
         model_name: modelName,
         selected_stems: selectedStems,
         two_stem_mode: twoStemMode,
-        primary_stem: primaryStem
+        primary_stem: primaryStem,
+        output_format: outputFormat
     };
     
     // Add to queue
@@ -988,6 +1042,9 @@ function createExtractionElement(item) {
         <div class="item-details">
             <div>Model: ${item.model_name}</div>
             <div>File: ${getFileNameFromPath(item.audio_path)}</div>
+            ${item.status === 'queued' && item.estimated_start_seconds != null ? `
+                <div>Début estimé dans ${formatEta(item.estimated_start_seconds)}, durée ${formatEta(item.predicted_seconds)}</div>
+            ` : ''}
         </div>
         <div class="progress-container">
             <div class="progress-bar">
@@ -1006,13 +1063,16 @@ function createExtractionElement(item) {
                     <button class="item-button open-folder-button" data-file-path="${Object.values(item.output_paths || {})[0] || ''}">
                         <i class="fas fa-download"></i> Get Tracks
                     </button>
-                    ${item.zip_path ? `
-                    <button class="item-button download-zip-button" data-file-path="${item.zip_path}">
+                    <button class="item-button download-zip-button" data-extraction-id="${item.extraction_id}">
                         <i class="fas fa-file-archive"></i> Download All (ZIP)
                     </button>
-                    ` : ''}
                 </div>
             ` : ''}
+            ${item.status === 'extracting' && item.available_seconds > 0 ? `
+                <button class="item-button preview-mixer-button" data-extraction-id="${item.extraction_id}">
+                    <i class="fas fa-headphones"></i> Écouter pendant l'extraction
+                </button>
+            ` : ''}
             ${item.status === 'extracting' || item.status === 'queued' ? `
                 <button class="item-button cancel cancel-extraction-button" data-extraction-id="${item.extraction_id}">
                     <i class="fas fa-times"></i> Cancel
@@ -1058,6 +1118,13 @@ function createExtractionElement(item) {
             });
         }
         
+        const previewMixerButton = extractionElement.querySelector('.preview-mixer-button');
+        if (previewMixerButton) {
+            previewMixerButton.addEventListener('click', () => {
+                openMixer(previewMixerButton.dataset.extractionId);
+            });
+        }
+        
         const openFolderButton = extractionElement.querySelector('.open-folder-button');
         if (openFolderButton) {
             openFolderButton.addEventListener('click', () => {
@@ -1109,8 +1176,8 @@ function createExtractionElement(item) {
         const downloadZipButton = extractionElement.querySelector('.download-zip-button');
         if (downloadZipButton) {
             downloadZipButton.addEventListener('click', () => {
-                const filePath = downloadZipButton.dataset.filePath;
-                window.location.href = `/api/download-file?file_path=${encodeURIComponent(filePath)}`;
+                // Archive construite à la volée par le serveur
+                window.location.href = `/api/extractions/${encodeURIComponent(downloadZipButton.dataset.extractionId)}/zip`;
             });
         }
         
@@ -1318,7 +1385,16 @@ function updateExtractionProgress(data) {
     const statusElement = extractionElement.querySelector('.item-status');
     
     progressFill.style.width = `${data.progress}%`;
-    progressPercentage.textContent = `${data.progress}% - ${data.status_message}`;
+    
+    // Pendant la séparation, indiquer le segment en cours
+    let statusMessage = data.status_message;
+    if (data.phase === 'separating' && data.segments) {
+        statusMessage += ` (segment ${data.segment}/${data.segments})`;
+    }
+    if (data.remaining_seconds != null && data.progress < 100) {
+        statusMessage += ` - reste ${formatEta(data.remaining_seconds)}`;
+    }
+    progressPercentage.textContent = `${Math.round(data.progress)}% - ${statusMessage}`;
     
     if (statusElement.textContent !== 'Extracting') {
         statusElement.textContent = 'Extracting';
@@ -1326,6 +1402,48 @@ function updateExtractionProgress(data) {
     }
 }
 
+function updateExtractionPartial(data) {
+    const extractionElement = document.getElementById(`extraction-${data.extraction_id}`);
+    if (!extractionElement) return;
+    
+    // Les premières secondes des stems sont prêtes : proposer l'écoute dans le mixeur
+    if (extractionElement.querySelector('.preview-mixer-button')) return;
+    
+    const actionsContainer = extractionElement.querySelector('.item-actions');
+    const previewButton = document.createElement('button');
+    previewButton.className = 'item-button preview-mixer-button';
+    previewButton.dataset.extractionId = data.extraction_id;
+    previewButton.innerHTML = `<i class="fas fa-headphones"></i> Écouter pendant l'extraction`;
+    previewButton.addEventListener('click', () => {
+        openMixer(data.extraction_id);
+    });
+    actionsContainer.prepend(previewButton);
+}
+
+function openMixer(extractionId) {
+    // Switch to the Mixer tab
+    document.querySelectorAll('.tab-button').forEach(btn => {
+        btn.classList.remove('active');
+    });
+    document.querySelectorAll('.tab-content').forEach(tab => {
+        tab.classList.remove('active');
+    });
+    
+    // Activate the mixer tab
+    const mixerTabButton = document.querySelector('.tab-button[data-tab="mixer"]');
+    const mixerTab = document.getElementById('mixerTab');
+    mixerTabButton.classList.add('active');
+    mixerTab.classList.add('active');
+    
+    // Show loading indicator and update iframe source
+    const loadingDiv = document.getElementById('loading');
+    const mixerFrame = document.getElementById('mixerFrame');
+    
+    loadingDiv.style.display = 'block';
+    mixerFrame.style.display = 'none';
+    mixerFrame.src = `/mixer?extraction_id=${encodeURIComponent(extractionId)}`;
+}
+
 function updateExtractionComplete(data) {
     const extractionElement = document.getElementById(`extraction-${data.extraction_id}`);
     if (!extractionElement) return;
@@ -1349,11 +1467,9 @@ function updateExtractionComplete(data) {
             <button class="item-button open-folder-button" data-file-path="${Object.values(data.output_paths || {})[0] || ''}">
                 <i class="fas fa-download"></i> Get Tracks
             </button>
-            ${data.zip_path ? `
-            <button class="item-button download-zip-button" data-file-path="${data.zip_path}">
+            <button class="item-button download-zip-button" data-extraction-id="${data.extraction_id}">
                 <i class="fas fa-file-archive"></i> Download All (ZIP)
             </button>
-            ` : ''}
         </div>
     `;
     
@@ -1438,8 +1554,8 @@ function updateExtractionComplete(data) {
     const downloadZipButton = actionsContainer.querySelector('.download-zip-button');
     if (downloadZipButton) {
         downloadZipButton.addEventListener('click', () => {
-            const filePath = downloadZipButton.dataset.filePath;
-            window.location.href = `/api/download-file?file_path=${encodeURIComponent(filePath)}`;
+            // Archive construite à la volée par le serveur
+            window.location.href = `/api/extractions/${encodeURIComponent(downloadZipButton.dataset.extractionId)}/zip`;
         });
     }
 }
@@ -1619,7 +1735,8 @@ function retryExtraction(extractionId) {
                 model_name: data.model_name,
                 selected_stems: data.selected_stems || ['vocals', 'drums', 'bass', 'other'],
                 two_stem_mode: data.two_stem_mode || false,
-                primary_stem: data.primary_stem || 'vocals'
+                primary_stem: data.primary_stem || 'vocals',
+                output_format: data.output_format || 'mp3'
             };
             
             // Add to queue
@@ -103,6 +103,20 @@ class AudioEngine {
         }
     }
     
+    /**
+     * Télécharger et décoder un fichier audio sans toucher aux pistes
+     * @param {string} url - URL du fichier audio
+     * @returns {AudioBuffer|null} Buffer décodé, ou null si le fichier n'existe pas
+     */
+    async fetchStemBuffer(url) {
+        const response = await fetch(url);
+        if (!response.ok) {
+            return null;
+        }
+        const arrayBuffer = await response.arrayBuffer();
+        return await this.audioContext.decodeAudioData(arrayBuffer);
+    }
+    
     /**
      * Extraire les données de forme d'onde d'un stem
      * @param {string} name - Nom du stem
@@ -268,8 +268,15 @@ class StemMixer {
      */
     async loadStems() {
         try {
+            // Pendant l'extraction, charger la partie des stems déjà séparée
+            const status = await this.fetchExtractionStatus();
+            if (status && status.status === 'extracting' && status.available_seconds > 0) {
+                await this.loadPartialStems(status);
+                return;
+            }
+            
             // Les noms des stems standard que nous allons essayer de charger
-            const standardStems = ['vocals', 'drums', 'bass', 'guitar', 'piano', 'other'];
+            const standardStems = ['vocals', 'drums', 'bass', 'guitar', 'piano', 'other', 'instrumental'];
             this.log('Chargement des stems standards...');
             
             // Créer les URL pour chaque stem
@@ -295,6 +302,105 @@ class StemMixer {
         }
     }
     
+    /**
+     * Récupérer l'état de l'extraction depuis le serveur
+     * @returns {Object|null} État de l'extraction, ou null s'il est indisponible
+     */
+    async fetchExtractionStatus() {
+        try {
+            const response = await fetch(`/api/extractions/${this.encodedExtractionId}`);
+            return response.ok ? await response.json() : null;
+        } catch (error) {
+            this.log(`Impossible de récupérer l'état de l'extraction: ${error.message}`);
+            return null;
+        }
+    }
+    
+    /**
+     * URL de la partie déjà séparée d'un stem
+     * @param {string} name - Nom du stem
+     */
+    partialStemUrl(name) {
+        return `/api/extractions/${this.encodedExtractionId}/partial/${name}?t=${Date.now()}`;
+    }
+    
+    /**
+     * Charger les stems d'une extraction encore en cours
+     * @param {Object} status - État de l'extraction
+     */
+    async loadPartialStems(status) {
+        this.log(`Extraction en cours, ${status.available_seconds.toFixed(1)}s disponibles`);
+        this.loadedSeconds = status.available_seconds;
+        
+        const loadPromises = status.partial_stems.map(name => this.audioEngine.loadStem(name, this.partialStemUrl(name)));
+        await Promise.all(loadPromises);
+        
+        this.updateMaxDuration();
+        this.waveform.updateAllWaveforms();
+        this.showToast(`Extraction en cours : ${Math.floor(status.available_seconds)} s disponibles`, 'info');
+        
+        // Recharger les stems à mesure que l'extraction avance
+        this.partialTimer = setInterval(() => this.checkPartialProgress(), 5000);
+    }
+    
+    /**
+     * Vérifier l'avancement d'une extraction en cours et recharger les stems
+     */
+    async checkPartialProgress() {
+        const status = await this.fetchExtractionStatus();
+        if (!status || this.isRefreshingStems) return;
+        
+        if (status.status === 'completed') {
+            clearInterval(this.partialTimer);
+            await this.refreshStems(name => `/api/extracted_stems/${this.encodedExtractionId}/${name}.mp3`);
+            this.showToast('Extraction terminée : stems complets chargés', 'success');
+        } else if (status.status !== 'extracting') {
+            clearInterval(this.partialTimer);
+            this.showToast(`Extraction interrompue: ${status.error_message || status.status}`, 'error');
+        } else if (status.available_seconds - this.loadedSeconds >= 30) {
+            this.loadedSeconds = status.available_seconds;
+            await this.refreshStems(name => this.partialStemUrl(name));
+        }
+    }
+    
+    /**
+     * Remplacer l'audio des stems chargés sans perdre la position de lecture
+     * @param {Function} urlForStem - Fonction donnant l'URL d'un stem
+     */
+    async refreshStems(urlForStem) {
+        // Le moteur mobile lit les fichiers en streaming et n'a pas de buffers à remplacer
+        if (typeof this.audioEngine.fetchStemBuffer !== 'function') return;
+        
+        this.isRefreshingStems = true;
+        try {
+            // Décoder d'abord, pour ne couper la lecture que le temps de l'échange
+            const names = Object.keys(this.stems);
+            const buffers = await Promise.all(names.map(name => this.audioEngine.fetchStemBuffer(urlForStem(name))));
+            
+            const wasPlaying = this.isPlaying;
+            if (wasPlaying) {
+                this.audioEngine.pause();
+            }
+            names.forEach((name, i) => {
+                if (buffers[i]) {
+                    this.stems[name].buffer = buffers[i];
+                }
+            });
+            if (wasPlaying) {
+                this.audioEngine.play();
+            }
+            
+            await Promise.all(names.map(name => this.audioEngine.extractWaveformData(name)));
+            this.updateMaxDuration();
+            this.timeline.createTimeMarkers();
+            this.waveform.updateAllWaveforms();
+        } catch (error) {
+            this.log(`Erreur lors du rechargement des stems: ${error.message}`);
+        } finally {
+            this.isRefreshingStems = false;
+        }
+    }
+    
     /**
      * Mettre à jour la durée maximale des stems
      */